@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the approximate analyzers of models/analyzers.py against exact ones.
+
+Vocabulary: the heavy-hitter sketch over `--rows` Zipf-distributed terms
+(`--distinct` of them, batches of 1000 merged as Beam would) against an exact
+count, reporting the recall of the exact top-k and the throughput per number
+of counters. Quantiles: `tft.quantiles` of the taxi pickup_latitude column
+(tfx_template/data/data.csv) analyzed with tf.Transform for each `epsilon`,
+reporting the worst rank error of the boundaries and the analysis time.
+
+    python benchmarks/bench_approximate_analyzers.py --rows 1000000 --top-k 1000
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import collections
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Terms of the vocabulary benchmark")
+parser.add_argument("--distinct", type=int, default=100000, help="Distinct terms")
+parser.add_argument("--top-k", type=int, default=1000, help="Vocabulary size")
+parser.add_argument("--buckets", type=int, default=10, help="Quantile buckets")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+BATCH_SIZE = 1000
+
+
+def bench_vocabulary(args):
+    from models import analyzers
+
+    rng = np.random.default_rng(0)
+    ids = np.minimum(rng.zipf(1.2, args.rows), args.distinct)
+    terms = [b"term%d" % i for i in ids]
+    batches = [terms[i : i + BATCH_SIZE] for i in range(0, len(terms), BATCH_SIZE)]
+
+    start = time.perf_counter()
+    exact = [term for term, _ in collections.Counter(terms).most_common(args.top_k)]
+    exact_seconds = time.perf_counter() - start
+    print(f"vocabulary: {args.rows} terms, {len(set(terms))} distinct, top {args.top_k}")
+    print(f"{'counters':>10} {'recall':>8} {'Mterms/s':>9}")
+    print(f"{'exact':>10} {1:>8.3f} {args.rows / exact_seconds / 1e6:>9.2f}")
+    for factor in (1, 2, 4, 8):
+        sketch = analyzers.HeavyHitters(factor * args.top_k)
+        start = time.perf_counter()
+        accumulators = [sketch.add_input(sketch.create_accumulator(), batch) for batch in batches]
+        merged = sketch.merge_accumulators(accumulators)
+        vocabulary = [term for term, _ in sketch.extract_output(merged)[: args.top_k]]
+        seconds = time.perf_counter() - start
+        recall = len(set(vocabulary) & set(exact)) / len(exact)
+        print(f"{factor * args.top_k:>10} {recall:>8.3f} {args.rows / seconds / 1e6:>9.2f}")
+
+
+def bench_quantiles(args):
+    import tensorflow as tf
+    import tensorflow_transform as tft
+    import tensorflow_transform.beam as tft_beam
+    from tensorflow_transform.tf_metadata import dataset_metadata, schema_utils
+
+    with open(DATA_FILE, "r", newline="") as fid:
+        values = np.array(
+            [float(row["pickup_latitude"]) for row in csv.DictReader(fid) if row["pickup_latitude"]],
+            np.float32,
+        )
+    metadata = dataset_metadata.DatasetMetadata(
+        schema_utils.schema_from_feature_spec({"x": tf.io.FixedLenFeature([], tf.float32)})
+    )
+    data = [{"x": value} for value in values]
+    ranks = np.sort(values)
+    print(f"quantiles: {len(values)} pickup_latitude values, {args.buckets} buckets")
+    print(f"{'epsilon':>10} {'max rank error':>15} {'seconds':>8}")
+    for epsilon in (0.1, 0.01, 0.001):  # tft.bucketize defaults to min(1 / buckets, 0.01)
+
+        def preprocessing_fn(inputs, epsilon=epsilon):
+            boundaries = tft.quantiles(inputs["x"], args.buckets, epsilon)
+            batch_size = tf.shape(inputs["x"])[0]
+            return {"boundaries": tf.broadcast_to(boundaries, [batch_size, args.buckets - 1])}
+
+        start = time.perf_counter()
+        with tft_beam.Context(temp_dir=tempfile.mkdtemp()):
+            (transformed, _), _ = (data, metadata) | tft_beam.AnalyzeAndTransformDataset(preprocessing_fn)
+        seconds = time.perf_counter() - start
+        boundaries = np.asarray(transformed[0]["boundaries"])
+        expected = np.arange(1, args.buckets) / args.buckets
+        error = np.abs(np.searchsorted(ranks, boundaries) / len(ranks) - expected).max()
+        print(f"{epsilon:>10} {error:>15.4f} {seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    bench_vocabulary(args)
+    bench_quantiles(args)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark ExampleGen on CSV, Parquet and Arrow IPC copies of the same data.
+
+tfx_template/data/data.csv is repeated to the requested size and converted
+to Parquet and Arrow IPC once. Each input is then turned into train / eval
+TFRecords by its executor (columnar_csv for CSV, arrow_input for the others),
+each in a fresh process so that its peak RSS, shard workers included, is its
+own.
+
+    python benchmarks/bench_arrow_input.py --rows 1000000 --shards 8
+"""
+
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+from utils import parallelism  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Rows of the benchmark data")
+parser.add_argument("--shards", type=int, default=None,
+                    help="Shards written in parallel (default: available CPUs)")
+parser.add_argument("--batch-rows", type=int, default=128 * 1024,
+                    help="Rows per Parquet row group / Arrow record batch")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+
+
+def make_csv(path, rows):
+    """data.csv repeated until it has `rows` rows."""
+    with open(DATA_FILE, "r") as fid:
+        header, *lines = fid.read().splitlines()
+    with open(path, "w") as fid:
+        fid.write(header + "\n")
+        for i in range(rows):
+            fid.write(lines[i % len(lines)] + "\n")
+
+
+def convert(data_format, path, output_dir, shards, queue):
+    """Runs in a fresh process: convert `path`, report seconds and peak RSS."""
+    from executors import arrow_input
+    from executors import columnar_csv
+
+    output_dirs = {
+        "train": os.path.join(output_dir, "train"),
+        "eval": os.path.join(output_dir, "eval"),
+    }
+    start = time.perf_counter()
+    if data_format == "csv":
+        counts = columnar_csv.convert_split([path], output_dirs, [2, 3], shards)
+    else:
+        counts = arrow_input.convert_split([path], output_dirs, data_format, [2, 3], shards)
+    seconds = time.perf_counter() - start
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    queue.put((seconds, sum(counts.values()), peak_kb / 1024))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    shards = args.shards or parallelism.available_cpus()
+
+    from executors import arrow_input
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as work_dir:
+        inputs = {"csv": os.path.join(work_dir, "data.csv")}
+        make_csv(inputs["csv"], args.rows)
+        for data_format in arrow_input.FORMATS:
+            [inputs[data_format]] = arrow_input.convert_csv(
+                [inputs["csv"]], os.path.join(work_dir, data_format), data_format, args.batch_rows
+            )
+        print(f"{args.rows} rows, {shards} shards, projected columns: "
+              f"{', '.join(arrow_input.projected_columns())}")
+        print(f"{'input':>8} {'file MB':>8} {'seconds':>9} {'rows/s':>10} {'peak MB':>8}")
+        for data_format, path in inputs.items():
+            queue = context.Queue()
+            process = context.Process(
+                target=convert,
+                args=(data_format, path, os.path.join(work_dir, "out", data_format), shards, queue),
+            )
+            process.start()
+            seconds, rows, peak_mb = queue.get()
+            process.join()
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            print(f"{data_format:>8} {size_mb:>8.0f} {seconds:>9.2f} {rows / seconds:>10.0f} {peak_mb:>8.0f}")
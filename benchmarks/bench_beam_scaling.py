@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark DirectRunner throughput of the statistics step against worker count.
+
+Runs TFDV statistics generation (the work of StatisticsGen) over a synthetic
+taxi-like CSV with the DirectRunner arguments that kubeflow_runner derives
+from `performance_configurations`, for 1 to N workers.
+
+    python benchmarks/bench_beam_scaling.py --rows 200000 --workers 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+from utils import beam_utils, parallelism  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=200000, help="Rows of the synthetic CSV")
+parser.add_argument("--shards", type=int, default=16, help="Number of CSV files")
+parser.add_argument("--workers", type=int, nargs="+", default=None,
+                    help="Worker counts to time (default: powers of 2 up to the CPU count)")
+parser.add_argument("--mode", default="multi_processing", choices=beam_utils.RUNNING_MODES[1:])
+parser.add_argument("--seed", type=int, default=0)
+
+COLUMNS = ["trip_miles", "fare", "trip_seconds", "pickup_community_area", "payment_type", "tips"]
+
+
+def make_csv(data_dir, rows, shards, seed=0):
+    """Sharded CSV with numeric and categorical columns."""
+    rng = random.Random(seed)
+    for shard in range(shards):
+        with open(os.path.join(data_dir, f"data-{shard:05d}.csv"), "w") as fid:
+            fid.write(",".join(COLUMNS) + "\n")
+            for _ in range(rows // shards):
+                fid.write(
+                    f"{rng.expovariate(0.3):.2f},{rng.uniform(3, 80):.2f},"
+                    f"{rng.randint(60, 7200)},{rng.randint(1, 77)},"
+                    f"{rng.choice(['Cash', 'Credit Card', 'No Charge'])},"
+                    f"{rng.uniform(0, 10):.2f}\n"
+                )
+
+
+def run_statistics(data_dir, output_path, beam_args):
+    import tensorflow_data_validation as tfdv
+    from apache_beam.options.pipeline_options import PipelineOptions
+
+    options = PipelineOptions([f"--{key}={val}" for key, val in beam_args.items()])
+    start = time.perf_counter()
+    tfdv.generate_statistics_from_csv(
+        data_location=os.path.join(data_dir, "*.csv"),
+        output_path=output_path,
+        pipeline_options=options,
+    )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    cpus = parallelism.available_cpus()
+    workers = args.workers or sorted({2 ** i for i in range(cpus.bit_length())} | {cpus})
+    with tempfile.TemporaryDirectory() as data_dir:
+        make_csv(data_dir, args.rows, args.shards, args.seed)
+        print(f"{'workers':>8} {'seconds':>9} {'rows/s':>10} {'speedup':>8}")
+        baseline = None
+        for num_workers in workers:
+            beam_args = beam_utils.direct_runner_args(
+                {"BEAM_DIRECT_RUNNING_MODE": args.mode, "BEAM_DIRECT_NUM_WORKERS": num_workers}
+            )
+            seconds = run_statistics(
+                data_dir, os.path.join(data_dir, f"stats-{num_workers}.tfrecord"), beam_args
+            )
+            baseline = baseline or seconds
+            print(
+                f"{num_workers:>8} {seconds:>9.2f} {args.rows / seconds:>10.0f} "
+                f"{baseline / seconds:>7.1f}x"
+            )
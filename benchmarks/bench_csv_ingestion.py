@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the columnar CSV ExampleGen executor against the stock CsvExampleGen.
+
+Both executors convert the same taxi CSV (tfx_template/data/data.csv repeated
+to the requested size) into train / eval TFRecords with the default 2:1 hash
+split, the stock one on a multi-processing DirectRunner with as many workers
+as the columnar executor has shards.
+
+    python benchmarks/bench_csv_ingestion.py --rows 1000000 --shards 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+from utils import parallelism  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Rows of the benchmark CSV")
+parser.add_argument("--shards", type=int, default=None,
+                    help="Shards / Beam workers (default: available CPUs)")
+parser.add_argument("--skip-stock", action="store_true", help="Only time the columnar executor")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+
+
+def make_csv(path, rows):
+    """data.csv repeated until it has `rows` rows."""
+    with open(DATA_FILE, "r") as fid:
+        header, *lines = fid.read().splitlines()
+    with open(path, "w") as fid:
+        fid.write(header + "\n")
+        for i in range(rows):
+            fid.write(lines[i % len(lines)] + "\n")
+
+
+def run(executor, input_base, output_dir, exec_properties=None):
+    from google.protobuf import json_format
+    from tfx.components.example_gen import utils as example_gen_utils
+    from tfx.proto import example_gen_pb2
+    from tfx.types import standard_artifacts
+
+    examples = standard_artifacts.Examples()
+    examples.uri = output_dir
+    input_config = example_gen_utils.make_default_input_config()
+    output_config = example_gen_utils.make_default_output_config(input_config)
+    properties = {
+        "input_base": input_base,
+        "input_config": json_format.MessageToJson(input_config),
+        "output_config": json_format.MessageToJson(output_config),
+        "output_data_format": example_gen_pb2.FORMAT_TF_EXAMPLE,
+    }
+    properties.update(exec_properties or {})
+    start = time.perf_counter()
+    executor.Do({}, {"examples": [examples]}, properties)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    shards = args.shards or parallelism.available_cpus()
+
+    from google.protobuf import json_format
+    from tfx.components.example_gen.csv_example_gen import executor as csv_executor
+    from tfx.dsl.components.base import base_executor
+    from executors import columnar_csv
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_base = os.path.join(work_dir, "input")
+        os.makedirs(input_base)
+        make_csv(os.path.join(input_base, "data.csv"), args.rows)
+        size_mb = os.path.getsize(os.path.join(input_base, "data.csv")) / 1024 ** 2
+        print(f"{args.rows} rows, {size_mb:.0f} MB, {shards} shards / workers")
+        print(f"{'executor':>10} {'seconds':>9} {'rows/s':>10} {'speedup':>8}")
+
+        baseline = None
+        if not args.skip_stock:
+            context = base_executor.BaseExecutor.Context(
+                beam_pipeline_args=[
+                    "--direct_running_mode=multi_processing",
+                    f"--direct_num_workers={shards}",
+                ],
+                tmp_dir=os.path.join(work_dir, "tmp"),
+            )
+            baseline = run(
+                csv_executor.Executor(context), input_base, os.path.join(work_dir, "stock")
+            )
+            print(f"{'stock':>10} {baseline:>9.2f} {args.rows / baseline:>10.0f} {1.0:>7.1f}x")
+
+        seconds = run(
+            columnar_csv.Executor(),
+            input_base,
+            os.path.join(work_dir, "columnar"),
+            {"custom_config": json_format.MessageToJson(columnar_csv.ingestion_config(shards))},
+        )
+        speedup = f"{baseline / seconds:>7.1f}x" if baseline else f"{'-':>8}"
+        print(f"{'columnar':>10} {seconds:>9.2f} {args.rows / seconds:>10.0f} {speedup}")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the fused missing-value fill against the per-feature fill.
+
+Both fill stages of models/preprocessing.py are traced as tf.functions over
+the full feature set commented out in features.py (3 dense, 4 bucketized,
+3 categorical and 2 vocabulary features). The benchmark reports the number
+of ops each adds to the transform / serving graph, and its latency per batch
+with `--missing` of the values missing.
+
+    python benchmarks/bench_fill_in_missing.py --batch-size 1024
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--batch-size", type=int, default=1024, help="Examples per batch")
+parser.add_argument("--missing", type=float, default=0.1, help="Fraction of missing values")
+parser.add_argument("--runs", type=int, default=200, help="Timed batches")
+
+# The full feature set of features.py
+FEATURES = {
+    "trip_miles": "float32", "fare": "float32", "trip_seconds": "float32",
+    "pickup_latitude": "float32", "pickup_longitude": "float32",
+    "dropoff_latitude": "float32", "dropoff_longitude": "float32",
+    "trip_start_hour": "int64", "trip_start_day": "int64", "trip_start_month": "int64",
+    "payment_type": "string", "company": "string",
+}
+
+
+def make_batch(tf, batch_size, missing, rng):
+    """Sparse [batch_size, 1] features with `missing` of the values missing."""
+    batch = {}
+    for key, dtype in FEATURES.items():
+        rows = np.flatnonzero(rng.random(batch_size) >= missing)
+        if dtype == "string":
+            values = tf.constant([f"v{i % 7}".encode() for i in rows], tf.string)
+        else:
+            values = tf.constant(rng.integers(0, 100, len(rows)), getattr(tf, dtype))
+        indices = np.stack([rows, np.zeros_like(rows)], axis=1).astype(np.int64)
+        batch[key] = tf.SparseTensor(indices, values, [batch_size, 1])
+    return batch
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from models import preprocessing
+
+    def per_feature(inputs):
+        return {key: preprocessing._fill_in_missing(inputs[key]) for key in FEATURES}  # pylint: disable=protected-access
+
+    def fused(inputs):
+        return preprocessing._fill_in_missing_fused(inputs, list(FEATURES))  # pylint: disable=protected-access
+
+    signature = {
+        key: tf.SparseTensorSpec([None, 1], getattr(tf, dtype)) for key, dtype in FEATURES.items()
+    }
+    batch = make_batch(tf, args.batch_size, args.missing, np.random.default_rng(0))
+    print(f"{len(FEATURES)} features, batch of {args.batch_size}, {args.missing:.0%} missing")
+    print(f"{'fill':>12} {'graph ops':>10} {'us/batch':>10}")
+    for name, fill in [("per-feature", per_feature), ("fused", fused)]:
+        concrete = tf.function(fill).get_concrete_function(signature)
+        num_ops = len(concrete.graph.as_graph_def().node)
+        for _ in range(10):  # warm up
+            concrete(batch)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            concrete(batch)
+        latency = (time.perf_counter() - start) / args.runs * 1e6
+        print(f"{name:>12} {num_ops:>10} {latency:>10.0f}")
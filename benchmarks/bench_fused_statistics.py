@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark fused ingestion + statistics against ExampleGen then StatisticsGen.
+
+The two-stage path converts the taxi CSV (tfx_template/data/data.csv repeated
+to the requested size) with the columnar executor, then computes the
+statistics of each split from the written TFRecords with TFDV on a
+multi-processing DirectRunner, as StatisticsGen does. The fused path
+computes them in the shard processes while it writes the same TFRecords.
+
+    python benchmarks/bench_fused_statistics.py --rows 1000000 --shards 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+from utils import parallelism  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Rows of the benchmark CSV")
+parser.add_argument("--shards", type=int, default=None,
+                    help="Shards / Beam workers (default: available CPUs)")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+
+
+def make_csv(path, rows):
+    """data.csv repeated until it has `rows` rows."""
+    with open(DATA_FILE, "r") as fid:
+        header, *lines = fid.read().splitlines()
+    with open(path, "w") as fid:
+        fid.write(header + "\n")
+        for i in range(rows):
+            fid.write(lines[i % len(lines)] + "\n")
+
+
+def output_dirs(root):
+    return {"train": os.path.join(root, "train"), "eval": os.path.join(root, "eval")}
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    shards = args.shards or parallelism.available_cpus()
+
+    import tensorflow_data_validation as tfdv
+    from apache_beam.options.pipeline_options import PipelineOptions
+    from executors import columnar_csv
+    from executors import fused_stats
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "data.csv")
+        make_csv(path, args.rows)
+        print(f"{args.rows} rows, {shards} shards / workers")
+        print(f"{'path':>10} {'ingest s':>9} {'stats s':>8} {'total s':>8} {'speedup':>8}")
+
+        start = time.perf_counter()
+        outputs = output_dirs(os.path.join(work_dir, "two_stage"))
+        columnar_csv.convert_split([path], outputs, buckets=[2, 3], num_shards=shards)
+        ingest = time.perf_counter() - start
+        beam_options = PipelineOptions(
+            ["--direct_running_mode=multi_processing", f"--direct_num_workers={shards}"]
+        )
+        for output_dir in outputs.values():
+            tfdv.generate_statistics_from_tfrecord(
+                os.path.join(output_dir, "*"), pipeline_options=beam_options
+            )
+        baseline = time.perf_counter() - start
+        print(f"{'two-stage':>10} {ingest:>9.2f} {baseline - ingest:>8.2f} {baseline:>8.2f} {1.0:>7.1f}x")
+
+        start = time.perf_counter()
+        blocks, read = columnar_csv.plan_split([path])
+        columnar_csv.combine_shards(
+            blocks,
+            read,
+            output_dirs(os.path.join(work_dir, "fused")),
+            fused_stats.StatisticsCombineFn(),
+            buckets=[2, 3],
+            num_shards=shards,
+        )
+        seconds = time.perf_counter() - start
+        print(f"{'fused':>10} {'-':>9} {'-':>8} {seconds:>8.2f} {baseline / seconds:>7.1f}x")
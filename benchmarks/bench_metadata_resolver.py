@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the metadata.yaml template resolver on large synthetic metadata.
+
+Compares `recipe_utils.parse_templated_fields` against the previous
+render-until-stable implementation and checks that both agree.
+
+    python benchmarks/bench_metadata_resolver.py --fields 100 500 2000
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+
+import jinja2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_utils import get_config, parse_templated_fields  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--fields", type=int, nargs="+", default=[100, 500, 2000],
+                    help="Number of fields per configuration section")
+parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions")
+parser.add_argument("--seed", type=int, default=0)
+
+
+def legacy_parse_templated_fields(metadata):
+    """The resolver before dependency sorting, kept as the baseline."""
+    parse_dict = {}
+    for field in metadata:
+        if "configurations" not in field:
+            parse_dict.update({field: metadata[field]})
+        else:
+            parse_dict.update(get_config(metadata, field))
+
+    def _recursive_render(s, cur_key):
+        if s is None:
+            return s
+        counter = 0
+        while "{{ " in s and " }}" in s:
+            s = jinja2.Template(s).render(**parse_dict)
+            counter += 1
+            if counter > 100:
+                raise(ValueError(f"Cannot parse templated field {cur_key}"))
+        return s
+
+    for config_sec, configs in metadata.items():
+        if "configurations" not in config_sec:
+            continue
+        for cur_key, cur_val in configs.items():
+            if cur_val["type"] in ["string", "str"]:
+                cur_val["value"] = _recursive_render(cur_val["value"], cur_key)
+            elif cur_val["type"] == "array":
+                for index, s in enumerate(cur_val["value"]):
+                    cur_val["value"][index] = _recursive_render(s, cur_key)
+            elif cur_val["type"] == "object":
+                object_str = json.dumps(cur_val["value"]).replace("\\", "")
+                object_str = _recursive_render(object_str, cur_key)
+                cur_val["value"] = json.loads(object_str)
+            metadata[config_sec][cur_key]["value"] = cur_val["value"]
+    return metadata
+
+
+def make_metadata(num_fields, seed=0):
+    """Synthetic metadata with chains of references between both sections."""
+    rng = random.Random(seed)
+    metadata = {"pipeline_name": "bench", "pipeline_version": "0_0_0"}
+    names = []
+    for section in ["system_configurations", "model_configurations"]:
+        configs = {}
+        for i in range(num_fields):
+            name = f"{section[0].upper()}_FIELD_{i}"
+            refs = rng.sample(names, min(len(names), rng.randint(0, 3)))
+            refs = refs or ["pipeline_name"]
+            text = "/".join("{{ %s }}" % ref for ref in refs)
+            kind = rng.choice(["string", "string", "array", "object", "int"])
+            if kind == "string":
+                value = text
+            elif kind == "array":
+                value = [text, "{{ pipeline_version }}", "literal"]
+            elif kind == "object":
+                value = {"path": text, "nested": {"version": "{{ pipeline_version }}"}, "size": i}
+            else:
+                value = i
+            configs[name] = {"description": "synthetic", "type": kind, "value": value}
+            if kind in ["string", "int"]:  # only scalar fields are referenced
+                names.append(name)
+        metadata[section] = configs
+    return metadata
+
+
+def _time(fn, metadata, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        data = copy.deepcopy(metadata)
+        start = time.perf_counter()
+        result = fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(f"{'fields':>8} {'legacy (s)':>12} {'resolver (s)':>13} {'speedup':>8}")
+    for num_fields in args.fields:
+        metadata = make_metadata(num_fields, args.seed)
+        legacy_time, expected = _time(legacy_parse_templated_fields, metadata, args.repeat)
+        new_time, actual = _time(parse_templated_fields, metadata, args.repeat)
+        assert actual == expected, "resolver output differs from the legacy resolver"
+        print(f"{2 * num_fields:>8} {legacy_time:>12.4f} {new_time:>13.4f} {legacy_time / new_time:>7.1f}x")
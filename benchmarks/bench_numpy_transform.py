@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the NumPy replay of the transform against the TF transform graph.
+
+A transform graph of models/preprocessing.py is fitted on the taxi CSV
+(tfx_template/data/data.csv) with the full feature set commented out in
+features.py, then columnar batches of `--batch-size` rows are transformed by
+`transform_features_layer()` (from already built tensors, as in batch
+scoring) and by the compiled `NumpyTransform` (from NumPy columns).
+
+    python benchmarks/bench_numpy_transform.py --batch-size 10000
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--batch-size", type=int, default=10000, help="Rows per batch")
+parser.add_argument("--runs", type=int, default=20, help="Timed batches")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+# The full feature set of features.py
+FEATURES = {
+    "DENSE_FLOAT_FEATURE_KEYS": ["trip_miles", "fare", "trip_seconds"],
+    "BUCKET_FEATURE_KEYS": ["pickup_latitude", "pickup_longitude", "dropoff_latitude", "dropoff_longitude"],
+    "BUCKET_FEATURE_BUCKET_COUNT": [10, 10, 10, 10],
+    "CATEGORICAL_FEATURE_KEYS": ["trip_start_hour", "trip_start_day", "trip_start_month"],
+    "CATEGORICAL_FEATURE_MAX_VALUES": [24, 31, 12],
+    "VOCAB_FEATURE_KEYS": ["payment_type", "company"],
+}
+
+
+def read_columns(tf, spec, batch_size):
+    """Columns of data.csv repeated to `batch_size` rows, None for missing values."""
+    with open(DATA_FILE, "r", newline="") as fid:
+        rows = list(csv.DictReader(fid))
+    rows = (rows * (batch_size // len(rows) + 1))[:batch_size]
+    columns = {}
+    for key, feature in spec.items():
+        parse = {tf.float32: float, tf.int64: int, tf.string: str}[feature.dtype]
+        columns[key] = np.array([parse(row[key]) if row[key] else None for row in rows], np.object_)
+    return columns
+
+
+def fit(tf, spec, columns, transform_dir):
+    import tensorflow_transform.beam as tft_beam
+    from tensorflow_transform.tf_metadata import dataset_metadata, schema_utils
+    from models import preprocessing
+
+    instances = [
+        {key: [] if columns[key][i] is None else [columns[key][i]] for key in spec}
+        for i in range(len(columns[next(iter(spec))]))
+    ]
+    metadata = dataset_metadata.DatasetMetadata(schema_utils.schema_from_feature_spec(spec))
+    with tft_beam.Context(temp_dir=tempfile.mkdtemp()):
+        transform_fn = (instances, metadata) | tft_beam.AnalyzeDataset(preprocessing.preprocessing_fn)
+        _ = transform_fn | tft_beam.WriteTransformFn(transform_dir)
+
+
+def sparse_inputs(tf, spec, columns):
+    inputs = {}
+    for key, values in columns.items():
+        present = [i for i, value in enumerate(values) if value is not None]
+        inputs[key] = tf.SparseTensor(
+            [[i, 0] for i in present] or tf.zeros([0, 2], tf.int64),
+            tf.constant([values[i] for i in present], spec[key].dtype),
+            [len(values), 1],
+        )
+    return inputs
+
+
+def timed(transform, inputs, runs):
+    transform(inputs)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        transform(inputs)
+    return (time.perf_counter() - start) / runs
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    import tensorflow_transform as tft
+    from models import features
+    from models import numpy_transform
+
+    for name, value in FEATURES.items():
+        setattr(features, name, value)
+    spec = {features.LABEL_KEY: tf.io.VarLenFeature(tf.int64)}
+    for key in FEATURES["DENSE_FLOAT_FEATURE_KEYS"] + FEATURES["BUCKET_FEATURE_KEYS"]:
+        spec[key] = tf.io.VarLenFeature(tf.float32)
+    for key in FEATURES["CATEGORICAL_FEATURE_KEYS"]:
+        spec[key] = tf.io.VarLenFeature(tf.int64)
+    for key in FEATURES["VOCAB_FEATURE_KEYS"]:
+        spec[key] = tf.io.VarLenFeature(tf.string)
+    columns = read_columns(tf, spec, args.batch_size)
+
+    transform_dir = tempfile.mkdtemp()
+    fit(tf, spec, columns, transform_dir)
+    layer = tft.TFTransformOutput(transform_dir).transform_features_layer()
+    start = time.perf_counter()
+    replay = numpy_transform.compile_transform(transform_dir)
+    compile_seconds = time.perf_counter() - start
+
+    # NumPy columns as a columnar reader (e.g. pandas) would hand them over
+    numpy_columns = {
+        key: np.asarray(values, np.float64) if spec[key].dtype != tf.string else values
+        for key, values in columns.items()
+    }
+    graph_seconds = timed(layer, sparse_inputs(tf, spec, columns), args.runs)
+    numpy_seconds = timed(replay, numpy_columns, args.runs)
+    print(f"compiled in {compile_seconds:.1f}s, batches of {args.batch_size} rows")
+    print(f"{'transform':>16} {'ms/batch':>9} {'Mrows/s':>8}")
+    for name, seconds in [("graph layer", graph_seconds), ("numpy replay", numpy_seconds)]:
+        print(f"{name:>16} {seconds * 1e3:>9.1f} {args.batch_size / seconds / 1e6:>8.2f}")
+    print(f"speedup: {graph_seconds / numpy_seconds:.1f}x")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark materialized Transform against transforming in the Trainer.
+
+Raw examples are written from the taxi CSV (tfx_template/data/data.csv
+repeated to the requested size) with the columnar executor, as ExampleGen
+would. Then, for each mode of the TRANSFORM_IN_TRAINER performance option:
+
+- materialized: Transform analyzes and transforms the raw examples, writing
+  the transformed copy, and the Trainer input pipeline reads that copy;
+- in trainer: Transform only analyzes, and the Trainer input pipeline reads
+  the raw examples and applies the transform graph on the fly.
+
+The Trainer side is the `_input_fn` of models/keras/model.py, iterated for
+`--epochs` epochs without a model. The benchmark reports the bytes read and
+written by the process and the wall time of both stages.
+
+    python benchmarks/bench_transform_materialization.py --rows 1000000 --epochs 2
+"""
+
+import os
+import sys
+import glob
+import time
+import types
+import argparse
+import tempfile
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template")
+)
+from utils import perf_trace  # noqa: E402
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=1000000, help="Rows of the raw examples")
+parser.add_argument("--epochs", type=int, default=2, help="Epochs read by the Trainer input")
+parser.add_argument("--batch-size", type=int, default=200, help="Trainer batch size")
+
+DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tfx_template", "data", "data.csv"
+)
+
+
+def make_csv(path, rows):
+    """data.csv repeated until it has `rows` rows."""
+    with open(DATA_FILE, "r") as fid:
+        header, *lines = fid.read().splitlines()
+    with open(path, "w") as fid:
+        fid.write(header + "\n")
+        for i in range(rows):
+            fid.write(lines[i % len(lines)] + "\n")
+
+
+def raw_schema(tf):
+    from tensorflow_transform.tf_metadata import schema_utils
+    from models import features
+
+    spec = {features.LABEL_KEY: tf.io.VarLenFeature(tf.int64)}
+    for key in features.DENSE_FLOAT_FEATURE_KEYS + features.BUCKET_FEATURE_KEYS:
+        spec[key] = tf.io.VarLenFeature(tf.float32)
+    for key in features.CATEGORICAL_FEATURE_KEYS:
+        spec[key] = tf.io.VarLenFeature(tf.int64)
+    for key in features.VOCAB_FEATURE_KEYS:
+        spec[key] = tf.io.VarLenFeature(tf.string)
+    return schema_utils.schema_from_feature_spec(spec)
+
+
+def run_transform(raw_pattern, schema, transform_dir, transformed_dir, materialize):
+    """The work of Transform, writing the transformed examples if `materialize`."""
+    import apache_beam as beam
+    import tensorflow_transform as tft
+    import tensorflow_transform.beam as tft_beam
+    from tfx_bsl.public import tfxio
+    from models import preprocessing
+
+    raw = tfxio.TFExampleRecord(raw_pattern, schema=schema)
+    with beam.Pipeline() as pipeline, tft_beam.Context(temp_dir=tempfile.mkdtemp()):
+        raw_data = pipeline | "Read" >> raw.BeamSource()
+        inputs = (raw_data, raw.TensorAdapterConfig())
+        if materialize:
+            (transformed, metadata), transform_fn = inputs | tft_beam.AnalyzeAndTransformDataset(
+                preprocessing.preprocessing_fn
+            )
+            coder = tft.coders.ExampleProtoCoder(metadata.schema)
+            _ = (
+                transformed
+                | "Encode" >> beam.Map(coder.encode)
+                | "Write" >> beam.io.WriteToTFRecord(
+                    os.path.join(transformed_dir, "transformed_examples"), file_name_suffix=".gz"
+                )
+            )
+        else:
+            transform_fn = inputs | tft_beam.AnalyzeDataset(preprocessing.preprocessing_fn)
+        _ = transform_fn | "WriteTransformFn" >> tft_beam.WriteTransformFn(transform_dir)
+
+
+def data_accessor():
+    """The `tf_dataset_factory` of the Trainer's DataAccessor, over TFRecord files."""
+    from tfx_bsl.public import tfxio
+
+    def tf_dataset_factory(file_pattern, options, schema):
+        return tfxio.TFExampleRecord(file_pattern, schema=schema).TensorFlowDataset(options)
+
+    return types.SimpleNamespace(tf_dataset_factory=tf_dataset_factory)
+
+
+def read_epochs(file_pattern, transform_dir, batch_size, epochs, transform_in_trainer):
+    import tensorflow_transform as tft
+    from models.keras import model
+
+    dataset = model._input_fn(  # pylint: disable=protected-access
+        file_pattern,
+        data_accessor(),
+        tft.TFTransformOutput(transform_dir),
+        batch_size,
+        transform_in_trainer=transform_in_trainer,
+    )
+    for _ in range(epochs):
+        for _ in dataset:
+            pass
+
+
+def measure(run):
+    io, start = perf_trace._proc_io(), time.perf_counter()  # pylint: disable=protected-access
+    run()
+    end = perf_trace._proc_io()  # pylint: disable=protected-access
+    return time.perf_counter() - start, end["read"] - io["read"], end["write"] - io["write"]
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from executors import columnar_csv
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, "data.csv")
+        make_csv(csv_path, args.rows)
+        raw_dir = os.path.join(work_dir, "raw")
+        blocks, read = columnar_csv.plan_split([csv_path])
+        columnar_csv.write_shards(blocks, read, {"train": raw_dir})
+        raw_pattern = os.path.join(raw_dir, "*")
+        raw_bytes = sum(os.path.getsize(path) for path in glob.glob(raw_pattern))
+        schema = raw_schema(tf)
+
+        print(f"{args.rows} rows, {raw_bytes / 2**20:.1f} MB of raw examples, {args.epochs} epochs")
+        print(f"{'mode':>14} {'stage':>10} {'seconds':>8} {'MB read':>8} {'MB written':>11}")
+        for mode, transform_in_trainer in [("materialized", False), ("in trainer", True)]:
+            transform_dir = os.path.join(work_dir, mode, "transform_graph")
+            transformed_dir = os.path.join(work_dir, mode, "transformed_examples")
+            stages = [
+                ("transform", lambda: run_transform(
+                    raw_pattern, schema, transform_dir, transformed_dir, not transform_in_trainer)),
+                ("trainer", lambda: read_epochs(
+                    raw_pattern if transform_in_trainer else os.path.join(transformed_dir, "*"),
+                    transform_dir, args.batch_size, args.epochs, transform_in_trainer)),
+            ]
+            total = [0.0, 0, 0]
+            for stage, run in stages:
+                seconds, read_bytes, written_bytes = measure(run)
+                total = [total[0] + seconds, total[1] + read_bytes, total[2] + written_bytes]
+                print(f"{mode:>14} {stage:>10} {seconds:>8.1f} "
+                      f"{read_bytes / 2**20:>8.1f} {written_bytes / 2**20:>11.1f}")
+            print(f"{mode:>14} {'total':>10} {total[0]:>8.1f} "
+                  f"{total[1] / 2**20:>8.1f} {total[2] / 2**20:>11.1f}")
@@ -43,12 +43,28 @@ Initialize the tree of TFX pipeline
 """
 
 import os
+import stat
 import shutil
 import re
+import json
+import hashlib
 import argparse
+import collections
 import urllib.request
 
-from recipe_utils import run_shell_command
+from recipe_utils import RECIPE_CACHE_DIR
+
+# Content-addressed store of template files and tool binaries
+STORE_DIR = os.path.join(RECIPE_CACHE_DIR, "store")
+# Top-level template folders whose files may be hard linked from the store:
+# large and not edited in place. Other files are reflinked or copied. Store
+# objects are read-only, so are their hard links in the projects.
+HARDLINK_DIRS = ("data", "notebooks", "bin")
+TOOL_URLS = {
+    "skaffold": "https://storage.googleapis.com/skaffold/releases/latest/skaffold-linux-amd64",
+}
+_IGNORED_DIRS = ("__pycache__", ".ipynb_checkpoints")
+_FICLONE = 0x40049409  # linux/fs.h ioctl
 
 # Additional arguments
 parser = argparse.ArgumentParser()
@@ -79,10 +95,200 @@ parser.add_argument(
 )
 
 
+def _hash_file(path):
+    """sha256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fid:
+        for block in iter(lambda: fid.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Stat of the store objects written or hashed by this process, by path
+_verified = {}
+
+
+def _object_path(digest):
+    return os.path.join(STORE_DIR, "objects", digest[:2], digest[2:])
+
+
+def _object_stat(digest):
+    """[size, mtime_ns, mode] of a store object, None if it is missing."""
+    try:
+        object_stat = os.stat(_object_path(digest))
+    except OSError:
+        return None
+    return [object_stat.st_size, object_stat.st_mtime_ns, stat.S_IMODE(object_stat.st_mode)]
+
+
+def _valid_object(digest, object_stat=None):
+    """
+    Whether the store holds the object of `digest` with its original content.
+
+    The object is hashed only when its stat differs from `object_stat`, the
+    one recorded when it was last written or verified.
+    """
+    object_path = _object_path(digest)
+    current = _object_stat(digest)
+    if current is None:
+        return False
+    if current == (object_stat or _verified.get(object_path)):
+        return True
+    if _hash_file(object_path) != digest:
+        return False
+    _verified[object_path] = current
+    return True
+
+
+def _store_file(path, digest=None, mode=None, object_stat=None):
+    """
+    Add a file to the content-addressed store and return its digest.
+
+    Objects are read-only; a missing or modified object is written again.
+    """
+    digest = digest or _hash_file(path)
+    object_path = _object_path(digest)
+    if not _valid_object(digest, object_stat):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        mode = mode if mode is not None else os.stat(path).st_mode & 0o777
+        os.chmod(tmp_path, mode & ~0o222)
+        os.replace(tmp_path, object_path)
+        _verified[object_path] = _object_stat(digest)
+    return digest
+
+
+def _template_manifest(source_dir):
+    """
+    Map every template file (relative path) to its digest in the store.
+
+    Digests are remembered by (size, mtime) so that only files that changed
+    since the last run are stored again, provided their store object is
+    still intact: its stat is recorded too, and it is hashed only if that
+    changed.
+    """
+    manifest_file = os.path.join(
+        STORE_DIR, "manifests", hashlib.sha256(os.path.realpath(source_dir).encode()).hexdigest()
+    )
+    try:
+        with open(manifest_file, "r") as fid:
+            previous = json.load(fid)
+    except (OSError, ValueError):
+        previous = {}
+
+    manifest = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if d not in _IGNORED_DIRS)
+        for name in sorted(files):
+            if name.endswith(".pyc"):
+                continue
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, source_dir)
+            file_stat = os.stat(path)
+            entry = previous.get(relpath) or {}
+            if entry.get("size") == file_stat.st_size \
+                    and entry.get("mtime_ns") == file_stat.st_mtime_ns:
+                digest = _store_file(path, entry["digest"], object_stat=entry.get("object"))
+            else:
+                digest = _store_file(path)
+            manifest[relpath] = {
+                "digest": digest,
+                "size": file_stat.st_size,
+                "mtime_ns": file_stat.st_mtime_ns,
+                "object": _object_stat(digest),
+            }
+
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(f"{manifest_file}.{os.getpid()}.tmp", "w") as fid:
+        json.dump(manifest, fid)
+    os.replace(f"{manifest_file}.{os.getpid()}.tmp", manifest_file)
+    return manifest
+
+
+def _reflink(source, target):
+    """Copy-on-write clone of a file (Linux btrfs / xfs); OSError if unsupported."""
+    import fcntl
+
+    with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(target)
+            raise
+
+
+def _materialize(digest, target, hardlink=False):
+    """
+    Create `target` from the store: reflink, else hard link, else copy.
+
+    Reflinks and copies are private to the project, hence writable; hard
+    links keep the read-only mode of the store object they share.
+    """
+    object_path = _object_path(digest)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        _reflink(object_path, target)
+        method = "reflink"
+    except (OSError, ImportError):
+        method = "copy"
+    if method == "copy" and hardlink:
+        try:
+            os.link(object_path, target)
+            return "hardlink"
+        except OSError:  # e.g. the store is on another filesystem
+            pass
+    if method == "copy":
+        shutil.copyfile(object_path, target)
+    os.chmod(target, os.stat(object_path).st_mode & 0o777 | stat.S_IWUSR)
+    return method
+
+
+def _fetch_tool(name):
+    """
+    Return the store digest of a tool binary, downloading it only once.
+
+    Returns None if the tool is not in the store and cannot be downloaded.
+    """
+    tool_file = os.path.join(STORE_DIR, "tools", name)
+    try:
+        with open(tool_file, "r") as fid:
+            record = fid.read().strip()
+        # {"digest": ..., "object": stat}, or the bare digest of older stores
+        record = json.loads(record) if record.startswith("{") else {"digest": record}
+        if _valid_object(record["digest"], record.get("object")):
+            return record["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    print(f"Downloading '{name}'")
+    os.makedirs(os.path.dirname(tool_file), exist_ok=True)
+    download_path = f"{tool_file}.{os.getpid()}.download"
+    try:
+        urllib.request.urlretrieve(TOOL_URLS[name], download_path)
+        digest = _store_file(download_path, mode=0o755)
+    except OSError as e:  # offline and not cached yet
+        print(f"Cannot download '{name}': {e}")
+        return None
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
+    with open(tool_file, "w") as fid:
+        json.dump({"digest": digest, "object": _object_stat(digest)}, fid)
+    return digest
+
+
 def recipe_init(pipeline_name="my_pipeline", project_dir=".", pipeline_type="tfx"):
     """
     Initialize the pipeline project from a template.
 
+    Template files and tool binaries are kept in a local content-addressed
+    store. Projects are created from it with reflinks where the filesystem
+    supports them; data, notebooks and binaries fall back to read-only hard
+    links and everything else to plain copies, so that editing a project
+    never changes the store. Repeated runs need no network access.
+
     Parameters
     ----------
     pipeline_name : str, optional
@@ -95,21 +301,19 @@ def recipe_init(pipeline_name="my_pipeline", project_dir=".", pipeline_type="tfx
         The default is tfx
     """
     # directories
-    base_dir = os.path.dirname(__file__)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
     source_dir = os.path.join(base_dir, f"{pipeline_type}_template")
     target_dir = os.path.realpath(
         os.path.abspath(os.path.join(project_dir, pipeline_name))
     )
 
-    # Copy the template folder
+    # Scaffold the template folder from the store
     if not os.path.isdir(target_dir):
-        shutil.copytree(source_dir, target_dir, dirs_exist_ok=True)
-        
-        # Copy over the metadata util
-        shutil.copyfile(
-            os.path.join(base_dir, "utils", "recipe_utils.py"),
-            os.path.join(project_dir, "utils", "metadata_utils.py"),
-        )
+        methods = collections.Counter()
+        for relpath, entry in _template_manifest(source_dir).items():
+            hardlink = relpath.split(os.sep)[0] in HARDLINK_DIRS
+            methods[_materialize(entry["digest"], os.path.join(target_dir, relpath), hardlink)] += 1
+        print("Scaffolded files: " + ", ".join(f"{n} {m}" for m, n in sorted(methods.items())))
     else:
         print("Pipeline folder exists.")
 
@@ -125,17 +329,12 @@ def recipe_init(pipeline_name="my_pipeline", project_dir=".", pipeline_type="tfx
     with open(config_filepath, "w") as fnew:
         fnew.write(script_data)
 
-    # For TFX pipeline, also download the skaffold bin
-    if pipeline_type == "tfx" and not os.path.isfile(
-        os.path.join(target_dir, "bin", "skaffold")
-    ):
-        print("Downloading 'skaffold'")
-        save_path = os.path.join(target_dir, "bin")
-        os.makedirs(save_path, exist_ok=True)
-        urllib.request.urlretrieve(
-            "https://storage.googleapis.com/skaffold/releases/latest/skaffold-linux-amd64",
-            os.path.join(save_path, "skaffold"),
-        )
+    # For TFX pipeline, also provide the skaffold bin
+    skaffold_path = os.path.join(target_dir, "bin", "skaffold")
+    if pipeline_type == "tfx" and not os.path.isfile(skaffold_path):
+        digest = _fetch_tool("skaffold")
+        if digest is not None:
+            _materialize(digest, skaffold_path, hardlink=True)
 
     print(f"Successfully initialized {pipeline_type.upper()} pipeline recipe.")
 
@@ -7,17 +7,40 @@ Created on Tue Mar 16 12:42:22 2021
 """
 
 import os
+import re
+import sys
+import glob
+import json
+import time
+import asyncio
 import argparse
+import hashlib
+import datetime
 import subprocess
+import dataclasses
+from typing import Dict, List, Optional
 
-from recipe_utils import get_metadata, get_config, run_shell_command
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:  # python < 3.8
+    import importlib_metadata
+
+from recipe_utils import (
+    RECIPE_CACHE_DIR,
+    get_metadata,
+    get_config,
+    freeze_metadata,
+    run_shell_command,
+    run_shell_command_async,
+)
 
 # Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "metadata_yaml",
     type=str,
-    help="Path to metadata.yaml file",
+    nargs="+",
+    help="Path(s) or glob pattern(s) of metadata.yaml files",
 )
 parser.add_argument(
     "-t",
@@ -33,20 +56,102 @@ parser.add_argument(
     action="store_true",
     dest="update_pipeline",
 )
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    help="Number of pipelines tasted concurrently when given several",
+    default=4,
+    dest="max_workers",
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    help="Extra attempts for each failing tfx command when given several pipelines",
+    default=1,
+    dest="retries",
+)
+parser.add_argument(
+    "--reinstall",
+    action="store_true",
+    help="Reinstall requirements.txt even if it is up to date",
+    dest="force_install",
+)
+
 
+# Wheels of every installed requirement, so that reinstalls work offline
+WHEELHOUSE_DIR = os.environ.get("RECIPE_WHEELHOUSE", os.path.join(RECIPE_CACHE_DIR, "wheelhouse"))
+# Fingerprints of the environments in which each requirements.txt was installed
+REQUIREMENTS_STAMP_DIR = os.path.join(RECIPE_CACHE_DIR, "requirements")
+
+
+def requirements_fingerprint(requirements_file):
+    """Hash of a requirements file, the interpreter and the installed distributions."""
+    digest = hashlib.sha256()
+    with open(requirements_file, "rb") as fid:
+        digest.update(fid.read())
+    digest.update(f"\0{sys.executable}\0{sys.version}\0".encode())
+    distributions = sorted(
+        f"{dist.metadata['Name']}=={dist.version}" for dist in importlib_metadata.distributions()
+    )
+    digest.update("\n".join(distributions).encode())
+    return digest.hexdigest()
 
-def set_tfx_environments(pipeline_path):
+
+def _requirements_stamp(requirements_file):
+    """Stamp file holding the fingerprint after the last successful install."""
+    key = hashlib.sha256(os.path.realpath(requirements_file).encode()).hexdigest()
+    return os.path.join(REQUIREMENTS_STAMP_DIR, key)
+
+
+def install_requirements(requirements_file, force=False):
+    """
+    pip install a requirements file unless it is already installed.
+
+    The install is skipped when the fingerprint of the requirements file, the
+    interpreter and the installed distributions matches the one recorded after
+    the last successful install. Otherwise the requirements are installed from
+    the local wheelhouse only, and the wheelhouse is topped up from the index
+    when it is missing some of them.
+
+    Returns True if pip was run.
+    """
+    stamp_file = _requirements_stamp(requirements_file)
+    if not force and os.path.isfile(stamp_file):
+        with open(stamp_file, "r") as fid:
+            if fid.read().strip() == requirements_fingerprint(requirements_file):
+                print(f"{requirements_file} is up to date, skipping install")
+                return False
+
+    pip = [sys.executable, "-m", "pip"]
+    install_command = pip + [
+        "install", "--user", "--no-index", f"--find-links={WHEELHOUSE_DIR}", "-r", requirements_file,
+    ]
+    print(f"Installing {requirements_file}")
+    os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+    returncode, _ = run_shell_command(install_command, verbose=True)
+    if returncode != 0:
+        print(f"Wheelhouse is missing requirements, downloading them to {WHEELHOUSE_DIR}")
+        returncode, _ = run_shell_command(
+            pip + ["wheel", f"--find-links={WHEELHOUSE_DIR}", "-w", WHEELHOUSE_DIR, "-r", requirements_file],
+            verbose=True,
+        )
+        if returncode == 0:
+            returncode, _ = run_shell_command(install_command, verbose=True)
+    if returncode != 0:
+        raise (Exception(f"{requirements_file} not successfully installed"))
+    print(f"Successfully installed {requirements_file}")
+
+    os.makedirs(REQUIREMENTS_STAMP_DIR, exist_ok=True)
+    with open(stamp_file, "w") as fid:
+        fid.write(requirements_fingerprint(requirements_file))
+    return True
+
+
+def set_tfx_environments(pipeline_path, force_install=False):
     """Set up the local environments."""
     # pip install -r requirements.txt
-    print("Installing requirements.txt")
-    returncode, _ = run_shell_command(
-        ["pip", "install", "--user", "-r", os.path.join(pipeline_path, "requirements.txt")],
-        verbose=True,
-    )
-    if returncode == 0:
-        print("Successfully installed requirements.txt")
-    else:
-        raise (Exception("requirements.txt not successfully installed"))
+    install_requirements(os.path.join(pipeline_path, "requirements.txt"), force=force_install)
 
     # Add the bin path to the running directory
     bin_path = os.path.realpath(os.path.join(pipeline_path, "bin"))
@@ -54,39 +159,191 @@ def set_tfx_environments(pipeline_path):
         os.environ["PATH"] += f":{bin_path}"
 
 
+# Parsed runs are appended to this JSONL file next to metadata.yaml
+RUN_LOG_FILE = "tfx_runs.jsonl"
+
+_UUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+_RUN_ID_RE = re.compile(rf"\brun[ _]id\W+({_UUID})", re.IGNORECASE)
+_PIPELINE_ID_RE = re.compile(rf"\bpipeline[ _]id\W+({_UUID})", re.IGNORECASE)
+_PIPELINE_NAME_RE = re.compile(
+    r"(?:run created for pipeline|creating a run for pipeline|pipeline)\W+([\w\-]+)\"?"
+    r"\s*(?:created|updated|compiled|$)",
+    re.IGNORECASE,
+)
+_COMPONENT_RE = re.compile(r"Component (\w+) is (running|finished)")
+_BUILD_STEP_RE = re.compile(r"^Step (\d+)/(\d+) : (.*)")
+
+
+@dataclasses.dataclass
+class TfxStep:
+    """One step of a tfx command: an image build step or a component."""
+
+    name: str
+    status: str
+    start_seconds: float  # since the command started
+    seconds: Optional[float] = None
+
+
+@dataclasses.dataclass
+class TfxRunResult:
+    """What `tfx pipeline create/update` and `tfx run create` reported."""
+
+    pipeline_name: Optional[str] = None
+    pipeline_id: Optional[str] = None
+    run_id: Optional[str] = None
+    run_status: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: str = dataclasses.field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat()
+    )
+    # [{"command": ..., "returncode": ..., "seconds": ...}]
+    commands: List[Dict] = dataclasses.field(default_factory=list)
+    steps: List[TfxStep] = dataclasses.field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return dataclasses.asdict(self)
+
+
+class TfxOutputParser:
+    """Incrementally parse tfx CLI output, one line at a time.
+
+    Pass `feed` as the `on_line` callback of `run_shell_command`, bracketing
+    each command with `start_command` / `finish_command` so that step and
+    command durations are measured on the wall clock as lines arrive.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.result = TfxRunResult()
+        self._clock = clock
+        self._command_start = clock()
+        self._open_steps = {}
+        self._table_columns = None
+
+    def start_command(self, command):
+        self._command_start = self._clock()
+        self.result.commands.append(
+            {"command": " ".join(command), "returncode": None, "seconds": None}
+        )
+
+    def finish_command(self, returncode):
+        elapsed = self._clock() - self._command_start
+        for step in self._open_steps.values():
+            step.seconds = elapsed - step.start_seconds
+            step.status = "finished" if returncode == 0 else "failed"
+        self._open_steps = {}
+        if self.result.commands:
+            self.result.commands[-1].update(returncode=returncode, seconds=elapsed)
+
+    def feed(self, line):
+        elapsed = self._clock() - self._command_start
+        line = line.strip()
+        if line.startswith("|"):
+            self._feed_table_row(line)
+            return
+        match = _COMPONENT_RE.search(line)
+        if match:
+            name, status = match.groups()
+            if status == "running":
+                self._open_step(name, elapsed)
+            elif name in self._open_steps:
+                step = self._open_steps.pop(name)
+                step.status, step.seconds = "finished", elapsed - step.start_seconds
+            return
+        match = _BUILD_STEP_RE.match(line)
+        if match:
+            # A build step ends when the next one starts
+            for name in [n for n in self._open_steps if _BUILD_STEP_RE.match(n)]:
+                step = self._open_steps.pop(name)
+                step.status, step.seconds = "finished", elapsed - step.start_seconds
+            self._open_step(line, elapsed)
+            return
+        for regex, attribute in [
+            (_RUN_ID_RE, "run_id"),
+            (_PIPELINE_ID_RE, "pipeline_id"),
+            (_PIPELINE_NAME_RE, "pipeline_name"),
+        ]:
+            match = regex.search(line)
+            if match:
+                setattr(self.result, attribute, match.group(1))
+
+    def _open_step(self, name, elapsed):
+        step = TfxStep(name=name, status="running", start_seconds=elapsed)
+        self._open_steps[name] = step
+        self.result.steps.append(step)
+
+    def _feed_table_row(self, line):
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if "run_id" in cells:
+            self._table_columns = cells
+        elif self._table_columns is not None and len(cells) == len(self._table_columns):
+            row = dict(zip(self._table_columns, cells))
+            for column in ["pipeline_name", "pipeline_id", "run_id", "created_at"]:
+                if row.get(column):
+                    setattr(self.result, column, row[column])
+            if row.get("status"):
+                self.result.run_status = row["status"]
+
+
 def parse_tfx_run_output(stdout):
-    return {"asf": 1}
+    """Parse the complete output of tfx commands into a TfxRunResult."""
+    output_parser = TfxOutputParser()
+    for line in stdout.splitlines():
+        output_parser.feed(line)
+    return output_parser.result
 
 
-def taste_tfx_recipe(metadata_yaml, update=False, engine="kubeflow"):
-    # Get the path of the pipeline
-    pipeline_path = os.path.dirname(metadata_yaml)
+def append_run_log(result, run_log):
+    """Append a TfxRunResult as one JSON line to the run log."""
+    os.makedirs(os.path.dirname(os.path.abspath(run_log)), exist_ok=True)
+    with open(run_log, "a") as fid:
+        fid.write(json.dumps(result.to_dict()) + "\n")
 
-    # Set some envrionments
-    if not update:
-        set_tfx_environments(pipeline_path)
+
+def _update_command(kubeflow_runner, endpoint, engine):
+    return [
+        "tfx",
+        "pipeline",
+        "update",
+        f"--pipeline-path={kubeflow_runner}",
+        f"--endpoint={endpoint}",
+        f"--engine={engine}",
+    ]
+
+
+def _retry_command(command):
+    """The command retrying a failed one.
+
+    `tfx pipeline create` is not idempotent (a partial failure may have
+    registered the pipeline), so it is retried as `tfx pipeline update`.
+    """
+    if command[1:3] != ["pipeline", "create"]:
+        return command
+    options = dict(arg[2:].split("=", 1) for arg in command[3:])
+    return _update_command(options["pipeline-path"], options["endpoint"], options["engine"])
+
+
+def _tfx_commands(metadata_yaml, update=False, engine="kubeflow"):
+    """Return the pipeline name and the tfx commands deploying / running it.
+
+    The commands must run with the pipeline directory as working directory:
+    the kubeflow handler reads and writes build.yaml and the Dockerfile there
+    and builds the image from it (with metadata.frozen.json).
+    """
+    # Get the path of the pipeline
+    pipeline_path = os.path.dirname(os.path.abspath(metadata_yaml))
 
     # Get some global variables
     metadata = get_metadata(metadata_yaml)
     PIPELINE_NAME = metadata["pipeline_name"]
     system_config = get_config(metadata, "system_configurations")
-    CUSTOM_TFX_IMAGE = (
-        "gcr.io/" + system_config["GOOGLE_CLOUD_PROJECT"] + "/" + system_config["TFX_IMAGE_REPO_NAME"]
-    )
+    CUSTOM_TFX_IMAGE = system_config["TFX_IMAGE"]
     ENDPOINT = system_config["ENDPOINT"]
     KUBEFLOW_RUNNER = os.path.join(pipeline_path, system_config["KUBEFLOW_RUNNER"])
 
     # Prepare the pipeline running commands
     if update:
         # Update the pipeline
-        init_command = [
-            "tfx",
-            "pipeline",
-            "update",
-            f"--pipeline-path={KUBEFLOW_RUNNER}",
-            f"--endpoint={ENDPOINT}",
-            f"--engine={engine}",
-        ]
+        init_command = _update_command(KUBEFLOW_RUNNER, ENDPOINT, engine)
     else:
         # Create the pipeline
         init_command = [
@@ -95,7 +352,8 @@ def taste_tfx_recipe(metadata_yaml, update=False, engine="kubeflow"):
             "create",
             f"--pipeline-path={KUBEFLOW_RUNNER}",
             f"--endpoint={ENDPOINT}",
-            f"--engine={engine}" f"--build-target-image={CUSTOM_TFX_IMAGE}",
+            f"--engine={engine}",
+            f"--build-target-image={CUSTOM_TFX_IMAGE}",
         ]
 
     # Run the pipeline
@@ -107,13 +365,189 @@ def taste_tfx_recipe(metadata_yaml, update=False, engine="kubeflow"):
         f"--endpoint={ENDPOINT}",
     ]
 
-    # Execute the pipeline
-    run_shell_command(init_command, verbose=True)
-    _, stdout = run_shell_command(run_command, verbose=True)
+    return PIPELINE_NAME, init_command, run_command
+
+
+def _run_log_path(metadata_yaml, run_log=None):
+    """The run log of a pipeline, next to its metadata.yaml by default."""
+    return run_log or os.path.join(os.path.dirname(metadata_yaml), RUN_LOG_FILE)
 
-    # Parse outputs
-    parsed_outputs = parse_tfx_run_output(stdout)
-    print(parsed_outputs)
+
+def taste_tfx_recipe(
+    metadata_yaml, update=False, engine="kubeflow", run_log=None, force_install=False
+):
+    # Set some envrionments
+    if not update:
+        set_tfx_environments(os.path.dirname(metadata_yaml), force_install)
+
+    _, init_command, run_command = _tfx_commands(metadata_yaml, update, engine)
+
+    # Resolve the metadata into the image built by the commands below
+    freeze_metadata(metadata_yaml)
+
+    # Execute the pipeline, parsing the outputs as they stream in
+    output_parser = TfxOutputParser()
+    for command in [init_command, run_command]:
+        output_parser.start_command(command)
+        returncode, _ = run_shell_command(
+            command,
+            verbose=True,
+            on_line=output_parser.feed,
+            cwd=os.path.dirname(os.path.abspath(metadata_yaml)),
+        )
+        output_parser.finish_command(returncode)
+
+    # Record the run
+    append_run_log(output_parser.result, _run_log_path(metadata_yaml, run_log))
+    print(output_parser.result)
+    return output_parser.result
+
+
+def taste_tfx_recipes(
+    metadata_yamls,
+    update=False,
+    engine="kubeflow",
+    max_workers=4,
+    retries=1,
+    timeout=None,
+    run_log=None,
+    force_install=False,
+):
+    """
+    Taste many TFX pipelines at once.
+
+    Each pipeline runs its create/update step and then its run step, in its
+    own directory. At most `max_workers` pipelines are in flight at a time,
+    and each failing step is retried up to `retries` times, a failed create
+    as an update. The output of each pipeline is prefixed with its name.
+
+    Parameters
+    ----------
+    metadata_yamls : list of str
+        Paths to the metadata.yaml file of each pipeline.
+    update : bool, optional
+        Update existing pipelines instead of creating them.
+        The default is False.
+    engine : str, optional
+        Orchestration engine. The default is "kubeflow".
+    max_workers : int, optional
+        Number of pipelines processed concurrently. The default is 4.
+    retries : int, optional
+        Extra attempts for each failing step. The default is 1.
+    timeout : float, optional
+        Seconds before a single step attempt is killed. The default is None.
+    run_log : str, optional
+        JSONL file the parsed run of every pipeline is appended to.
+        The default is tfx_runs.jsonl next to each metadata.yaml.
+    force_install : bool, optional
+        Reinstall requirements.txt even if it is up to date.
+        The default is False.
+
+    Returns
+    -------
+    results : list of dict
+        One entry per metadata file, in the order given, with its pipeline
+        name, status, attempts, per-step seconds, error message and the
+        parsed TfxRunResult under "outputs".
+    """
+    # Install requirements once per pipeline project, before going parallel
+    if not update:
+        for pipeline_path in sorted({os.path.dirname(f) for f in metadata_yamls}):
+            set_tfx_environments(pipeline_path, force_install)
+
+    async def _run_step(command, prefix, output_parser, cwd):
+        for attempt in range(1, retries + 2):
+            start = time.perf_counter()
+            output_parser.start_command(command)
+            try:
+                returncode, _ = await run_shell_command_async(
+                    command,
+                    verbose=True,
+                    prefix=prefix,
+                    timeout=timeout,
+                    on_line=output_parser.feed,
+                    cwd=cwd,
+                )
+            except subprocess.TimeoutExpired:
+                returncode = None
+            output_parser.finish_command(returncode)
+            if returncode == 0 or attempt > retries:
+                return returncode, attempt, time.perf_counter() - start
+            command = _retry_command(command)
+
+    async def _taste(metadata_yaml, semaphore):
+        result = {
+            "metadata": metadata_yaml,
+            "pipeline": None,
+            "status": "failed",
+            "attempts": 0,
+            "init_seconds": None,
+            "run_seconds": None,
+            "error": None,
+            "outputs": None,
+        }
+        async with semaphore:
+            try:
+                name, init_command, run_command = _tfx_commands(metadata_yaml, update, engine)
+                result["pipeline"] = name
+                freeze_metadata(metadata_yaml)
+                output_parser = TfxOutputParser()
+                result["outputs"] = output_parser.result
+                for step, command in [("init", init_command), ("run", run_command)]:
+                    returncode, attempts, seconds = await _run_step(
+                        command, name, output_parser, os.path.dirname(os.path.abspath(metadata_yaml))
+                    )
+                    result["attempts"] += attempts
+                    result[f"{step}_seconds"] = seconds
+                    if returncode != 0:
+                        result["error"] = (
+                            f"'{' '.join(command[:3])}' timed out"
+                            if returncode is None
+                            else f"'{' '.join(command[:3])}' exited with {returncode}"
+                        )
+                        break
+                else:
+                    result["status"] = "ok"
+                append_run_log(output_parser.result, _run_log_path(metadata_yaml, run_log))
+            except Exception as e:  # report it with the others, keep going
+                result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    async def _taste_all():
+        semaphore = asyncio.Semaphore(max(max_workers, 1))
+        return await asyncio.gather(*[_taste(f, semaphore) for f in metadata_yamls])
+
+    results = asyncio.run(_taste_all())
+    print(format_taste_summary(results))
+    return results
+
+
+def format_taste_summary(results):
+    """Summary table of `taste_tfx_recipes` results."""
+
+    def _seconds(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    rows = [["pipeline", "status", "attempts", "init (s)", "run (s)", "error"]]
+    for result in results:
+        rows.append(
+            [
+                result["pipeline"] or result["metadata"],
+                result["status"],
+                str(result["attempts"]),
+                _seconds(result["init_seconds"]),
+                _seconds(result["run_seconds"]),
+                result["error"] or "",
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) + "  " + row[-1]
+        for row in rows
+    ]
+    failed = sum(result["status"] != "ok" for result in results)
+    lines.append(f"{len(results) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
 
 
 def taste_zenml_recipe(metadata_yaml, update=False):
@@ -129,10 +563,30 @@ def test_taste_tfx_recipe():
 if __name__ == "__main__":
     args = parser.parse_args()
     print(args.__dict__)
+    # Expand glob patterns, e.g. "pipelines/**/metadata.yaml"
+    metadata_yamls = []
+    for pattern in args.metadata_yaml:
+        for metadata_yaml in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            if metadata_yaml not in metadata_yamls:
+                metadata_yamls.append(metadata_yaml)
+
     if args.pipeline_type == "tfx":
-        taste_tfx_recipe(args.metadata_yaml, args.update_pipeline)
+        if len(metadata_yamls) == 1:
+            taste_tfx_recipe(
+                metadata_yamls[0], args.update_pipeline, force_install=args.force_install
+            )
+        else:
+            results = taste_tfx_recipes(
+                metadata_yamls,
+                args.update_pipeline,
+                max_workers=args.max_workers,
+                retries=args.retries,
+                force_install=args.force_install,
+            )
+            sys.exit(any(result["status"] != "ok" for result in results))
     elif args.pipeline_type == "zenml":
-        taste_zenml_recipe(args.metadata_yaml, args.update_pipeline)
+        for metadata_yaml in metadata_yamls:
+            taste_zenml_recipe(metadata_yaml, args.update_pipeline)
     elif args.pipeline_type == "auto":
         # auto detect pipeline type based on structure
         raise (
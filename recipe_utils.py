@@ -8,30 +8,134 @@ Recipe utilities
 @author: edwardcui
 """
 import os
+import codecs
+import asyncio
 import subprocess
+import collections
 import pathlib
-from typing import Dict, List, Text, Optional
-import yaml
+from typing import Callable, Dict, List, Text, Optional, Tuple
 import json
-import jinja2
+import hashlib
+import functools
 
 # Get project directory
 PROJECT_DIR = str(pathlib.Path(__file__).parent.parent)
 DEFAULT_METADATA = os.path.join(PROJECT_DIR, "metadata.yaml")
 
+# Number of trailing output lines kept in memory by run_shell_command
+MAX_OUTPUT_LINES = 10000
+_READ_CHUNK_SIZE = 64 * 1024
 
-def get_metadata(metadata_file: str = DEFAULT_METADATA) -> Dict:
-    """Return the metadata dictionary."""
+# Root of the local caches kept by the recipe tools
+RECIPE_CACHE_DIR = os.environ.get(
+    "RECIPE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "recipe")
+)
+
+# Bump whenever parse_templated_fields changes its output, so that cached
+# snapshots written by an older resolver are ignored
+RESOLVER_VERSION = 2
+# Resolved metadata snapshots, keyed on the metadata.yaml content hash
+METADATA_CACHE_DIR = os.environ.get(
+    "RECIPE_METADATA_CACHE", os.path.join(RECIPE_CACHE_DIR, "metadata")
+)
+
+
+def get_metadata(metadata_file: str = DEFAULT_METADATA, use_cache: bool = True) -> Dict:
+    """Return the metadata dictionary.
+
+    A frozen snapshot next to the metadata file (see `freeze_metadata`) or a
+    cached snapshot of the same file content is loaded when available, which
+    skips both YAML parsing and template rendering.
+    """
     metadata_file = DEFAULT_METADATA if metadata_file is None else metadata_file
-    with open(metadata_file, "r") as fid:
-        metadata = yaml.safe_load(fid)
-    
+    frozen_file = _frozen_path(metadata_file)
+    if not os.path.isfile(metadata_file) and os.path.isfile(frozen_file):
+        # Images may ship the frozen snapshot alone
+        return _load_snapshot(frozen_file)
+
+    with open(metadata_file, "rb") as fid:
+        content = fid.read()
+    key = _metadata_key(content)
+    cache_file = os.path.join(METADATA_CACHE_DIR, f"{key}.json")
+    if use_cache:
+        for snapshot_file in [frozen_file, cache_file]:
+            metadata = _load_snapshot(snapshot_file, key)
+            if metadata is not None:
+                return metadata
+
+    import yaml
+
+    metadata = yaml.safe_load(content)
+
     # Parse any templated fields
     metadata = parse_templated_fields(metadata)
 
+    if use_cache:
+        _dump_snapshot(cache_file, key, metadata)
+
     return metadata
 
 
+def freeze_metadata(metadata_file: str = DEFAULT_METADATA) -> Text:
+    """Write the fully resolved metadata next to the metadata file.
+
+    Run at image build time so that `get_metadata` in the pipeline pods loads
+    the snapshot without importing yaml or jinja2. Returns the snapshot path.
+    """
+    metadata_file = DEFAULT_METADATA if metadata_file is None else metadata_file
+    with open(metadata_file, "rb") as fid:
+        key = _metadata_key(fid.read())
+    frozen_file = _frozen_path(metadata_file)
+    if not _dump_snapshot(frozen_file, key, get_metadata(metadata_file, use_cache=False)):
+        raise(ValueError(f"Cannot freeze {metadata_file}: metadata is not JSON serializable"))
+    return frozen_file
+
+
+def _frozen_path(metadata_file: Text) -> Text:
+    """metadata.yaml -> metadata.frozen.json"""
+    return os.path.splitext(metadata_file)[0] + ".frozen.json"
+
+
+def _metadata_key(content: bytes) -> Text:
+    """Cache key of a metadata file: its content hash plus the resolver version."""
+    return hashlib.sha256(content + f"\0resolver={RESOLVER_VERSION}".encode()).hexdigest()
+
+
+def _load_snapshot(snapshot_file: Text, key: Optional[Text] = None) -> Optional[Dict]:
+    """Load a resolved metadata snapshot; None if missing, corrupt or stale."""
+    try:
+        with open(snapshot_file, "r") as fid:
+            snapshot = json.load(fid)
+    except (OSError, ValueError):
+        return None
+    if key is not None and snapshot.get("key") != key:
+        return None
+    return snapshot.get("metadata")
+
+
+def _dump_snapshot(snapshot_file: Text, key: Text, metadata: Dict) -> bool:
+    """Atomically write a resolved metadata snapshot, best effort."""
+    snapshot = {"key": key, "resolver_version": RESOLVER_VERSION, "metadata": metadata}
+    try:
+        data = json.dumps(snapshot, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return False
+    if json.loads(data)["metadata"] != metadata:  # e.g. YAML dates or int keys
+        return False
+
+    tmp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(snapshot_file)), exist_ok=True)
+        with open(tmp_file, "w") as fid:
+            fid.write(data)
+        os.replace(tmp_file, snapshot_file)
+    except OSError:  # read-only home or image layer: caching is optional
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    return True
+
+
 def get_config(metadata: Dict, field: Optional[Text] = "system_configurations", 
                filter_type: Optional[List[Text]] = None) -> Dict:
     """Return the pipeline config dictionary."""
@@ -44,78 +148,267 @@ def get_config(metadata: Dict, field: Optional[Text] = "system_configurations",
 
 
 
+# Field types whose values may carry templated strings
+_TEMPLATED_TYPES = ("string", "str", "array", "object")
+
+
+def _is_templated(s) -> bool:
+    """Whether a value is a string carrying a `{{ VAR }}` expression."""
+    return isinstance(s, str) and "{{ " in s and " }}" in s
+
+
+@functools.lru_cache(maxsize=None)
+def _jinja_env():
+    """Shared environment so that compiled templates can be reused across fields.
+
+    jinja2 is only imported once a field actually needs rendering.
+    """
+    import jinja2
+
+    return jinja2.Environment()
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_template(source: Text):
+    """Compile a template source once; identical sources share the result."""
+    return _jinja_env().from_string(source)
+
+
+@functools.lru_cache(maxsize=None)
+def _template_references(source: Text) -> frozenset:
+    """Names of the variables referenced by a template source."""
+    from jinja2 import meta
+
+    return frozenset(meta.find_undeclared_variables(_jinja_env().parse(source)))
+
+
+def _iter_strings(value):
+    """Yield every string (including dict keys) nested in a field value."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for key, val in value.items():
+            yield from _iter_strings(key)
+            yield from _iter_strings(val)
+    elif isinstance(value, list):
+        for val in value:
+            yield from _iter_strings(val)
+
+
+def _render_value(value, context: Dict):
+    """Render the templated strings nested in a field value."""
+    if isinstance(value, str):
+        return _compile_template(value).render(context) if _is_templated(value) else value
+    elif isinstance(value, dict):
+        return {_render_value(k, context): _render_value(v, context) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_render_value(v, context) for v in value]
+    return value
+
+
+def _sort_templated_fields(dependencies: Dict[Text, frozenset]) -> List[Text]:
+    """Order fields so that every field comes after the fields it references.
+
+    Raises a ValueError naming the full cycle if the references are circular.
+    """
+    order, state = [], {}  # state: 1 = on the current path, 2 = done
+    for root in dependencies:
+        if state.get(root) == 2:
+            continue
+        path, stack = [root], [iter(sorted(dependencies[root]))]
+        state[root] = 1
+        while stack:
+            dep = next(stack[-1], None)
+            if dep is None:  # all references of path[-1] are resolved
+                stack.pop()
+                done = path.pop()
+                state[done] = 2
+                order.append(done)
+            elif dep not in dependencies or state.get(dep) == 2:
+                continue
+            elif state.get(dep) == 1:
+                cycle = path[path.index(dep):] + [dep]
+                raise(ValueError(f"Cyclic templated fields: {' -> '.join(cycle)}"))
+            else:
+                state[dep] = 1
+                path.append(dep)
+                stack.append(iter(sorted(dependencies[dep])))
+    return order
+
+
 def parse_templated_fields(metadata: Dict) -> Dict:
-    """Parse any strings, array(string), or dict fields that are templated."""
-    parse_dict = {}
+    """Parse any strings, array(string), or dict fields that are templated.
+
+    Template references are extracted once, fields are sorted in dependency
+    order and each templated field is rendered exactly once against the
+    values already resolved before it.
+    """
+    owners, context, dependencies = {}, {}, {}
+
+    def _track(name, value, owner, templatable=True):
+        # Flattened name -> (section, key); later sections shadow earlier ones
+        owners[name], context[name] = owner, value
+        templates = [s for s in _iter_strings(value) if _is_templated(s)] if templatable else []
+        if templates:
+            dependencies[name] = frozenset().union(*map(_template_references, templates))
+        else:  # only templated fields need rendering; the rest are leaves
+            dependencies.pop(name, None)
+
     for field in metadata:
         if "configurations" not in field:
-            parse_dict.update({field: metadata[field]})
+            _track(field, metadata[field], (None, field))
         else:
-            parse_dict.update(get_config(metadata, field))
-            
-    def _recursive_render(s, cur_key):
-        if s is None:
-            return s
-        counter = 0
-        while "{{ " in s and " }}" in s:
-            s = jinja2.Template(s).render(**parse_dict)
-            counter += 1
-            if counter > 100:
-                raise(ValueError(f"Cannot parse templated field {cur_key}"))
-        return s
-
-    # looping over config sections:
+            for key, val in metadata[field].items():
+                _track(key, val["value"], (field, key), val["type"] in _TEMPLATED_TYPES)
+
+    for name in _sort_templated_fields(dependencies):
+        context[name] = _render_value(context[name], context)
+
+    # Write the resolved values back, including shadowed duplicate keys
     for config_sec, configs in metadata.items():
-        if"configurations" not in config_sec:
+        if "configurations" not in config_sec:
             continue
-        # looping over each field in the current config section
         for cur_key, cur_val in configs.items():
-            if cur_val["type"] in ["string", "str"]:
-                cur_val["value"] = _recursive_render(cur_val["value"], cur_key)
-            elif cur_val["type"] == "array":
-                for index, s in enumerate(cur_val["value"]):                    
-                    cur_val["value"][index] = _recursive_render(s, cur_key)
-            elif cur_val["type"] == "object": # a dict
-                # convert to json string
-                object_str = json.dumps(cur_val["value"]).replace("\\", "")
-                # parse it like a string
-                object_str = _recursive_render(object_str, cur_key)
-                # convert it back to dict
-                cur_val["value"] = json.loads(object_str)
-                
-            metadata[config_sec][cur_key]["value"] = cur_val["value"]
-            
+            if owners[cur_key] == (config_sec, cur_key):
+                cur_val["value"] = context[cur_key]
+            elif cur_val["type"] in _TEMPLATED_TYPES:
+                cur_val["value"] = _render_value(cur_val["value"], context)
+
     return metadata
 
 
+async def run_shell_command_async(
+    command: List[Text],
+    verbose: bool = True,
+    prefix: Optional[Text] = None,
+    tee_file: Optional[Text] = None,
+    timeout: Optional[float] = None,
+    max_output_lines: int = MAX_OUTPUT_LINES,
+    on_line: Optional[Callable[[Text], None]] = None,
+    cwd: Optional[Text] = None,
+):
+    """Run a command and get the outputs, streaming them as they arrive.
+
+    stdout and stderr are read together in chunks; only the last
+    `max_output_lines` lines are kept in memory and returned, while the full
+    raw output can be appended to `tee_file`. Each line is also passed to
+    `on_line` as soon as it is read. The command is killed when it runs
+    longer than `timeout` seconds (raising subprocess.TimeoutExpired) or
+    when the awaiting task is cancelled. The command runs in `cwd`, the
+    current directory by default.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, cwd=cwd
+    )
+    tail = collections.deque(maxlen=max_output_lines)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    tee = open(tee_file, "ab") if tee_file is not None else None
+
+    def _emit(line):
+        line = line.strip()
+        if verbose:
+            print(line if prefix is None else f"[{prefix}] {line}", flush=True)
+        if on_line is not None:
+            on_line(line)
+        tail.append(line)
+
+    async def _pump():
+        partial = ""
+        while True:
+            chunk = await process.stdout.read(_READ_CHUNK_SIZE)
+            if tee is not None:
+                tee.write(chunk)
+            text = partial + decoder.decode(chunk, final=not chunk)
+            lines = text.split("\n")
+            partial = lines.pop()
+            for line in lines:
+                _emit(line)
+            if not chunk:
+                break
+        if partial:
+            _emit(partial)
+        return await process.wait()
 
+    try:
+        returncode = await asyncio.wait_for(_pump(), timeout)
+    except asyncio.TimeoutError:
+        raise(subprocess.TimeoutExpired(command, timeout, output=os.linesep.join(tail)))
+    finally:
+        if process.returncode is None:  # timed out or cancelled
+            process.kill()
+            await asyncio.shield(process.wait())
+        if tee is not None:
+            tee.close()
 
-def run_shell_command(command, verbose=True):
+    return returncode, os.linesep.join(tail)
+
+
+def run_shell_command(
+    command: List[Text],
+    verbose: bool = True,
+    tee_file: Optional[Text] = None,
+    timeout: Optional[float] = None,
+    max_output_lines: int = MAX_OUTPUT_LINES,
+    on_line: Optional[Callable[[Text], None]] = None,
+    cwd: Optional[Text] = None,
+):
     """Run a command and get the outputs."""
-    process = subprocess.Popen(command, 
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.STDOUT,
-        encoding="utf-8", 
-        errors="replace")
-
-    cached_output = []
-    
-    while True: # print progress real time
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-
-        if output and verbose:
-            print(output.strip(), flush=True)
-
-        # save output
-        cached_output.append(output.strip())
-    
-    cached_output = os.linesep.join(cached_output)
-
-    return process.returncode, cached_output
-    
+    return asyncio.run(
+        run_shell_command_async(
+            command,
+            verbose=verbose,
+            tee_file=tee_file,
+            timeout=timeout,
+            max_output_lines=max_output_lines,
+            on_line=on_line,
+            cwd=cwd,
+        )
+    )
+
+
+def run_shell_commands(
+    commands: Dict[Text, List[Text]],
+    verbose: bool = True,
+    tee_dir: Optional[Text] = None,
+    timeout: Optional[float] = None,
+    max_concurrency: Optional[int] = None,
+    max_output_lines: int = MAX_OUTPUT_LINES,
+) -> Dict[Text, Tuple[int, Text]]:
+    """Run several named commands at once, prefixing their output by name.
+
+    At most `max_concurrency` commands run at the same time (all of them if
+    None). With `tee_dir`, the full output of each command goes to
+    `<tee_dir>/<name>.log`. Returns {name: (returncode, output tail)}; a
+    command that times out is reported with returncode None.
+    """
+    if tee_dir is not None:
+        os.makedirs(tee_dir, exist_ok=True)
+
+    async def _run_all():
+        semaphore = asyncio.Semaphore(max_concurrency or max(len(commands), 1))
+
+        async def _run(name, command):
+            async with semaphore:
+                try:
+                    return await run_shell_command_async(
+                        command,
+                        verbose=verbose,
+                        prefix=name,
+                        tee_file=None if tee_dir is None else os.path.join(tee_dir, f"{name}.log"),
+                        timeout=timeout,
+                        max_output_lines=max_output_lines,
+                    )
+                except subprocess.TimeoutExpired as e:
+                    return None, e.output
+
+        results = await asyncio.gather(*[_run(name, cmd) for name, cmd in commands.items()])
+        return dict(zip(commands, results))
+
+    return asyncio.run(_run_all())
+
 
 if __name__ == '__main__':
+    import yaml
+
     metadata = yaml.safe_load(open("tfx_template/metadata.yaml", "r"))
     config = get_config(metadata)
@@ -0,0 +1,100 @@
+"""Tests for scaffolding pipelines from the content-addressed template store."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import urllib.error
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import recipe_init  # noqa: E402
+
+
+def _fake_download(url, path):
+    with open(path, "w") as fid:
+        fid.write("#!/bin/sh\necho skaffold\n")
+
+
+def _offline(url, path):
+    raise urllib.error.URLError("offline")
+
+
+class RecipeInitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch.object(
+            recipe_init, "STORE_DIR", os.path.join(self.tmp_dir, "store")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_init_is_offline_and_shares_data(self):
+        with mock.patch("urllib.request.urlretrieve", side_effect=_fake_download) as fetch:
+            recipe_init.recipe_init("first", self.tmp_dir)
+        self.assertEqual(1, fetch.call_count)
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline):
+            recipe_init.recipe_init("second", self.tmp_dir)
+
+        first = os.path.join(self.tmp_dir, "first")
+        second = os.path.join(self.tmp_dir, "second")
+        for relpath in ["data/data.csv", "models/features.py", "bin/skaffold"]:
+            with open(os.path.join(first, relpath), "rb") as f1, \
+                    open(os.path.join(second, relpath), "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+        self.assertTrue(os.access(os.path.join(second, "bin", "skaffold"), os.X_OK))
+
+        # Data is shared with the store, metadata.yaml is a private copy
+        self.assertGreaterEqual(os.stat(os.path.join(second, "data", "data.csv")).st_nlink, 2)
+        with open(os.path.join(first, "metadata.yaml")) as fid:
+            self.assertIn("pipeline_name: first", fid.read())
+        with open(os.path.join(second, "metadata.yaml")) as fid:
+            self.assertIn("pipeline_name: second", fid.read())
+
+    def test_offline_without_cached_tool(self):
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline):
+            recipe_init.recipe_init("offline", self.tmp_dir)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, "offline", "metadata.yaml")))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "offline", "bin", "skaffold")))
+
+    def test_store_is_read_only_and_repaired_when_modified(self):
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline):
+            recipe_init.recipe_init("first", self.tmp_dir)
+        data = os.path.join(self.tmp_dir, "first", "data", "data.csv")
+        with open(data, "rb") as fid:
+            original = fid.read()
+        self.assertFalse(os.stat(data).st_mode & 0o222)
+        self.assertTrue(os.stat(os.path.join(self.tmp_dir, "first", "metadata.yaml")).st_mode & 0o200)
+
+        # Forced edit through the hard link, which modifies the store object
+        os.chmod(data, 0o644)
+        with open(data, "ab") as fid:
+            fid.write(b"edited\n")
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline):
+            recipe_init.recipe_init("second", self.tmp_dir)
+        with open(os.path.join(self.tmp_dir, "second", "data", "data.csv"), "rb") as fid:
+            self.assertEqual(original, fid.read())
+
+    def test_repeated_init_checks_the_store_by_stat(self):
+        with mock.patch("urllib.request.urlretrieve", side_effect=_fake_download):
+            recipe_init.recipe_init("first", self.tmp_dir)
+        recipe_init._verified.clear()  # as in a new process
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline), \
+                mock.patch.object(recipe_init, "_hash_file", wraps=recipe_init._hash_file) as hashed:
+            recipe_init.recipe_init("second", self.tmp_dir)
+        self.assertEqual(0, hashed.call_count)
+
+        # A store object whose stat changed is hashed again
+        data = os.path.join(self.tmp_dir, "second", "data", "data.csv")
+        os.utime(data, ns=(0, 0))
+        recipe_init._verified.clear()
+        with mock.patch("urllib.request.urlretrieve", side_effect=_offline), \
+                mock.patch.object(recipe_init, "_hash_file", wraps=recipe_init._hash_file) as hashed:
+            recipe_init.recipe_init("third", self.tmp_dir)
+        self.assertEqual(1, hashed.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+"""Tests for batch `recipe taste` against a fake `tfx` executable."""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import recipe_taste  # noqa: E402
+import recipe_utils  # noqa: E402
+
+# Fails the first `tfx run create` of pipelines named "flaky_*", the first
+# `tfx pipeline create` of pipelines named "partial_*" and every command of
+# pipelines named "broken_*"; logs the calls and their working directory in
+# $FAKE_TFX_STATE.
+FAKE_TFX = textwrap.dedent(
+    """\
+    #!/bin/bash
+    args="$*"
+    name=$(echo "$args" | grep -o -- '--pipeline-\\(name\\|path\\)=[^ ]*' | head -1)
+    echo "fake tfx $args"
+    echo "$PWD $1 $2" >> "$FAKE_TFX_STATE/calls"
+    case "$name" in
+      *broken_*) exit 2 ;;
+      *partial_*)
+        if [ "$1" == "pipeline" ] && [ "$2" == "create" ]; then
+          exit 1
+        fi ;;
+      *flaky_*)
+        if [ "$1" == "run" ] && [ ! -f "$FAKE_TFX_STATE/${name##*=}" ]; then
+          touch "$FAKE_TFX_STATE/${name##*=}"
+          exit 1
+        fi ;;
+    esac
+    echo "Run created for pipeline: ${name##*=}"
+    if [ "$1" == "run" ]; then
+      echo "| pipeline_name | run_id | status | created_at |"
+      echo "| ${name##*=} | 0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0 | Running | 2021-03-16 |"
+    fi
+    """
+)
+
+METADATA = textwrap.dedent(
+    """\
+    pipeline_name: {name}
+    pipeline_version: "0_0_0"
+    system_configurations:
+      GOOGLE_CLOUD_PROJECT:
+        type: string
+        value: project
+      TFX_IMAGE:
+        type: string
+        value: "gcr.io/{{{{ GOOGLE_CLOUD_PROJECT }}}}/tfx-pipeline"
+      ENDPOINT:
+        type: string
+        value: localhost
+      KUBEFLOW_RUNNER:
+        type: string
+        value: kubeflow_runner.py
+    """
+)
+
+
+class TasteTfxRecipesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        bin_dir = os.path.join(self.tmp_dir, "bin")
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, "tfx"), "w") as fid:
+            fid.write(FAKE_TFX)
+        os.chmod(os.path.join(bin_dir, "tfx"), 0o755)
+        os.makedirs(os.path.join(self.tmp_dir, "state"))
+        env = {
+            "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+            "FAKE_TFX_STATE": os.path.join(self.tmp_dir, "state"),
+        }
+        for patcher in [
+            mock.patch.dict(os.environ, env),
+            mock.patch.object(
+                recipe_utils, "METADATA_CACHE_DIR", os.path.join(self.tmp_dir, "cache")
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _make_pipeline(self, name):
+        pipeline_dir = os.path.join(self.tmp_dir, "pipelines", name)
+        os.makedirs(pipeline_dir)
+        metadata_yaml = os.path.join(pipeline_dir, "metadata.yaml")
+        with open(metadata_yaml, "w") as fid:
+            fid.write(METADATA.format(name=name))
+        return metadata_yaml
+
+    def test_batch_with_retries_and_failures(self):
+        names = ["ok_a", "flaky_b", "broken_c", "ok_d"]
+        metadata_yamls = [self._make_pipeline(name) for name in names]
+        results = recipe_taste.taste_tfx_recipes(
+            metadata_yamls, update=True, max_workers=2, retries=1
+        )
+        by_name = {result["pipeline"]: result for result in results}
+        self.assertEqual(names, [result["pipeline"] for result in results])
+        self.assertEqual("ok", by_name["ok_a"]["status"])
+        self.assertEqual(2, by_name["ok_a"]["attempts"])
+        self.assertEqual("ok", by_name["flaky_b"]["status"])
+        self.assertEqual(3, by_name["flaky_b"]["attempts"])
+        self.assertEqual("failed", by_name["broken_c"]["status"])
+        self.assertIn("exited with 2", by_name["broken_c"]["error"])
+        self.assertIsNone(by_name["broken_c"]["run_seconds"])
+        summary = recipe_taste.format_taste_summary(results)
+        self.assertIn("3 succeeded, 1 failed", summary)
+
+        outputs = by_name["flaky_b"]["outputs"]
+        self.assertEqual("0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0", outputs.run_id)
+        self.assertEqual("Running", outputs.run_status)
+        self.assertEqual([0, 1, 0], [c["returncode"] for c in outputs.commands])
+        with open(os.path.join(os.path.dirname(metadata_yamls[1]), "tfx_runs.jsonl")) as fid:
+            logged = [json.loads(line) for line in fid]
+        self.assertEqual(1, len(logged))
+        self.assertEqual("flaky_b", logged[0]["pipeline_name"])
+
+    def test_batch_runs_in_pipeline_dirs_and_retries_create_as_update(self):
+        metadata_yamls = [self._make_pipeline(name) for name in ["ok_a", "partial_b"]]
+        with mock.patch.object(recipe_taste, "set_tfx_environments"):
+            results = recipe_taste.taste_tfx_recipes(metadata_yamls, max_workers=2, retries=1)
+        self.assertEqual(["ok", "ok"], [result["status"] for result in results])
+        with open(os.path.join(self.tmp_dir, "state", "calls")) as fid:
+            calls = sorted(line.split() for line in fid)
+        pipeline_dirs = [os.path.dirname(f) for f in metadata_yamls]
+        self.assertEqual(
+            sorted(
+                [
+                    [pipeline_dirs[0], "pipeline", "create"],
+                    [pipeline_dirs[0], "run", "create"],
+                    [pipeline_dirs[1], "pipeline", "create"],
+                    [pipeline_dirs[1], "pipeline", "update"],
+                    [pipeline_dirs[1], "run", "create"],
+                ]
+            ),
+            calls,
+        )
+        for pipeline_dir in pipeline_dirs:
+            self.assertTrue(os.path.isfile(os.path.join(pipeline_dir, "metadata.frozen.json")))
+
+    def test_batch_reports_invalid_metadata(self):
+        missing = os.path.join(self.tmp_dir, "missing", "metadata.yaml")
+        results = recipe_taste.taste_tfx_recipes([missing], update=True)
+        self.assertEqual("failed", results[0]["status"])
+        self.assertIn("FileNotFoundError", results[0]["error"])
+
+
+class ParseTfxRunOutputTest(unittest.TestCase):
+    def test_streaming_parser(self):
+        now = [0.0]
+        output_parser = recipe_taste.TfxOutputParser(clock=lambda: now[0])
+        output_parser.start_command(["tfx", "pipeline", "create"])
+        for seconds, line in [
+            (1.0, "Step 1/2 : FROM tensorflow/tfx:0.26.0"),
+            (4.0, "Step 2/2 : WORKDIR /pipeline"),
+            (5.0, "Pipeline id: 11111111-2222-3333-4444-555555555555"),
+            (6.0, 'Pipeline "taxi" created successfully.'),
+            (7.0, "INFO:absl:Component CsvExampleGen is running."),
+            (9.5, "INFO:absl:Component CsvExampleGen is finished."),
+        ]:
+            now[0] = seconds
+            output_parser.feed(line)
+        now[0] = 10.0
+        output_parser.finish_command(0)
+
+        result = output_parser.result
+        self.assertEqual("taxi", result.pipeline_name)
+        self.assertEqual("11111111-2222-3333-4444-555555555555", result.pipeline_id)
+        self.assertEqual(
+            [("Step 1/2 : FROM tensorflow/tfx:0.26.0", 3.0),
+             ("Step 2/2 : WORKDIR /pipeline", 6.0),
+             ("CsvExampleGen", 2.5)],
+            [(step.name, step.seconds) for step in result.steps],
+        )
+        self.assertEqual(10.0, result.commands[0]["seconds"])
+        self.assertEqual(json.loads(json.dumps(result.to_dict())), result.to_dict())
+
+    def test_run_table(self):
+        result = recipe_taste.parse_tfx_run_output(
+            "Run created for pipeline: taxi\n"
+            "+---------------+--------------------------------------+---------+\n"
+            "| pipeline_name | run_id                               | status  |\n"
+            "+===============+======================================+=========+\n"
+            "| taxi          | 0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0 | Running |\n"
+        )
+        self.assertEqual("taxi", result.pipeline_name)
+        self.assertEqual("0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0", result.run_id)
+        self.assertEqual("Running", result.run_status)
+
+
+class InstallRequirementsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.requirements = os.path.join(self.tmp_dir, "requirements.txt")
+        with open(self.requirements, "w") as fid:
+            fid.write("tfx==0.26.0\n")
+        self.commands = []
+        self.returncodes = []
+
+        def _run_shell_command(command, verbose=True):
+            self.commands.append(command[3])  # pip subcommand
+            return (self.returncodes.pop(0) if self.returncodes else 0), ""
+
+        for patcher in [
+            mock.patch.object(recipe_taste, "run_shell_command", _run_shell_command),
+            mock.patch.object(
+                recipe_taste, "WHEELHOUSE_DIR", os.path.join(self.tmp_dir, "wheelhouse")
+            ),
+            mock.patch.object(
+                recipe_taste, "REQUIREMENTS_STAMP_DIR", os.path.join(self.tmp_dir, "stamps")
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_skips_unchanged_requirements(self):
+        # Wheelhouse misses a wheel: download it, then install offline
+        self.returncodes = [1, 0, 0]
+        self.assertTrue(recipe_taste.install_requirements(self.requirements))
+        self.assertEqual(["install", "wheel", "install"], self.commands)
+
+        self.commands = []
+        self.assertFalse(recipe_taste.install_requirements(self.requirements))
+        self.assertEqual([], self.commands)
+        self.assertTrue(recipe_taste.install_requirements(self.requirements, force=True))
+        self.assertEqual(["install"], self.commands)
+
+        with open(self.requirements, "a") as fid:
+            fid.write("kfp==1.0.0\n")
+        self.assertTrue(recipe_taste.install_requirements(self.requirements))
+
+    def test_failed_install_is_not_recorded(self):
+        self.returncodes = [1, 1]
+        with self.assertRaises(Exception):
+            recipe_taste.install_requirements(self.requirements)
+        self.returncodes = [0]
+        self.assertTrue(recipe_taste.install_requirements(self.requirements))
+
+
+if __name__ == "__main__":
+    unittest.main()
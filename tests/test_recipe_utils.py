@@ -0,0 +1,97 @@
+"""Tests for running shell commands with streamed, bounded output."""
+
+import os
+import sys
+import time
+import asyncio
+import shutil
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import recipe_utils  # noqa: E402
+
+# Prints its pid, then becomes a long sleep with the same pid
+_SLEEP = ["bash", "-c", "echo $$; exec sleep 30"]
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class RunShellCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_keeps_the_last_output_lines(self):
+        lines = []
+        returncode, output = recipe_utils.run_shell_command(
+            ["bash", "-c", "seq 1 20"], verbose=False, max_output_lines=3, on_line=lines.append
+        )
+        self.assertEqual(0, returncode)
+        self.assertEqual(["18", "19", "20"], output.split(os.linesep))
+        self.assertEqual([str(i) for i in range(1, 21)], lines)
+
+    def test_kills_the_command_on_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(subprocess.TimeoutExpired) as context:
+            recipe_utils.run_shell_command(_SLEEP, verbose=False, timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertFalse(_is_running(int(context.exception.output)))
+
+    def test_tee_file_gets_the_full_output(self):
+        tee_file = os.path.join(self.tmp_dir, "output.log")
+        _, output = recipe_utils.run_shell_command(
+            ["bash", "-c", "seq 1 20"], verbose=False, tee_file=tee_file, max_output_lines=1
+        )
+        self.assertEqual("20", output)
+        with open(tee_file) as fid:
+            self.assertEqual("".join(f"{i}\n" for i in range(1, 21)), fid.read())
+
+    def test_cancelling_kills_the_command(self):
+        pids = []
+
+        async def _cancel():
+            task = asyncio.ensure_future(
+                recipe_utils.run_shell_command_async(
+                    _SLEEP, verbose=False, on_line=lambda line: pids.append(int(line))
+                )
+            )
+            while not pids:
+                await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(asyncio.wait_for(_cancel(), 10))
+        self.assertFalse(_is_running(pids[0]))
+
+    def test_prefixed_commands(self):
+        results = recipe_utils.run_shell_commands(
+            {
+                "first": ["bash", "-c", "echo one"],
+                "second": ["bash", "-c", "echo two; exit 3"],
+            },
+            verbose=False,
+            tee_dir=self.tmp_dir,
+        )
+        self.assertEqual({"first": (0, "one"), "second": (3, "two")}, results)
+        with open(os.path.join(self.tmp_dir, "second.log")) as fid:
+            self.assertEqual("two\n", fid.read())
+
+    def test_prefixed_output(self):
+        with mock.patch("builtins.print") as print_:
+            recipe_utils.run_shell_commands({"first": ["echo", "one"], "second": ["echo", "two"]})
+        printed = sorted(call.args[0] for call in print_.call_args_list)
+        self.assertEqual(["[first] one", "[second] two"], printed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -29,4 +29,4 @@ SELECT pickup_community_area,
 FROM `bigquery-public-data.chicago_taxi_trips.taxi_trips`
 WHERE (
         ABS(FARM_FINGERPRINT(unique_key)) / 0x7FFFFFFFFFFFFFFF
-    ) < { { query_sample_rate } }
\ No newline at end of file
+    ) < {{ query_sample_rate }}
\ No newline at end of file
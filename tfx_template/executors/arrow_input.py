@@ -0,0 +1,233 @@
+"""Parquet / Arrow IPC ExampleGen executor with memory-mapped, projected reads.
+
+Columnar files skip CSV parsing altogether. Parquet row groups and Arrow IPC
+record batches are the units of work. Local files are memory-mapped, and only
+the columns features.py references (plus LABEL_KEY) are read and converted,
+so unused columns are never materialized. The batched serialization, hash
+splits and parallel shards are the ones of columnar_csv.
+
+Existing CSV drops convert with
+
+    python -m executors.arrow_input <csv_dir> <output_dir> --format parquet
+"""
+
+import os
+import functools
+from absl import logging
+from typing import Callable, Dict, List, Optional, Text, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import csv as pa_csv
+import tensorflow as tf
+
+from executors import columnar_csv
+from executors import custom_config
+from models import features
+
+FORMATS = ("parquet", "arrow")
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+# Rows per Parquet row group / Arrow record batch written by the converter
+DEFAULT_BATCH_ROWS = 256 * 1024
+# Bytes per block the converter infers the types of the non-feature columns on
+INFERENCE_BLOCK_BYTES = 1 << 20
+
+# A unit of work: (path, row group or record batch index)
+Unit = Tuple[Text, int]
+
+
+def projected_columns() -> List[Text]:
+    """Columns referenced by features.py, label included."""
+    columns = (
+        features.DENSE_FLOAT_FEATURE_KEYS
+        + features.BUCKET_FEATURE_KEYS
+        + features.CATEGORICAL_FEATURE_KEYS
+        + features.VOCAB_FEATURE_KEYS
+        + [features.LABEL_KEY]
+    )
+    return list(dict.fromkeys(columns))
+
+
+def _open(path: Text):
+    """Memory-map local files; other filesystems go through tf.io.gfile."""
+    if "://" not in path:
+        return pa.memory_map(path, "r")
+    return pa.PythonFile(tf.io.gfile.GFile(path, "rb"), mode="r")
+
+
+def plan_units(path: Text, data_format: Text) -> List[Unit]:
+    """One unit per row group (Parquet) or record batch (Arrow IPC)."""
+    with _open(path) as source:
+        if data_format == "parquet":
+            count = pq.ParquetFile(source).metadata.num_row_groups
+        else:
+            count = pa.ipc.open_file(source).num_record_batches
+    return [(path, index) for index in range(count)]
+
+
+def _cast(table: pa.Table) -> pa.Table:
+    """Cast the columns to the tf.Example value types of features.py."""
+    types_ = columnar_csv.feature_types()
+    arrays = []
+    for name in table.column_names:
+        target = columnar_csv._ARROW_TYPES[types_.get(name, "bytes")]  # pylint: disable=protected-access
+        column = table.column(name)
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = column.cast(pa.binary()) if target == pa.binary() else column
+        arrays.append(column if column.type == target else column.cast(target))
+    return pa.Table.from_arrays(arrays, table.column_names)
+
+
+def read_unit(unit: Unit, data_format: Text, columns: List[Text]) -> pa.Table:
+    """Read the projected `columns` of one row group / record batch."""
+    path, index = unit
+    with _open(path) as source:
+        if data_format == "parquet":
+            table = pq.ParquetFile(source).read_row_group(index, columns=columns)
+        else:
+            batch = pa.ipc.open_file(source).get_batch(index)
+            table = pa.Table.from_batches([batch]).select(columns)
+    return _cast(table)
+
+
+def plan_split(
+    files: List[Text], data_format: Text, columns: Optional[List[Text]] = None
+) -> Tuple[List[Unit], Callable[[Unit], pa.Table]]:
+    """Units of Parquet / Arrow `files` and the picklable function reading one."""
+    if data_format not in FORMATS:
+        raise(ValueError(f"Unrecognized data format: {data_format}, expected one of {FORMATS}"))
+    units = [unit for path in files for unit in plan_units(path, data_format)]
+    if not units:
+        raise RuntimeError(f"No rows in {files}")
+    read = functools.partial(read_unit, data_format=data_format, columns=columns or projected_columns())
+    return units, read
+
+
+def convert_split(
+    files: List[Text],
+    output_dirs: Dict[Text, Text],
+    data_format: Text,
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+    columns: Optional[List[Text]] = None,
+) -> Dict[Text, int]:
+    """Convert Parquet / Arrow `files` into TFRecord shards per output dir."""
+    units, read = plan_split(files, data_format, columns)
+    return columnar_csv.write_shards(units, read, output_dirs, buckets, num_shards)
+
+
+class Executor(columnar_csv.Executor):
+    """ExampleGen executor reading Parquet / Arrow IPC files.
+
+    Settings (see `arrow_input_config`): `data_format`, `num_shards` per split
+    and `columns`, the projection (features.py columns when empty).
+    """
+
+    _DEFAULTS = {"data_format": "parquet", "num_shards": 0, "columns": []}
+
+    def _convert(self, files, output_dirs, buckets, settings):
+        return convert_split(
+            files,
+            output_dirs,
+            settings["data_format"],
+            buckets=buckets,
+            num_shards=int(settings["num_shards"]),
+            columns=list(settings["columns"]) or None,
+        )
+
+
+def arrow_input_config(
+    data_format: Text, num_shards: Optional[int] = None, columns: Optional[List[Text]] = None
+):
+    """ExampleGen custom_config of the Parquet / Arrow executor."""
+    return custom_config.pack(
+        {"data_format": data_format, "num_shards": num_shards or 0, "columns": columns or []}
+    )
+
+
+def convert_csv(
+    csv_files: List[Text],
+    output_dir: Text,
+    data_format: Text = "parquet",
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+) -> List[Text]:
+    """Convert CSV drops into Parquet / Arrow IPC files, streaming.
+
+    The CSV files are read block by block, never whole; features.py fixes
+    the types of its columns, the others are inferred over every block of
+    the file, as columnar_csv does.
+    """
+    if data_format not in FORMATS:
+        raise(ValueError(f"Unrecognized data format: {data_format}, expected one of {FORMATS}"))
+    tf.io.gfile.makedirs(output_dir)
+    outputs = []
+    for csv_file in csv_files:
+        column_names, _ = columnar_csv.read_header(csv_file)
+        known = columnar_csv.infer_split_types(
+            columnar_csv.plan_blocks(csv_file, INFERENCE_BLOCK_BYTES), column_names
+        )
+        column_types = {
+            name: columnar_csv._ARROW_TYPES[kind]  # pylint: disable=protected-access
+            for name, kind in known.items()
+        }
+        name = os.path.splitext(os.path.basename(csv_file))[0]
+        output = os.path.join(output_dir, name + FILE_EXTENSIONS[data_format])
+        with tf.io.gfile.GFile(csv_file, "rb") as fid:
+            reader = pa_csv.open_csv(
+                fid,
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=column_types, strings_can_be_null=True
+                ),
+            )
+            with tf.io.gfile.GFile(output, "wb") as sink:
+                writer, rows, pending = None, 0, []
+                for batch in reader:
+                    pending.append(batch)
+                    rows += batch.num_rows
+                    if rows < batch_rows:
+                        continue
+                    writer = _write_batches(writer, sink, pending, data_format)
+                    pending, rows = [], 0
+                writer = _write_batches(writer, sink, pending, data_format, reader.schema)
+                writer.close()
+        logging.info("Converted %s to %s", csv_file, output)
+        outputs.append(output)
+    return outputs
+
+
+def _write_batches(writer, sink, batches, data_format, schema=None):
+    """Write `batches` as one row group / record batch, opening the writer."""
+    schema = batches[0].schema if batches else schema
+    if writer is None:
+        if data_format == "parquet":
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            writer = pa.ipc.new_file(sink, schema)
+    if batches:
+        table = pa.Table.from_batches(batches, schema)
+        if data_format == "parquet":
+            writer.write_table(table, row_group_size=table.num_rows)
+        else:
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [column.combine_chunks() for column in table.columns], table.column_names
+            ))
+    return writer
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert CSV drops to Parquet / Arrow IPC.")
+    parser.add_argument("csv_dir", help="Directory of the CSV files")
+    parser.add_argument("output_dir", help="Directory of the converted files")
+    parser.add_argument("--format", default="parquet", choices=FORMATS)
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS,
+                        help="Rows per row group / record batch")
+    args = parser.parse_args()
+    logging.set_verbosity(logging.INFO)
+    convert_csv(
+        sorted(tf.io.gfile.glob(os.path.join(args.csv_dir, "*.csv"))),
+        args.output_dir,
+        args.format,
+        args.batch_rows,
+    )
@@ -0,0 +1,302 @@
+"""Query based ExampleGen reusing the Examples of previous identical queries.
+
+BigQueryExampleGen runs its query on every execution, even when neither the
+rendered SQL nor the source tables changed. CachedQueryExampleGen keys the
+exported Examples on a hash of the rendered query, the output splits and a
+caller-supplied snapshot token (e.g. the last modification time or the date
+partition of the source table): on a hit the Examples are copied from the
+cache, on a miss the query runs once and its result is converted with the
+columnar writer of columnar_csv, then stored in the cache. The result is
+streamed: its record batches are spilled to local Arrow files as they
+arrive, which the shard processes then convert.
+
+The query engine is "bigquery", or "sqlite" (a local database standing in
+for the warehouse in tests and local runs). An empty snapshot token disables
+the cache: without it a changed table could not be told apart.
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import functools
+from absl import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Text
+
+import pyarrow as pa
+import tensorflow as tf
+from google.protobuf import json_format
+from tfx import types
+from tfx.components.example_gen import component as example_gen_component
+from tfx.components.example_gen import utils as example_gen_utils
+from tfx.dsl.components.base import base_executor
+from tfx.dsl.components.base import executor_spec
+from tfx.proto import example_gen_pb2
+from tfx.types import artifact_utils
+
+from executors import columnar_csv
+from executors import custom_config
+
+# Written last in a cache entry: entries without it are incomplete
+MARKER_FILE_NAME = "MATERIALIZED"
+# Rows fetched and converted at once
+BATCH_ROWS = 64 * 1024
+
+# A query engine runs a SQL query and streams its result as record batches
+Engine = Callable[[Text], Iterable[pa.RecordBatch]]
+
+
+def bigquery_engine(project: Optional[Text] = None) -> Engine:
+    """Runs queries on BigQuery, reading results with the Storage API when installed."""
+    from google.cloud import bigquery
+
+    client = bigquery.Client(project=project or None)
+    try:
+        from google.cloud import bigquery_storage
+
+        read_client = bigquery_storage.BigQueryReadClient()
+    except ImportError:  # pages of the REST API
+        read_client = None
+
+    def run(query: Text) -> Iterable[pa.RecordBatch]:
+        rows = client.query(query).result(page_size=BATCH_ROWS)
+        return rows.to_arrow_iterable(bqstorage_client=read_client)
+
+    return run
+
+
+def sqlite_engine(database: Text) -> Engine:
+    """Runs queries on a local SQLite database."""
+
+    def run(query: Text) -> Iterable[pa.RecordBatch]:
+        with sqlite3.connect(database) as connection:
+            cursor = connection.execute(query)
+            names = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                yield from pa.Table.from_pydict(
+                    {name: [row[i] for row in rows] for i, name in enumerate(names)}
+                ).to_batches()
+
+    return run
+
+
+def make_engine(settings: Dict[Text, Any]) -> Engine:
+    if settings["engine"] == "bigquery":
+        return bigquery_engine(settings["project"])
+    if settings["engine"] == "sqlite":
+        return sqlite_engine(settings["database"])
+    raise(ValueError(f"Unrecognized query engine: {settings['engine']}, expected bigquery or sqlite"))
+
+
+def cache_key(query: Text, snapshot_token: Text, splits: List[Text], buckets: Optional[List[int]]) -> Text:
+    """Hash of the rendered query, the snapshot token and the output splits.
+
+    The query is hashed as written: whitespace may be significant, e.g. in
+    string literals.
+    """
+    key = json.dumps([query, snapshot_token, splits, buckets])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _read_spilled(path: Text, kinds: Dict[Text, Text]) -> pa.Table:
+    """Rows of a spilled Arrow file, cast to their tf.Example value types."""
+    table = pa.ipc.open_file(path).read_all()
+    arrays = []
+    for name in table.column_names:
+        column = table.column(name)
+        target = columnar_csv._ARROW_TYPES[kinds[name]]  # pylint: disable=protected-access
+        if target == pa.binary() and not (
+            pa.types.is_binary(column.type) or pa.types.is_string(column.type) or pa.types.is_null(column.type)
+        ):
+            column = column.cast(pa.string())  # dates, timestamps, ...
+        arrays.append(column if column.type == target else column.cast(target))
+    return pa.Table.from_arrays(arrays, table.column_names)
+
+
+def export_query(
+    query: Text,
+    engine: Engine,
+    output_dirs: Dict[Text, Text],
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+) -> Dict[Text, int]:
+    """Run `query` and write its rows as TFRecord shards per output dir.
+
+    The result batches are spilled to local Arrow files of about BATCH_ROWS
+    rows, the units converted by the shard processes, so the result is never
+    held in memory at once.
+    """
+    spill_dir = tempfile.mkdtemp(prefix="cached_query_")
+    try:
+        units, batch_types, writer, schema, rows = [], [], None, None, 0
+        for batch in engine(query):
+            if not batch.num_rows:
+                continue
+            # Batches of different inferred schemas (e.g. SQLite) go to different files
+            if writer is None or rows >= BATCH_ROWS or not batch.schema.equals(schema):
+                if writer is not None:
+                    writer.close()
+                units.append(os.path.join(spill_dir, f"{len(units):05d}.arrow"))
+                writer, schema, rows = pa.ipc.new_file(units[-1], batch.schema), batch.schema, 0
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            batch_types.append(columnar_csv.schema_types(batch.schema))
+        if writer is None:
+            raise RuntimeError(f"Query returned no rows: {query}")
+        writer.close()
+
+        # Types of features.py, the others the widest inferred over the batches
+        known = {k: v for k, v in columnar_csv.feature_types().items() if k in schema.names}
+        unknown = [name for name in schema.names if name not in known]
+        kinds = {**columnar_csv.promote_column_types(batch_types, unknown), **known}
+        read = functools.partial(_read_spilled, kinds=kinds)
+        return columnar_csv.write_shards(units, read, output_dirs, buckets, num_shards)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _copy_tree(source: Text, destination: Text) -> None:
+    tf.io.gfile.makedirs(destination)
+    for name in tf.io.gfile.listdir(source):
+        tf.io.gfile.copy(os.path.join(source, name), os.path.join(destination, name), overwrite=True)
+
+
+def materialize(
+    query: Text,
+    snapshot_token: Text,
+    cache_dir: Text,
+    engine: Engine,
+    output_dirs: Dict[Text, Text],
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+) -> Dict[Text, int]:
+    """Examples of `query` in `output_dirs`, from the cache when already exported.
+
+    Returns the examples per split.
+    """
+    if not snapshot_token:
+        logging.info("No snapshot token, running the query")
+        return export_query(query, engine, output_dirs, buckets, num_shards)
+
+    entry = os.path.join(cache_dir, cache_key(query, snapshot_token, list(output_dirs), buckets))
+    marker = os.path.join(entry, MARKER_FILE_NAME)
+    if tf.io.gfile.exists(marker):
+        logging.info("Query materialized in %s, reusing its examples", entry)
+        with tf.io.gfile.GFile(marker, "r") as fid:
+            counts = json.load(fid)["counts"]
+    else:
+        logging.info("Query not materialized yet, exporting it to %s", entry)
+        if tf.io.gfile.exists(entry):  # left over by an interrupted export
+            tf.io.gfile.rmtree(entry)
+        counts = export_query(
+            query, engine, {split: os.path.join(entry, split) for split in output_dirs}, buckets, num_shards
+        )
+        with tf.io.gfile.GFile(marker, "w") as fid:
+            json.dump({"query": query, "snapshot_token": snapshot_token, "counts": counts}, fid)
+    for split, output_dir in output_dirs.items():
+        _copy_tree(os.path.join(entry, split), output_dir)
+    return counts
+
+
+class Executor(base_executor.BaseExecutor):
+    """Query based ExampleGen executor with a materialization cache.
+
+    The queries are the input split patterns, as for BigQueryExampleGen.
+    Settings (see `cached_query_config`): `cache_dir`, `snapshot_token`,
+    `engine` ("bigquery" or "sqlite"), `project` (BigQuery), `database`
+    (SQLite) and `num_shards` per split.
+    """
+
+    _DEFAULTS = {
+        "cache_dir": "",
+        "snapshot_token": "",
+        "engine": "bigquery",
+        "project": "",
+        "database": "",
+        "num_shards": 0,
+    }
+
+    def Do(
+        self,
+        input_dict: Dict[Text, List[types.Artifact]],
+        output_dict: Dict[Text, List[types.Artifact]],
+        exec_properties: Dict[Text, Any],
+    ) -> None:
+        self._log_startup(input_dict, output_dict, exec_properties)
+        settings = custom_config.unpack(exec_properties, self._DEFAULTS)
+        input_config = example_gen_pb2.Input()
+        json_format.Parse(exec_properties["input_config"], input_config)
+        output_config = example_gen_pb2.Output()
+        json_format.Parse(exec_properties["output_config"], output_config)
+
+        examples = artifact_utils.get_single_instance(output_dict["examples"])
+        split_names = example_gen_utils.generate_output_split_names(input_config, output_config)
+        examples.split_names = artifact_utils.encode_split_names(split_names)
+        examples.set_string_custom_property("payload_format", "FORMAT_TF_EXAMPLE")
+
+        engine = make_engine(settings)
+        patterns, buckets = columnar_csv.plan_outputs(input_config, output_config, split_names)
+        for query, outputs in patterns:
+            counts = materialize(
+                query,
+                settings["snapshot_token"],
+                settings["cache_dir"],
+                engine,
+                {split: os.path.join(examples.uri, split) for split in outputs},
+                buckets,
+                int(settings["num_shards"]),
+            )
+            logging.info("Examples per split: %s", counts)
+
+
+def cached_query_config(
+    cache_dir: Text,
+    snapshot_token: Optional[Text] = None,
+    engine: Text = "bigquery",
+    project: Optional[Text] = None,
+    database: Optional[Text] = None,
+    num_shards: Optional[int] = None,
+):
+    """ExampleGen custom_config of the cached query executor."""
+    return custom_config.pack(
+        {
+            "cache_dir": cache_dir,
+            "snapshot_token": snapshot_token or "",
+            "engine": engine,
+            "project": project or "",
+            "database": database or "",
+            "num_shards": num_shards or 0,
+        }
+    )
+
+
+class CachedQueryExampleGen(example_gen_component.QueryBasedExampleGen):
+    """BigQueryExampleGen reusing the Examples of an identical query and snapshot."""
+
+    EXECUTOR_SPEC = executor_spec.ExecutorClassSpec(Executor)
+
+    def __init__(
+        self,
+        query: Text,
+        cache_dir: Text,
+        snapshot_token: Optional[Text] = None,
+        engine: Text = "bigquery",
+        project: Optional[Text] = None,
+        database: Optional[Text] = None,
+        num_shards: Optional[int] = None,
+        output_config: Optional[example_gen_pb2.Output] = None,
+        instance_name: Optional[Text] = None,
+    ):
+        super(CachedQueryExampleGen, self).__init__(
+            input_config=example_gen_utils.make_default_input_config(query),
+            output_config=output_config,
+            custom_config=cached_query_config(
+                cache_dir, snapshot_token, engine, project, database, num_shards
+            ),
+            instance_name=instance_name,
+        )
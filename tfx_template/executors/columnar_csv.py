@@ -0,0 +1,448 @@
+"""Columnar CSV ExampleGen executor writing shards from parallel processes.
+
+The stock CsvExampleGen parses and converts the CSV one row at a time. This
+executor cuts the input files into line-aligned byte blocks, parses each
+block into Arrow columns with pyarrow (column types taken from features.py,
+inferred over all the blocks for the other columns), serializes the block's tf.Examples in
+one batch and streams them to its shard. `num_shards` processes each write
+one shard per output split, so the splits are written in parallel.
+
+Rows are assigned to hash-bucket output splits like the stock executor
+(sha256 of the serialized example). Like Beam's ReadFromText, the blocks
+assume that quoted fields contain no newlines.
+"""
+
+import io
+import os
+import bisect
+import hashlib
+import functools
+import multiprocessing
+from absl import logging
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+import tensorflow as tf
+from google.protobuf import json_format
+from tfx import types
+from tfx.components.example_gen import utils as example_gen_utils
+from tfx.dsl.components.base import base_executor
+from tfx.proto import example_gen_pb2
+from tfx.types import artifact_utils
+
+from executors import custom_config
+from models import features
+from utils import parallelism
+
+DEFAULT_BLOCK_MB = 64
+FILE_NAME = "data_tfrecord"
+# tf.Example value types of the Arrow columns
+_ARROW_TYPES = {"float": pa.float32(), "int": pa.int64(), "bytes": pa.binary()}
+# Value types from the narrowest to the widest, to promote inferred columns
+_PROMOTION = ("int", "float", "bytes")
+
+# A block of a CSV file: (path, start, end) byte offsets, header excluded
+Block = Tuple[Text, int, int]
+
+
+def feature_types() -> Dict[Text, Text]:
+    """tf.Example value type of the columns declared in features.py."""
+    types_ = {key: "float" for key in features.DENSE_FLOAT_FEATURE_KEYS}
+    types_.update({key: "float" for key in features.BUCKET_FEATURE_KEYS})
+    types_.update({key: "int" for key in features.CATEGORICAL_FEATURE_KEYS})
+    types_.update({key: "bytes" for key in features.VOCAB_FEATURE_KEYS})
+    types_[features.LABEL_KEY] = "int"
+    return types_
+
+
+def read_header(path: Text) -> Tuple[List[Text], int]:
+    """Column names of a CSV file and the byte size of its header line."""
+    with tf.io.gfile.GFile(path, "rb") as fid:
+        header = fid.readline()
+    return header.decode("utf-8").rstrip("\r\n").split(","), len(header)
+
+
+def plan_blocks(path: Text, block_bytes: int) -> List[Block]:
+    """Cut a file into byte ranges of about `block_bytes` after its header."""
+    _, start = read_header(path)
+    size = tf.io.gfile.stat(path).length
+    return [
+        (path, offset, min(offset + block_bytes, size))
+        for offset in range(start, size, block_bytes)
+    ]
+
+
+def read_block_bytes(block: Block) -> bytes:
+    """Lines starting in [start, end): a line belongs to the block it starts in."""
+    path, start, end = block
+    with tf.io.gfile.GFile(path, "rb") as fid:
+        fid.seek(start - 1)
+        fid.readline()  # skip the line started in the previous block, if any
+        position = fid.tell()
+        if position >= end:
+            return b""
+        data = fid.read(end - position)
+        if not data.endswith(b"\n"):
+            data += fid.readline()  # complete the line crossing the end
+    return data
+
+
+def parse_block(
+    data: bytes, column_names: List[Text], column_types: Dict[Text, Text]
+) -> pa.Table:
+    """Parse CSV bytes into Arrow columns; empty cells become nulls."""
+    return pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=column_names),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: _ARROW_TYPES[kind] for name, kind in column_types.items()},
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def _inferred_type(arrow_type: pa.DataType) -> Optional[Text]:
+    """tf.Example value type of a column pyarrow inferred, None when all empty."""
+    if pa.types.is_null(arrow_type):
+        return None
+    if pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type):
+        return "int"
+    if pa.types.is_floating(arrow_type):
+        return "float"
+    return "bytes"
+
+
+def infer_block_types(block: Block, column_names: List[Text], names: List[Text]) -> Dict[Text, Text]:
+    """Types pyarrow infers for the columns `names` of a block, empty ones left out."""
+    data = read_block_bytes(block)
+    if not data.strip():
+        return {}
+    table = pa_csv.read_csv(
+        io.BytesIO(data),
+        read_options=pa_csv.ReadOptions(column_names=column_names),
+        convert_options=pa_csv.ConvertOptions(include_columns=names, strings_can_be_null=True),
+    )
+    return schema_types(table.schema)
+
+
+def schema_types(schema: pa.Schema) -> Dict[Text, Text]:
+    """Types of the columns of an inferred schema, all-empty (null) ones left out."""
+    types_ = {field.name: _inferred_type(field.type) for field in schema}
+    return {name: kind for name, kind in types_.items() if kind is not None}
+
+
+def promote_column_types(block_types: List[Dict[Text, Text]], names: List[Text]) -> Dict[Text, Text]:
+    """Widest type of each column over the blocks, e.g. int and float to float."""
+    column_types = {}
+    for name in names:
+        kinds = [types_[name] for types_ in block_types if name in types_]
+        column_types[name] = max(kinds, key=_PROMOTION.index) if kinds else "bytes"
+    return column_types
+
+
+def _to_list_array(column: pa.Array) -> pa.Array:
+    """One-value lists, empty for nulls, as tf.Example features expect."""
+    valid = pc.is_valid(column).to_numpy(zero_copy_only=False)
+    offsets = np.zeros(len(column) + 1, dtype=np.int32)
+    np.cumsum(valid, out=offsets[1:])
+    return pa.ListArray.from_arrays(pa.array(offsets), column.filter(pc.is_valid(column)))
+
+
+def _serialize_rows(table: pa.Table) -> List[bytes]:
+    """Serialized tf.Examples of the rows, one Python loop per cell."""
+    columns = {name: table.column(name).to_pylist() for name in table.column_names}
+    kinds = {
+        field.name: "int" if pa.types.is_integer(field.type)
+        else "float" if pa.types.is_floating(field.type) else "bytes"
+        for field in table.schema
+    }
+    serialized = []
+    for row in range(table.num_rows):
+        example = tf.train.Example()
+        feature = example.features.feature
+        for name, values in columns.items():
+            value = values[row]
+            if kinds[name] == "int":
+                feature[name].int64_list.value.extend([] if value is None else [value])
+            elif kinds[name] == "float":
+                feature[name].float_list.value.extend([] if value is None else [value])
+            else:
+                feature[name].bytes_list.value.extend([] if value is None else [value])
+        serialized.append(example.SerializeToString())
+    return serialized
+
+
+def to_record_batch(table: pa.Table) -> pa.RecordBatch:
+    """The rows as a batch of list columns, the layout of decoded tf.Examples."""
+    return pa.RecordBatch.from_arrays(
+        [_to_list_array(table.column(name).combine_chunks()) for name in table.column_names],
+        table.column_names,
+    )
+
+
+def serialize_block(table: pa.Table) -> List[bytes]:
+    """Serialized tf.Examples of a parsed block, converted column by column."""
+    try:
+        from tfx_bsl.coders import example_coder
+
+        to_examples = example_coder.RecordBatchToExamples
+    except (ImportError, AttributeError):  # older tfx_bsl
+        return _serialize_rows(table)
+    return to_examples(to_record_batch(table))
+
+
+def read_csv_block(
+    block: Block, column_names: List[Text], column_types: Dict[Text, Text]
+) -> Optional[pa.Table]:
+    """Parsed rows of a block, None when it holds none."""
+    data = read_block_bytes(block)
+    if not data.strip():
+        return None
+    return parse_block(data, column_names, column_types)
+
+
+def _write_shard(task: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Worker: convert the units of one shard and write it to every split.
+
+    Returns the examples written per split and, with a `combine_fn`, its
+    accumulator per split over the rows of that split.
+    """
+    splits, buckets, read = task["splits"], task["buckets"], task["read"]
+    combine_fn = task["combine_fn"]
+    writers = {
+        split: tf.io.TFRecordWriter(os.path.join(output_dir, task["file_name"]), options="GZIP")
+        for split, output_dir in splits.items()
+    }
+    split_names = list(splits)
+    counts = dict.fromkeys(split_names, 0)
+    accumulators = (
+        {split: combine_fn.create_accumulator() for split in split_names} if combine_fn else None
+    )
+    try:
+        for unit in task["units"]:
+            table = read(unit)
+            if table is None or not table.num_rows:
+                continue
+            rows = {split: [] for split in split_names}
+            for row, record in enumerate(serialize_block(table)):
+                if buckets:
+                    bucket = int(hashlib.sha256(record).hexdigest(), 16) % buckets[-1]
+                    split = split_names[bisect.bisect(buckets, bucket)]
+                else:
+                    split = split_names[0]
+                writers[split].write(record)
+                rows[split].append(row)
+            for split, indices in rows.items():
+                counts[split] += len(indices)
+                if combine_fn and indices:
+                    subset = table if len(indices) == table.num_rows else table.take(pa.array(indices))
+                    accumulators[split] = combine_fn.add_input(
+                        accumulators[split], to_record_batch(subset)
+                    )
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {"counts": counts, "accumulators": accumulators}
+
+
+def combine_shards(
+    units: List[Any],
+    read: Callable[[Any], Optional[pa.Table]],
+    output_dirs: Dict[Text, Text],
+    combine_fn: Any = None,
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+) -> Tuple[Dict[Text, int], Optional[Dict[Text, Any]]]:
+    """`write_shards`, also folding the written rows of each split into `combine_fn`.
+
+    `combine_fn` follows the beam.CombineFn protocol (create_accumulator,
+    add_input, merge_accumulators, extract_output) and receives the rows as
+    record batches of list columns, like decoded tf.Examples. Each shard
+    process accumulates its rows; the accumulators are merged here. Returns
+    the examples written per split and the extracted output per split (None
+    without `combine_fn`).
+    """
+    num_shards = max(1, min(num_shards or parallelism.available_cpus(), len(units)))
+    for output_dir in output_dirs.values():
+        tf.io.gfile.makedirs(output_dir)
+    tasks = [
+        {
+            "units": units[shard::num_shards],
+            "read": read,
+            "splits": output_dirs,
+            "buckets": buckets,
+            "combine_fn": combine_fn,
+            "file_name": f"{FILE_NAME}-{shard:05d}-of-{num_shards:05d}.gz",
+        }
+        for shard in range(num_shards)
+    ]
+    logging.info("Converting %d units into %d shards per split", len(units), num_shards)
+    if num_shards == 1:
+        results = [_write_shard(tasks[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(num_shards) as pool:
+            results = pool.map(_write_shard, tasks)
+    counts = {split: sum(result["counts"][split] for result in results) for split in output_dirs}
+    if combine_fn is None:
+        return counts, None
+    outputs = {
+        split: combine_fn.extract_output(
+            combine_fn.merge_accumulators([result["accumulators"][split] for result in results])
+        )
+        for split in output_dirs
+    }
+    return counts, outputs
+
+
+def write_shards(
+    units: List[Any],
+    read: Callable[[Any], Optional[pa.Table]],
+    output_dirs: Dict[Text, Text],
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+) -> Dict[Text, int]:
+    """Convert the Arrow tables read from `units` into TFRecord shards.
+
+    `read` must be picklable (e.g. a functools.partial of a module level
+    function): every shard is written by its own spawned process. `buckets`
+    are the cumulative hash buckets of the output splits, in the order of
+    `output_dirs`; without them all rows go to the single output. Returns the
+    number of examples written per split.
+    """
+    counts, _ = combine_shards(units, read, output_dirs, None, buckets, num_shards)
+    return counts
+
+
+def infer_split_types(blocks: List[Block], column_names: List[Text]) -> Dict[Text, Text]:
+    """Types of the columns: features.py's, the others inferred over `blocks`.
+
+    Every block is inferred on (in parallel), so that a value of a later
+    block never fails to convert to the type inferred on the first.
+    """
+    known = {k: v for k, v in feature_types().items() if k in column_names}
+    column_types = dict(known)
+    unknown = [name for name in column_names if name not in known]
+    if unknown:
+        infer = functools.partial(infer_block_types, column_names=column_names, names=unknown)
+        processes = max(1, min(parallelism.available_cpus(), len(blocks)))
+        if processes == 1:
+            block_types = list(map(infer, blocks))
+        else:
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                block_types = pool.map(infer, blocks)
+        column_types.update(promote_column_types(block_types, unknown))
+    return column_types
+
+
+def plan_split(
+    files: List[Text], block_mb: float = DEFAULT_BLOCK_MB
+) -> Tuple[List[Block], Callable[[Block], Optional[pa.Table]]]:
+    """Blocks of CSV `files` and the picklable function reading one of them."""
+    column_names, _ = read_header(files[0])
+    for path in files[1:]:
+        if read_header(path)[0] != column_names:
+            raise RuntimeError(f"Files {files[0]} and {path} have different headers.")
+    blocks = [b for path in files for b in plan_blocks(path, int(block_mb * 1024 ** 2))]
+    if not any(read_block_bytes(block).strip() for block in blocks):
+        raise RuntimeError(f"No rows in {files}")
+
+    read = functools.partial(
+        read_csv_block,
+        column_names=column_names,
+        column_types=infer_split_types(blocks, column_names),
+    )
+    return blocks, read
+
+
+def convert_split(
+    files: List[Text],
+    output_dirs: Dict[Text, Text],
+    buckets: Optional[List[int]] = None,
+    num_shards: Optional[int] = None,
+    block_mb: float = DEFAULT_BLOCK_MB,
+) -> Dict[Text, int]:
+    """Convert CSV `files` into `num_shards` TFRecord shards per output dir."""
+    blocks, read = plan_split(files, block_mb)
+    return write_shards(blocks, read, output_dirs, buckets, num_shards)
+
+
+def plan_outputs(
+    input_config: example_gen_pb2.Input,
+    output_config: example_gen_pb2.Output,
+    split_names: List[Text],
+) -> Tuple[List[Tuple[Text, List[Text]]], Optional[List[int]]]:
+    """(input pattern, output splits) pairs and the cumulative hash buckets.
+
+    A single input split is hashed into the output splits; otherwise each
+    input split is written as is and there are no buckets.
+    """
+    if output_config.split_config.splits:
+        cumulative, buckets = 0, []
+        for split in output_config.split_config.splits:
+            cumulative += split.hash_buckets
+            buckets.append(cumulative)
+        return [(input_config.splits[0].pattern, split_names)], buckets
+    return [(split.pattern, [split.name]) for split in input_config.splits], None
+
+
+class Executor(base_executor.BaseExecutor):
+    """ExampleGen executor converting CSV files with `convert_split`.
+
+    Settings (see `ingestion_config`): `num_shards` per split (one per
+    available CPU when 0) and `block_mb`, the size of the parsed blocks.
+    Subclasses reading other formats override `_DEFAULTS` and `_convert`.
+    """
+
+    _DEFAULTS = {"num_shards": 0, "block_mb": DEFAULT_BLOCK_MB}
+
+    def _convert(
+        self,
+        files: List[Text],
+        output_dirs: Dict[Text, Text],
+        buckets: Optional[List[int]],
+        settings: Dict[Text, Any],
+    ) -> Dict[Text, int]:
+        return convert_split(
+            files,
+            output_dirs,
+            buckets=buckets,
+            num_shards=int(settings["num_shards"]),
+            block_mb=float(settings["block_mb"]),
+        )
+
+    def Do(
+        self,
+        input_dict: Dict[Text, List[types.Artifact]],
+        output_dict: Dict[Text, List[types.Artifact]],
+        exec_properties: Dict[Text, Any],
+    ) -> None:
+        self._log_startup(input_dict, output_dict, exec_properties)
+        settings = custom_config.unpack(exec_properties, self._DEFAULTS)
+        input_config = example_gen_pb2.Input()
+        json_format.Parse(exec_properties["input_config"], input_config)
+        output_config = example_gen_pb2.Output()
+        json_format.Parse(exec_properties["output_config"], output_config)
+
+        examples = artifact_utils.get_single_instance(output_dict["examples"])
+        split_names = example_gen_utils.generate_output_split_names(input_config, output_config)
+        examples.split_names = artifact_utils.encode_split_names(split_names)
+        examples.set_string_custom_property("payload_format", "FORMAT_TF_EXAMPLE")
+
+        patterns, buckets = plan_outputs(input_config, output_config, split_names)
+        for pattern, outputs in patterns:
+            files = sorted(tf.io.gfile.glob(os.path.join(exec_properties["input_base"], pattern)))
+            if not files:
+                raise RuntimeError(f"Split pattern {pattern} does not match any files.")
+            output_dirs = {split: os.path.join(examples.uri, split) for split in outputs}
+            counts = self._convert(files, output_dirs, buckets, settings)
+            logging.info("Examples written per split: %s", counts)
+
+
+def ingestion_config(num_shards: Optional[int] = None, block_mb: Optional[float] = None):
+    """ExampleGen custom_config of the columnar executor."""
+    return custom_config.pack(
+        {"num_shards": num_shards or 0, "block_mb": block_mb or DEFAULT_BLOCK_MB}
+    )
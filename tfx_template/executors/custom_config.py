@@ -0,0 +1,34 @@
+"""Settings of the custom ExampleGen executors, passed as `custom_config`.
+
+FileBasedExampleGen only forwards its `custom_config` proto to the executor,
+so the settings are packed into a Struct inside it and unpacked from the
+serialized exec property on the executor side.
+"""
+
+from typing import Any, Dict, Text
+
+from google.protobuf import json_format
+from google.protobuf import struct_pb2
+from tfx.proto import example_gen_pb2
+
+
+def pack(settings: Dict[Text, Any]) -> example_gen_pb2.CustomConfig:
+    """ExampleGen custom_config carrying `settings` (JSON values)."""
+    struct = struct_pb2.Struct()
+    struct.update(settings)
+    config = example_gen_pb2.CustomConfig()
+    config.custom_config.Pack(struct)
+    return config
+
+
+def unpack(exec_properties: Dict[Text, Any], defaults: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Settings packed by `pack`, completed with `defaults`."""
+    settings = dict(defaults)
+    serialized = exec_properties.get("custom_config")
+    if serialized:
+        config = example_gen_pb2.CustomConfig()
+        json_format.Parse(serialized, config)
+        struct = struct_pb2.Struct()
+        config.custom_config.Unpack(struct)
+        settings.update(json_format.MessageToDict(struct))
+    return settings
@@ -0,0 +1,243 @@
+"""ExampleGen computing the statistics of the examples while writing them.
+
+StatisticsGen reads back every example ExampleGen just wrote. FusedExampleGen
+instead folds the rows of each split into TFDV's statistics generators in the
+shard processes that serialize them (see `columnar_csv.combine_shards`), and
+emits the `statistics` artifact next to `examples`, in the layout of
+StatisticsGen, so SchemaGen and ExampleValidator consume it unchanged.
+
+CSV inputs go through columnar_csv, Parquet / Arrow IPC through arrow_input.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Text
+
+import tensorflow as tf
+import tensorflow_data_validation as tfdv
+from tensorflow_data_validation.statistics import stats_impl
+from tensorflow_metadata.proto.v0 import statistics_pb2
+from tfx import types
+from tfx.components.example_gen import component as example_gen_component
+from tfx.components.example_gen import utils as example_gen_utils
+from tfx.dsl.components.base import base_component
+from tfx.dsl.components.base import executor_spec
+from tfx.proto import example_gen_pb2
+from tfx.types import artifact_utils
+from tfx.types import standard_artifacts
+from tfx.types.component_spec import ChannelParameter
+
+from executors import arrow_input
+from executors import columnar_csv
+from executors import custom_config
+
+# File name of the statistics of a split, as written by StatisticsGen
+STATS_FILE_NAME = "stats_tfrecord"
+
+
+def _merge_outputs(
+    outputs: List[statistics_pb2.DatasetFeatureStatistics], num_examples: int
+) -> statistics_pb2.DatasetFeatureStatisticsList:
+    """One dataset of the feature statistics produced by the different generators."""
+    dataset = statistics_pb2.DatasetFeatureStatistics(num_examples=num_examples)
+    features = {}
+    for output in outputs:
+        for feature in output.features:
+            key = feature.path.SerializeToString() if feature.HasField("path") else feature.name
+            if key not in features:
+                features[key] = dataset.features.add()
+                features[key].CopyFrom(feature)
+                continue
+            partial = statistics_pb2.FeatureNameStatistics()
+            partial.CopyFrom(feature)
+            partial.ClearField("path")
+            partial.ClearField("name")
+            features[key].MergeFrom(partial)
+        dataset.cross_features.extend(output.cross_features)
+    return statistics_pb2.DatasetFeatureStatisticsList(datasets=[dataset])
+
+
+class StatisticsCombineFn(object):
+    """TFDV's in-memory statistics generators, combined as one beam.CombineFn-like object.
+
+    Accumulators are (number of rows, [accumulator per generator]) and are
+    picklable, so shard processes accumulate and the caller merges. Input
+    record batches are sliced to `desired_batch_size` rows, when set.
+    """
+
+    def __init__(self, options: Optional[tfdv.StatsOptions] = None):
+        self._options = options or tfdv.StatsOptions()
+        self._generators = None
+
+    def __getstate__(self):
+        return {"_options": self._options, "_generators": None}
+
+    @property
+    def generators(self):
+        if self._generators is None:
+            self._generators = stats_impl.get_generators(self._options, in_memory=True)
+            for generator in self._generators:
+                if hasattr(generator, "setup"):
+                    generator.setup()
+        return self._generators
+
+    def create_accumulator(self):
+        return 0, [generator.create_accumulator() for generator in self.generators]
+
+    def _batches(self, record_batch):
+        """`record_batch` in slices of at most `desired_batch_size` rows."""
+        batch_size = self._options.desired_batch_size
+        if not batch_size or record_batch.num_rows <= batch_size:
+            return [record_batch]
+        return [
+            record_batch.slice(offset, batch_size)
+            for offset in range(0, record_batch.num_rows, batch_size)
+        ]
+
+    def add_input(self, accumulator, record_batch):
+        num_examples, partials = accumulator
+        for batch in self._batches(record_batch):
+            partials = [
+                generator.add_input(partial, batch)
+                for generator, partial in zip(self.generators, partials)
+            ]
+        return num_examples + record_batch.num_rows, partials
+
+    def merge_accumulators(self, accumulators):
+        accumulators = list(accumulators)
+        return sum(num_examples for num_examples, _ in accumulators), [
+            generator.merge_accumulators(list(partials))
+            for generator, partials in zip(
+                self.generators, zip(*[partials for _, partials in accumulators])
+            )
+        ]
+
+    def extract_output(self, accumulator) -> statistics_pb2.DatasetFeatureStatisticsList:
+        num_examples, partials = accumulator
+        return _merge_outputs(
+            [generator.extract_output(partial) for generator, partial in zip(self.generators, partials)],
+            num_examples,
+        )
+
+
+def write_statistics(
+    statistics: Dict[Text, statistics_pb2.DatasetFeatureStatisticsList], artifact: types.Artifact
+) -> None:
+    """Write the statistics of each split into an ExampleStatistics artifact."""
+    artifact.split_names = artifact_utils.encode_split_names(list(statistics))
+    for split, stats in statistics.items():
+        output_dir = os.path.join(artifact.uri, split)
+        tf.io.gfile.makedirs(output_dir)
+        with tf.io.TFRecordWriter(os.path.join(output_dir, STATS_FILE_NAME)) as writer:
+            writer.write(stats.SerializeToString())
+
+
+class Executor(columnar_csv.Executor):
+    """Columnar ExampleGen executor also writing the `statistics` output.
+
+    Settings (see `fused_config`): `data_format` of the inputs, `num_shards`,
+    `block_mb` (CSV), `columns` (Parquet / Arrow) and `desired_batch_size` of
+    the statistics (TFDV default when 0).
+    """
+
+    _DEFAULTS = {
+        "data_format": "csv",
+        "num_shards": 0,
+        "block_mb": columnar_csv.DEFAULT_BLOCK_MB,
+        "columns": [],
+        "desired_batch_size": 0,
+    }
+
+    def _convert(self, files, output_dirs, buckets, settings):
+        if settings["data_format"] == "csv":
+            units, read = columnar_csv.plan_split(files, float(settings["block_mb"]))
+        else:
+            units, read = arrow_input.plan_split(
+                files, settings["data_format"], list(settings["columns"]) or None
+            )
+        options = tfdv.StatsOptions()
+        if settings["desired_batch_size"]:
+            options.desired_batch_size = int(settings["desired_batch_size"])
+        counts, statistics = columnar_csv.combine_shards(
+            units,
+            read,
+            output_dirs,
+            StatisticsCombineFn(options),
+            buckets=buckets,
+            num_shards=int(settings["num_shards"]),
+        )
+        self._statistics.update(statistics)
+        return counts
+
+    def Do(
+        self,
+        input_dict: Dict[Text, List[types.Artifact]],
+        output_dict: Dict[Text, List[types.Artifact]],
+        exec_properties: Dict[Text, Any],
+    ) -> None:
+        self._statistics = {}
+        super(Executor, self).Do(input_dict, output_dict, exec_properties)
+        write_statistics(
+            self._statistics, artifact_utils.get_single_instance(output_dict["statistics"])
+        )
+
+
+def fused_config(
+    data_format: Text = "csv",
+    num_shards: Optional[int] = None,
+    block_mb: Optional[float] = None,
+    desired_batch_size: Optional[int] = None,
+):
+    """ExampleGen custom_config of the fused executor."""
+    return custom_config.pack(
+        {
+            "data_format": data_format,
+            "num_shards": num_shards or 0,
+            "block_mb": block_mb or columnar_csv.DEFAULT_BLOCK_MB,
+            "columns": [],
+            "desired_batch_size": desired_batch_size or 0,
+        }
+    )
+
+
+class FusedExampleGenSpec(types.ComponentSpec):
+    """FileBasedExampleGen spec with a `statistics` output."""
+
+    PARAMETERS = example_gen_component.FileBasedExampleGen.SPEC_CLASS.PARAMETERS
+    INPUTS = example_gen_component.FileBasedExampleGen.SPEC_CLASS.INPUTS
+    OUTPUTS = {
+        **example_gen_component.FileBasedExampleGen.SPEC_CLASS.OUTPUTS,
+        "statistics": ChannelParameter(type=standard_artifacts.ExampleStatistics),
+    }
+
+
+class FusedExampleGen(base_component.BaseComponent):
+    """File based ExampleGen emitting the `examples` and their `statistics` in one pass.
+
+    Spans, versions and input patterns are resolved by the FileBasedExampleGen
+    driver.
+    """
+
+    SPEC_CLASS = FusedExampleGenSpec
+    EXECUTOR_SPEC = executor_spec.ExecutorClassSpec(Executor)
+    DRIVER_CLASS = example_gen_component.FileBasedExampleGen.DRIVER_CLASS
+
+    def __init__(
+        self,
+        input_base: Text,
+        input_config: Optional[example_gen_pb2.Input] = None,
+        output_config: Optional[example_gen_pb2.Output] = None,
+        custom_config: Optional[example_gen_pb2.CustomConfig] = None,
+        instance_name: Optional[Text] = None,
+    ):
+        input_config = input_config or example_gen_utils.make_default_input_config()
+        output_config = output_config or example_gen_utils.make_default_output_config(input_config)
+        spec = FusedExampleGenSpec(
+            input_base=input_base,
+            input_config=input_config,
+            output_config=output_config,
+            custom_config=custom_config,
+            output_data_format=example_gen_pb2.FORMAT_TF_EXAMPLE,
+            examples=types.Channel(type=standard_artifacts.Examples),
+            statistics=types.Channel(type=standard_artifacts.ExampleStatistics),
+        )
+        super(FusedExampleGen, self).__init__(spec=spec, instance_name=instance_name)
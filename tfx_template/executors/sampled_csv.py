@@ -0,0 +1,115 @@
+"""CsvExampleGen executor keeping a deterministic hash sample of the rows.
+
+The counterpart of the BigQuery sampling in data/data.sql
+(`FARM_FINGERPRINT(unique_key) < query_sample_rate`) for CSV inputs: a row is
+kept when the hash of its key, mapped to [0, 1), is below the sample rate.
+The key is the raw line, or the value of `sample_key` when given, so the
+same rows are selected on every run. Lines are filtered while they stream
+from ReadFromText, before being parsed (the `sample_key` value is cut from
+the line with a plain split, a line with quotes is read with the csv module),
+so iterating on a sample of a multi-GB CSV only parses and converts the
+sampled rows.
+"""
+
+import os
+import csv
+import hashlib
+from absl import logging
+from typing import Any, Dict, Optional, Text, Union
+
+import apache_beam as beam
+import tensorflow as tf
+from tfx.components.example_gen.base_example_gen_executor import BaseExampleGenExecutor
+from tfx.components.example_gen.csv_example_gen import executor as csv_executor
+from tfx.proto import example_gen_pb2
+from tfx.utils import io_utils
+from tfx_bsl.coders import csv_decoder
+
+from executors import custom_config
+
+_HASH_RANGE = float(2 ** 64)
+
+
+def hash_fraction(key: Union[bytes, Text]) -> float:
+    """Deterministic, uniformly distributed position of `key` in [0, 1)."""
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") / _HASH_RANGE
+
+
+def line_key(line: Text, key_index: int) -> Text:
+    """Value of the column `key_index` of a CSV line, '' when the line is shorter."""
+    if '"' in line:  # quoted fields may hold commas
+        fields = next(csv.reader([line]), [])
+    else:
+        fields = line.split(",", key_index + 1)
+    return fields[key_index] if key_index < len(fields) else ""
+
+
+def sampling_config(
+    sample_rate: float, sample_key: Optional[Text] = None
+) -> example_gen_pb2.CustomConfig:
+    """ExampleGen custom_config carrying the sampling settings."""
+    return custom_config.pack({"sample_rate": float(sample_rate), "sample_key": sample_key or ""})
+
+
+@beam.ptransform_fn
+@beam.typehints.with_input_types(beam.Pipeline)
+@beam.typehints.with_output_types(tf.train.Example)
+def _SampledCsvToExample(  # pylint: disable=invalid-name
+    pipeline: beam.Pipeline, exec_properties: Dict[Text, Any], split_pattern: Text
+) -> beam.pvalue.PCollection:
+    """Read the CSV files of a split, keeping a hash sample of the rows."""
+    settings = custom_config.unpack(exec_properties, {"sample_rate": 1.0, "sample_key": ""})
+    sample_rate, sample_key = settings["sample_rate"], settings["sample_key"]
+    csv_pattern = os.path.join(exec_properties["input_base"], split_pattern)
+    logging.info(
+        "Processing a %.4g sample of input csv data %s to TFExample.", sample_rate, csv_pattern
+    )
+
+    csv_files = tf.io.gfile.glob(csv_pattern)
+    if not csv_files:
+        raise RuntimeError(f"Split pattern {csv_pattern} does not match any files.")
+    column_names = io_utils.load_csv_column_names(csv_files[0])
+    for csv_file in csv_files[1:]:
+        if io_utils.load_csv_column_names(csv_file) != column_names:
+            raise RuntimeError(f"Files in same split {csv_pattern} have different header.")
+
+    lines = pipeline | "ReadFromText" >> beam.io.ReadFromText(
+        file_pattern=csv_pattern, skip_header_lines=1
+    )
+    # Hash the raw line or its key, before paying for the parsing
+    if sample_key:
+        if sample_key not in column_names:
+            raise ValueError(f"sample_key {sample_key} is not a column of {csv_pattern}")
+        key_index = column_names.index(sample_key)
+        lines = lines | "SampleRows" >> beam.Filter(
+            lambda line: hash_fraction(line_key(line, key_index)) < sample_rate
+        )
+    else:
+        lines = lines | "SampleLines" >> beam.Filter(
+            lambda line: hash_fraction(line) < sample_rate
+        )
+    parsed_csv_lines = (
+        lines
+        | "ParseCSVLine" >> beam.ParDo(csv_decoder.ParseCSVLine(delimiter=","))
+        | "ExtractParsedCSVLines" >> beam.Keys()
+    )
+
+    column_infos = beam.pvalue.AsSingleton(
+        parsed_csv_lines
+        | "InferColumnTypes"
+        >> beam.CombineGlobally(
+            csv_decoder.ColumnTypeInferrer(column_names, skip_blank_lines=True)
+        )
+    )
+    return parsed_csv_lines | "ToTFExample" >> beam.ParDo(
+        csv_executor._ParsedCsvToTfExample(), column_infos  # pylint: disable=protected-access
+    )
+
+
+class Executor(BaseExampleGenExecutor):
+    """CSV ExampleGen executor sampling rows by hash (see module docstring)."""
+
+    def GetInputSourceToExamplePTransform(self) -> beam.PTransform:
+        return _SampledCsvToExample
@@ -0,0 +1,174 @@
+"""Statistics of a span window, merged from per-span cached accumulators.
+
+StatisticsGen recomputes the statistics of every example on every run.
+SpanStatisticsGen keeps the TFDV accumulators of each span and split (counts,
+moments, quantile sketches, top-k: `fused_stats.StatisticsCombineFn`) in a
+cache keyed by the span fingerprint, so a run only reads the spans it has not
+seen; the accumulators of the window are then merged into the dataset-level
+statistics, written in the layout of StatisticsGen for SchemaGen and
+ExampleValidator.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+from absl import logging
+from typing import Any, Dict, List, Optional, Text
+
+import tensorflow as tf
+import tensorflow_data_validation as tfdv
+from tfx import types
+from tfx.dsl.components.base import base_component
+from tfx.dsl.components.base import base_executor
+from tfx.dsl.components.base import executor_spec
+from tfx.types import artifact_utils
+from tfx.types import standard_artifacts
+from tfx.types.component_spec import ChannelParameter
+from tfx.types.component_spec import ExecutionParameter
+from tfx_bsl.coders import example_coder
+
+from executors import fused_stats
+
+# Serialized examples decoded into one record batch
+DECODE_BATCH_SIZE = 1000
+FINGERPRINT_PROPERTY_NAME = "input_fingerprint"
+
+
+def span_key(examples: types.Artifact, split: Text) -> Text:
+    """Cache key of a split of a span: its input fingerprint, span and version.
+
+    The uri is part of the key too: ingesting the same input with another
+    ExampleGen configuration (sampling, format, columns, splits) produces a new
+    artifact, whose accumulators must not be taken from the previous one.
+    """
+    fingerprint = examples.get_string_custom_property(FINGERPRINT_PROPERTY_NAME)
+    key = json.dumps(
+        [fingerprint, examples.uri, examples.span, examples.version, split, tfdv.__version__]
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class AccumulatorCache(object):
+    """Pickled accumulators under `cache_dir`, one file per key."""
+
+    def __init__(self, cache_dir: Text):
+        self._cache_dir = cache_dir
+
+    def _path(self, key: Text) -> Text:
+        return os.path.join(self._cache_dir, key + ".pkl")
+
+    def get(self, key: Text) -> Optional[Any]:
+        path = self._path(key)
+        if not tf.io.gfile.exists(path):
+            return None
+        with tf.io.gfile.GFile(path, "rb") as fid:
+            return pickle.loads(fid.read())
+
+    def put(self, key: Text, accumulator: Any) -> None:
+        tf.io.gfile.makedirs(self._cache_dir)
+        path = self._path(key)
+        with tf.io.gfile.GFile(path + ".tmp", "wb") as fid:
+            fid.write(pickle.dumps(accumulator))
+        tf.io.gfile.rename(path + ".tmp", path, overwrite=True)  # readers never see partial files
+
+
+def accumulate_split(
+    examples: types.Artifact, split: Text, combine_fn: fused_stats.StatisticsCombineFn
+) -> Any:
+    """Accumulator of the statistics of one split of an Examples artifact."""
+    split_uri = artifact_utils.get_split_uri([examples], split)
+    files = tf.io.gfile.glob(os.path.join(split_uri, "*"))
+    if not files:
+        raise RuntimeError(f"No examples in {split_uri}")
+    decoder = example_coder.ExamplesToRecordBatchDecoder()
+    accumulator = combine_fn.create_accumulator()
+    dataset = tf.data.TFRecordDataset(files, compression_type="GZIP").batch(DECODE_BATCH_SIZE)
+    for records in dataset.as_numpy_iterator():
+        accumulator = combine_fn.add_input(accumulator, decoder.DecodeBatch(list(records)))
+    return accumulator
+
+
+def window_statistics(
+    examples_list: List[types.Artifact],
+    cache: AccumulatorCache,
+    combine_fn: Optional[fused_stats.StatisticsCombineFn] = None,
+) -> Dict[Text, Any]:
+    """Statistics per split over all `examples_list`, reading uncached spans only."""
+    combine_fn = combine_fn or fused_stats.StatisticsCombineFn()
+    split_names = artifact_utils.decode_split_names(examples_list[0].split_names)
+    statistics, computed = {}, 0
+    for split in split_names:
+        accumulators = []
+        for examples in examples_list:
+            key = span_key(examples, split)
+            accumulator = cache.get(key)
+            if accumulator is None:
+                accumulator = accumulate_split(examples, split, combine_fn)
+                cache.put(key, accumulator)
+                computed += 1
+            accumulators.append(accumulator)
+        statistics[split] = combine_fn.extract_output(combine_fn.merge_accumulators(accumulators))
+    logging.info(
+        "Statistics of %d spans: %d of %d span splits computed, the others cached",
+        len(examples_list),
+        computed,
+        len(examples_list) * len(split_names),
+    )
+    return statistics
+
+
+class Executor(base_executor.BaseExecutor):
+    """Writes the merged statistics of the input Examples artifacts."""
+
+    def Do(
+        self,
+        input_dict: Dict[Text, List[types.Artifact]],
+        output_dict: Dict[Text, List[types.Artifact]],
+        exec_properties: Dict[Text, Any],
+    ) -> None:
+        self._log_startup(input_dict, output_dict, exec_properties)
+        options = tfdv.StatsOptions()
+        if exec_properties.get("desired_batch_size"):
+            options.desired_batch_size = int(exec_properties["desired_batch_size"])
+        statistics = window_statistics(
+            input_dict["examples"],
+            AccumulatorCache(exec_properties["cache_dir"]),
+            fused_stats.StatisticsCombineFn(options),
+        )
+        fused_stats.write_statistics(
+            statistics, artifact_utils.get_single_instance(output_dict["statistics"])
+        )
+
+
+class SpanStatisticsGenSpec(types.ComponentSpec):
+    """SpanStatisticsGen component spec."""
+
+    PARAMETERS = {
+        "cache_dir": ExecutionParameter(type=str),
+        "desired_batch_size": ExecutionParameter(type=int, optional=True),
+    }
+    INPUTS = {"examples": ChannelParameter(type=standard_artifacts.Examples)}
+    OUTPUTS = {"statistics": ChannelParameter(type=standard_artifacts.ExampleStatistics)}
+
+
+class SpanStatisticsGen(base_component.BaseComponent):
+    """StatisticsGen over several spans, reading only the spans not cached yet."""
+
+    SPEC_CLASS = SpanStatisticsGenSpec
+    EXECUTOR_SPEC = executor_spec.ExecutorClassSpec(Executor)
+
+    def __init__(
+        self,
+        examples: types.Channel,
+        cache_dir: Text,
+        desired_batch_size: Optional[int] = None,
+        instance_name: Optional[Text] = None,
+    ):
+        spec = SpanStatisticsGenSpec(
+            examples=examples,
+            cache_dir=cache_dir,
+            desired_batch_size=desired_batch_size,
+            statistics=types.Channel(type=standard_artifacts.ExampleStatistics),
+        )
+        super(SpanStatisticsGen, self).__init__(spec=spec, instance_name=instance_name)
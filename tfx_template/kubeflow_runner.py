@@ -4,20 +4,22 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import time
 from absl import logging
 from typing import Text, Optional
 
-# Runner alternatives
-from tfx.orchestration.kubeflow import kubeflow_dag_runner
-from tfx.orchestration.kubeflow.v2 import kubeflow_v2_dag_runner
-from tfx.tools.cli.kubeflow_v2 import labels
-from tfx.orchestration.local.local_dag_runner import LocalDagRunner
+from utils import import_timer
 
-from tfx.proto import trainer_pb2
-from tfx.utils import telemetry_utils
+# Runner alternatives are imported in `run`, only for the selected RUNNER_TYPE
+with import_timer.track("tfx.proto"):
+    from tfx.proto import trainer_pb2
 
-from utils.metadata_utils import get_metadata, get_config
-from pipeline import pipeline
+with import_timer.track("metadata_utils"):
+    from utils.metadata_utils import get_metadata, get_config
+from utils import compile_cache
+from utils import perf_trace
+from utils import beam_utils
+from utils import parallelism
 
 
 def run(metadata_file: Optional[Text] = None):
@@ -26,10 +28,61 @@ def run(metadata_file: Optional[Text] = None):
     metadata = get_metadata(metadata_file)
     system_config = get_config(metadata, "system_configurations")
     model_config = get_config(metadata, "model_configurations")
+    pipeline_name = metadata["pipeline_name"] + "_" + metadata["pipeline_version"]
+
+    # Import the selected backend only
+    runner_type = system_config["RUNNER_TYPE"]
+    with import_timer.track(f"{runner_type} runner"):
+        if runner_type == "kubeflow":
+            from tfx.orchestration.kubeflow import kubeflow_dag_runner
+            from tfx.utils import telemetry_utils
+        elif runner_type == "kubeflowv2":
+            from tfx.orchestration.kubeflow.v2 import kubeflow_v2_dag_runner
+            from tfx.tools.cli.kubeflow_v2 import labels
+        elif runner_type == "local":
+            from tfx.orchestration.local.local_dag_runner import LocalDagRunner
+        elif runner_type == "local_parallel":
+            from utils.parallel_dag_runner import ParallelLocalDagRunner
+        else:
+            raise(ValueError(f"Unrecognized runner type: {runner_type}"))
+
+    # Reuse the compiled package if neither the config nor the sources changed.
+    # Runs (local, or kubeflowv2 invoked by 'tfx run') are never cached.
+    output_dir, output_file = os.getcwd(), None
+    if runner_type == "kubeflow":
+        output_file = os.path.join(output_dir, f"{pipeline_name}.tar.gz")
+    elif runner_type == "kubeflowv2" and not os.environ.get(labels.RUN_FLAG_ENV, False):
+        output_file = os.path.join(output_dir, "pipeline.json")
+    if output_file is not None:
+        cache_key = compile_cache.compile_key(metadata, runner_type)
+        if compile_cache.restore(cache_key, output_file):
+            return
+    compile_start = time.perf_counter()
+
+    with import_timer.track("pipeline"):
+        from pipeline import pipeline
+
+    # Report and enforce the startup import budget before compiling / running
+    logging.info("Import time per component:\n%s", import_timer.report())
+    import_timer.check_budget(system_config.get("IMPORT_TIME_BUDGET"))
+
+    # Run the Beam components of local runs on a multi-worker DirectRunner
+    performance_config = get_config(metadata, "performance_configurations")
+    beam_pipeline_args = None
+    if runner_type in ("local", "local_parallel"):
+        beam_pipeline_args = beam_utils.direct_runner_args(performance_config)
+    # TODO(step 7): (Optional) Uncomment below to use provide GCP related
+    #               config for BigQuery with Beam DirectRunner.
+    # beam_pipeline_args = {
+    #     **(beam_pipeline_args or {}),
+    #     **system_config["BIG_QUERY_WITH_DIRECT_RUNNER_BEAM_PIPELINE_ARGS"],
+    # }
+    # TODO(step 8): (Optional) Uncomment below to use Dataflow.
+    # beam_pipeline_args = system_config["DATAFLOW_BEAM_PIPELINE_ARGS"]
 
     # Create pipeline
     dsl_pipeline = pipeline.create_pipeline(
-        pipeline_name=metadata["pipeline_name"] + "_" + metadata["pipeline_version"],
+        pipeline_name=pipeline_name,
         pipeline_root=system_config["PIPELINE_ROOT"],
         data_path=model_config["data_path"],
         # TODO(step 7): (Optional) Uncomment below to use BigQueryExampleGen.
@@ -40,11 +93,7 @@ def run(metadata_file: Optional[Text] = None):
         eval_args=trainer_pb2.EvalArgs(num_steps=model_config["EVAL_NUM_STEPS"]),
         eval_accuracy_threshold=model_config["EVAL_ACCURACY_THRESHOLD"],
         serving_model_dir=system_config["MODEL_SERVE_DIR"],
-        # TODO(step 7): (Optional) Uncomment below to use provide GCP related
-        #               config for BigQuery with Beam DirectRunner.
-        # beam_pipeline_args=system_config["BIG_QUERY_WITH_DIRECT_RUNNER_BEAM_PIPELINE_ARGS"]
-        # TODO(step 8): (Optional) Uncomment below to use Dataflow.
-        # beam_pipeline_args=system_config["DATAFLOW_BEAM_PIPELINE_ARGS"],
+        beam_pipeline_args=beam_pipeline_args,
         # TODO(step 9): (Optional) Uncomment below to use Cloud AI Platform.
         # ai_platform_training_args=system_config["GCP_AI_PLATFORM_TRAINING_ARGS"],
         # TODO(step 9): (Optional) Uncomment below to use Cloud AI Platform.
@@ -52,10 +101,25 @@ def run(metadata_file: Optional[Text] = None):
         enable_cache=system_config["enable_cache"],
         system_config=system_config,  # passing config parameters downstream
         model_config=model_config,  # passing model parameters downstream
+        performance_config=performance_config,
     )
 
+    if runner_type in ("local", "local_parallel"):
+        # Keep each Beam worker's TF / OpenMP pools to its share of the CPUs,
+        # without pinning the components running TensorFlow in-process
+        policy = parallelism.resolve(performance_config)
+        beam_utils.confine_worker_environment(
+            dsl_pipeline.components,
+            parallelism.worker_environment(
+                policy, beam_pipeline_args.get("direct_num_workers", 1)
+            ),
+        )
+        if runner_type == "local":
+            # Size the runner's own pools before a Beam component initializes
+            # TensorFlow in this process with the worker environment set
+            parallelism.configure_tensorflow(policy)
+
     # Prepare runner
-    runner_type = system_config["RUNNER_TYPE"]
     if runner_type == "kubeflow":
         # Metadata config. The defaults works work with the installation of
         # KF Pipelines using Kubeflow. If installing KF Pipelines using the
@@ -76,15 +140,12 @@ def run(metadata_file: Optional[Text] = None):
             kubeflow_metadata_config=metadata_config, tfx_image=tfx_image
         )
         pod_labels = kubeflow_dag_runner.get_default_pod_labels()
-        pod_labels.update(
-            {
-                telemetry_utils.LABEL_KFP_SDK_ENV: metadata["pipeline_name"]
-                + "_"
-                + metadata["pipeline_version"]
-            }
-        )
+        pod_labels.update({telemetry_utils.LABEL_KFP_SDK_ENV: pipeline_name})
         runner = kubeflow_dag_runner.KubeflowDagRunner(
-            config=runner_config, pod_labels_to_attach=pod_labels
+            output_dir=output_dir,
+            output_filename=os.path.basename(output_file),
+            config=runner_config,
+            pod_labels_to_attach=pod_labels,
         )
         runner.run(dsl_pipeline)
     elif runner_type == "kubeflowv2":
@@ -97,10 +158,12 @@ def run(metadata_file: Optional[Text] = None):
 
         runner_config = kubeflow_v2_dag_runner.KubeflowV2DagRunnerConfig(
             project_id=project_id,
-            display_name="tfx-kubeflow-v2-pipeline-{}".format(system_config["pipeline_name"]+"_"+system_config["pipeline_version"]),
+            display_name="tfx-kubeflow-v2-pipeline-{}".format(pipeline_name),
             default_image=tfx_image,
             )
-        runner = kubeflow_v2_dag_runner.KubeflowV2DagRunner(config=runner_config)
+        runner = kubeflow_v2_dag_runner.KubeflowV2DagRunner(
+            config=runner_config, output_dir=output_dir, output_filename="pipeline.json"
+        )
 
         if run_flag: # two methods exists in the runner
             # Only trigger the execution when invoked by 'run' command.
@@ -111,8 +174,20 @@ def run(metadata_file: Optional[Text] = None):
     elif runner_type == "local":
         runner = LocalDagRunner()
         runner.run(dsl_pipeline)
-    else:
-        raise(ValueError(f"Unrecognized runner type: {runner_type}"))    
+    elif runner_type == "local_parallel":
+        runner_args = system_config["LOCAL_PARALLEL_RUNNER_ARGS"]
+        runner = ParallelLocalDagRunner(
+            max_workers=runner_args.get("max_workers"),
+            component_resources=runner_args.get("component_resources"),
+            default_resources=runner_args.get("default_resources"),
+        )
+        runner.run(dsl_pipeline)
+
+    if runner_type in ("local", "local_parallel") and system_config.get("ENABLE_PERF_TRACE"):
+        perf_trace.write_report(system_config["PIPELINE_ROOT"])
+
+    if output_file is not None:
+        compile_cache.save(cache_key, output_file, time.perf_counter() - compile_start)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+# Lint as: python3
+"""Approximate streaming analyzers for preprocessing_fn.
+
+`tft.compute_and_apply_vocabulary` counts every distinct term over the whole
+dataset, which takes a full shuffle of the terms on large data.
+`approximate_vocabulary` keeps a Misra-Gries heavy-hitter sketch of
+`num_counters` counters per batch instead, merges the sketches and writes
+the top_k terms as a tf.Transform vocabulary file (one term per line, most
+frequent first), to use with `tft.apply_vocabulary`.
+
+A term of frequency f is undercounted by at most N / (num_counters + 1) for N
+values, so every term more frequent than that is kept, and the vocabulary is
+exact when the feature has at most `num_counters` distinct values.
+
+The sketch runs as a `tft.ptransform_analyzer`, whose outputs tf.Transform's
+analyzer cache does not store: with TRANSFORM_ANALYZER_CACHE, approximate
+vocabularies are still computed over every span of the window on each run
+(the pipeline logs a warning). Prefer the exact, cached vocabulary then.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import collections
+
+import tensorflow as tf
+
+
+class HeavyHitters(object):
+  """Misra-Gries heavy-hitter sketch, with the methods of a beam.CombineFn.
+
+  Accumulators map terms to their (under)counts, at most `num_counters` of
+  them.
+  """
+
+  def __init__(self, num_counters):
+    self._num_counters = num_counters
+
+  def _prune(self, counts):
+    if len(counts) <= self._num_counters:
+      return counts
+    # Subtract the (num_counters + 1)-th largest count from every counter
+    threshold = sorted(counts.values(), reverse=True)[self._num_counters]
+    return {term: count - threshold
+            for term, count in counts.items() if count > threshold}
+
+  def create_accumulator(self):
+    return {}
+
+  def add_input(self, accumulator, values):
+    counts = collections.Counter(accumulator)
+    counts.update(values)
+    return self._prune(dict(counts))
+
+  def merge_accumulators(self, accumulators):
+    counts = collections.Counter()
+    for accumulator in accumulators:
+      counts.update(accumulator)
+    return self._prune(dict(counts))
+
+  def extract_output(self, accumulator):
+    """(term, count) pairs, most frequent first, ties by term descending."""
+    return sorted(accumulator.items(), key=lambda item: (item[1], item[0]),
+                  reverse=True)
+
+
+def write_vocabulary(heavy_hitters, top_k, path):
+  """Write the top_k terms in the tf.Transform vocabulary file format."""
+  terms = [term for term, _ in heavy_hitters
+           if b'\n' not in term and b'\r' not in term][:top_k]
+  tf.io.gfile.makedirs(os.path.dirname(path))
+  with tf.io.gfile.GFile(path, 'wb') as fid:
+    fid.write(b''.join(term + b'\n' for term in terms))
+  return path
+
+
+def approximate_vocabulary(x, top_k, num_counters, vocab_filename):
+  """Vocabulary of the top_k terms of `x`, from a heavy-hitter sketch.
+
+  Args:
+    x: A rank 1 string `Tensor`.
+    top_k: Number of terms in the vocabulary.
+    num_counters: Counters of the sketch, at least `top_k`; more counters
+      give counts, hence the vocabulary, closer to the exact ones.
+    vocab_filename: File name of the vocabulary in the transform graph assets.
+
+  Returns:
+    The deferred path of the vocabulary file, for `tft.apply_vocabulary`.
+  """
+  import apache_beam as beam
+  import numpy as np
+  from tensorflow_transform import analyzers as tft_analyzers
+  from tensorflow_transform.beam import context
+
+  sketch = HeavyHitters(max(int(num_counters), top_k))
+
+  class _HeavyHittersFn(beam.CombineFn):
+
+    def create_accumulator(self):
+      return sketch.create_accumulator()
+
+    def add_input(self, accumulator, values):
+      return sketch.add_input(accumulator, values)
+
+    def merge_accumulators(self, accumulators):
+      return sketch.merge_accumulators(accumulators)
+
+    def extract_output(self, accumulator):
+      return sketch.extract_output(accumulator)
+
+  class _ComputeVocabulary(beam.PTransform):
+
+    def expand(self, batches):
+      path = os.path.join(context.Context.create_base_temp_dir(),
+                          'approximate_vocabulary', vocab_filename)
+      vocabulary = (
+          batches
+          | 'Terms' >> beam.Map(lambda batch: batch[0].tolist())
+          | 'HeavyHitters' >> beam.CombineGlobally(_HeavyHittersFn())
+          | 'Write' >> beam.Map(
+              lambda items: np.array(write_vocabulary(items, top_k, path))))
+      return [vocabulary]
+
+  # The output is an asset path, a one-term vocabulary file until analyzed
+  [filename] = tft_analyzers.ptransform_analyzer(
+      inputs=[x],
+      output_dtypes=[tf.string],
+      output_shapes=[[]],
+      ptransform=_ComputeVocabulary(),
+      output_asset_default_values=[b'TEMPORARY_ASSET_VALUE'],
+      name='approximate_vocabulary_' + vocab_filename)
+  tf.compat.v1.add_to_collection(tf.compat.v1.GraphKeys.ASSET_FILEPATHS,
+                                 filename)
+  return filename
@@ -30,6 +30,7 @@ from models import features
 from models.estimator import constants
 from tfx.utils import io_utils
 from tfx_bsl.tfxio import dataset_options
+from utils import parallelism
 
 from tensorflow_metadata.proto.v0 import schema_pb2
 
@@ -163,7 +164,8 @@ def _eval_input_receiver_fn(tf_transform_output, schema):
           features.LABEL_KEY)])
 
 
-def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200):
+def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200,
+              policy=None, transform_in_trainer=False):
   """Generates features and label for tuning/training.
 
   Args:
@@ -172,17 +174,42 @@ def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200):
     tf_transform_output: A TFTransformOutput.
     batch_size: representing the number of consecutive elements of returned
       dataset to combine in a single batch
+    policy: Parallelism policy from `parallelism.resolve`, bounding the
+      threads of the input pipeline.
+    transform_in_trainer: Whether `file_pattern` holds raw examples, to which
+      the transform graph is applied here, instead of the transformed examples
+      materialized by Transform.
 
   Returns:
     A dataset that contains (features, indices) tuple where features is a
       dictionary of Tensors, and indices is a single Tensor of label indices.
+      With `transform_in_trainer`, the (features, indices) of its next batch.
   """
-  return data_accessor.tf_dataset_factory(
+  label_key = features.transformed_name(features.LABEL_KEY)
+  if transform_in_trainer:
+    dataset = data_accessor.tf_dataset_factory(
+        file_pattern,
+        dataset_options.TensorFlowDatasetOptions(batch_size=batch_size),
+        tf_transform_output.raw_metadata.schema)
+    if policy is not None:
+      dataset = dataset.with_options(parallelism.dataset_options(policy))
+    # The transform graph is applied in the estimator graph, where its tables
+    # are initialized by the scaffold.
+    raw_features = tf.compat.v1.data.make_one_shot_iterator(
+        dataset.prefetch(tf.data.experimental.AUTOTUNE)).get_next()
+    transformed_features = tf_transform_output.transform_raw_features(
+        raw_features)
+    label = transformed_features.pop(label_key)
+    return transformed_features, label
+
+  dataset = data_accessor.tf_dataset_factory(
       file_pattern,
       dataset_options.TensorFlowDatasetOptions(
-          batch_size=batch_size,
-          label_key=features.transformed_name(features.LABEL_KEY)),
+          batch_size=batch_size, label_key=label_key),
       tf_transform_output.transformed_metadata.schema)
+  if policy is not None:
+    dataset = dataset.with_options(parallelism.dataset_options(policy))
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
 
 
 def _create_train_and_eval_spec(trainer_fn_args, schema):
@@ -202,17 +229,27 @@ def _create_train_and_eval_spec(trainer_fn_args, schema):
 
   tf_transform_output = tft.TFTransformOutput(trainer_fn_args.transform_output)
 
+  # Size the TF sessions and input pipelines for the CPUs of this container
+  performance_config = (
+      (trainer_fn_args.custom_config or {}).get('performance_config') or {})
+  policy = parallelism.resolve(performance_config)
+  transform_in_trainer = bool(performance_config.get('TRANSFORM_IN_TRAINER'))
+
   train_input_fn = lambda: _input_fn(  # pylint: disable=g-long-lambda
       trainer_fn_args.train_files,
       trainer_fn_args.data_accessor,
       tf_transform_output,
-      batch_size=constants.TRAIN_BATCH_SIZE)
+      batch_size=constants.TRAIN_BATCH_SIZE,
+      policy=policy,
+      transform_in_trainer=transform_in_trainer)
 
   eval_input_fn = lambda: _input_fn(  # pylint: disable=g-long-lambda
       trainer_fn_args.eval_files,
       trainer_fn_args.data_accessor,
       tf_transform_output,
-      batch_size=constants.EVAL_BATCH_SIZE)
+      batch_size=constants.EVAL_BATCH_SIZE,
+      policy=policy,
+      transform_in_trainer=transform_in_trainer)
 
   train_spec = tf.estimator.TrainSpec(  # pylint: disable=g-long-lambda
       train_input_fn,
@@ -229,7 +266,9 @@ def _create_train_and_eval_spec(trainer_fn_args, schema):
       name='chicago-taxi-eval')
 
   run_config = tf.estimator.RunConfig(
-      save_checkpoints_steps=999, keep_checkpoint_max=1)
+      save_checkpoints_steps=999,
+      keep_checkpoint_max=1,
+      session_config=parallelism.session_config(policy))
 
   run_config = run_config.replace(model_dir=trainer_fn_args.serving_model_dir)
 
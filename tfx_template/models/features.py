@@ -72,6 +72,15 @@ VOCAB_FEATURE_KEYS = []
 # Number of vocabulary terms used for encoding VOCAB_FEATURES by tf.transform
 VOCAB_SIZE = 1000
 
+# Features analyzed with approximate streaming sketches, with their accuracy.
+# BUCKET_FEATURE_KEYS: error tolerance epsilon of the quantile sketch of
+# `tft.bucketize`, in rank (default: chosen by tf.transform).
+# VOCAB_FEATURE_KEYS: counters of the heavy-hitter sketch replacing the exact
+# `tft.compute_and_apply_vocabulary` count (at least VOCAB_SIZE; more counters
+# give a vocabulary closer to the exact one). See models/analyzers.py.
+APPROXIMATE_ANALYZERS = {}
+# APPROXIMATE_ANALYZERS = {'pickup_latitude': 0.01, 'company': 4 * VOCAB_SIZE}
+
 # Count of out-of-vocab buckets in which unrecognized VOCAB_FEATURES are hashed.
 OOV_SIZE = 10
 
@@ -28,6 +28,7 @@ import tensorflow_transform as tft
 from models import features
 from models.keras import constants
 from tfx_bsl.tfxio import dataset_options
+from utils import parallelism
 
 
 def _get_serve_tf_examples_fn(model, tf_transform_output):
@@ -49,7 +50,8 @@ def _get_serve_tf_examples_fn(model, tf_transform_output):
   return serve_tf_examples_fn
 
 
-def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200):
+def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200,
+              policy=None, transform_in_trainer=False):
   """Generates features and label for tuning/training.
 
   Args:
@@ -58,17 +60,39 @@ def _input_fn(file_pattern, data_accessor, tf_transform_output, batch_size=200):
     tf_transform_output: A TFTransformOutput.
     batch_size: representing the number of consecutive elements of returned
       dataset to combine in a single batch
+    policy: Parallelism policy from `parallelism.resolve`, bounding the
+      threads of the input pipeline.
+    transform_in_trainer: Whether `file_pattern` holds raw examples, to which
+      the transform graph is applied here, instead of the transformed examples
+      materialized by Transform.
 
   Returns:
     A dataset that contains (features, indices) tuple where features is a
       dictionary of Tensors, and indices is a single Tensor of label indices.
   """
-  return data_accessor.tf_dataset_factory(
-      file_pattern,
-      dataset_options.TensorFlowDatasetOptions(
-          batch_size=batch_size,
-          label_key=features.transformed_name(features.LABEL_KEY)),
-      tf_transform_output.transformed_metadata.schema)
+  label_key = features.transformed_name(features.LABEL_KEY)
+  if transform_in_trainer:
+    tft_layer = tf_transform_output.transform_features_layer()
+
+    def _transform(raw_features):
+      transformed_features = tft_layer(raw_features)
+      label = transformed_features.pop(label_key)
+      return transformed_features, label
+
+    dataset = data_accessor.tf_dataset_factory(
+        file_pattern,
+        dataset_options.TensorFlowDatasetOptions(batch_size=batch_size),
+        tf_transform_output.raw_metadata.schema).map(
+            _transform, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+  else:
+    dataset = data_accessor.tf_dataset_factory(
+        file_pattern,
+        dataset_options.TensorFlowDatasetOptions(
+            batch_size=batch_size, label_key=label_key),
+        tf_transform_output.transformed_metadata.schema)
+  if policy is not None:
+    dataset = dataset.with_options(parallelism.dataset_options(policy))
+  return dataset.prefetch(tf.data.experimental.AUTOTUNE)
 
 
 def _build_keras_model(hidden_units, learning_rate):
@@ -185,12 +209,21 @@ def run_fn(fn_args):
     fn_args: Holds args used to train the model as name/value pairs.
   """
 
+  # Size the TF runtime and input pipelines for the CPUs of this container
+  performance_config = (
+      (fn_args.custom_config or {}).get('performance_config') or {})
+  policy = parallelism.resolve(performance_config)
+  parallelism.configure_tensorflow(policy)
+  transform_in_trainer = bool(performance_config.get('TRANSFORM_IN_TRAINER'))
+
   tf_transform_output = tft.TFTransformOutput(fn_args.transform_output)
 
   train_dataset = _input_fn(fn_args.train_files, fn_args.data_accessor,
-                            tf_transform_output, constants.TRAIN_BATCH_SIZE)
+                            tf_transform_output, constants.TRAIN_BATCH_SIZE,
+                            policy, transform_in_trainer)
   eval_dataset = _input_fn(fn_args.eval_files, fn_args.data_accessor,
-                           tf_transform_output, constants.EVAL_BATCH_SIZE)
+                           tf_transform_output, constants.EVAL_BATCH_SIZE,
+                           policy, transform_in_trainer)
 
   mirrored_strategy = tf.distribute.MirroredStrategy()
   with mirrored_strategy.scope():
@@ -0,0 +1,354 @@
+# Lint as: python3
+"""Pure NumPy replay of a fitted transform graph, for offline batch scoring.
+
+`NumpyTransform` applies the ops of preprocessing.py (z-score, vocabulary
+lookup with hashed OOV buckets, bucketize and identity categoricals) to
+columns of NumPy arrays or a pandas DataFrame, without TensorFlow, and can be
+pickled to batch scoring workers. `compile_transform` reads its parameters
+from a fitted `transform_graph` artifact:
+- vocabularies are read from the assets of the graph
+  (`features.vocabulary_name`);
+- z-score means and standard deviations, and bucket boundaries, are baked
+  into the graph as constants, so they are recovered by evaluating the graph
+  on probe values: two points per z-score, a bisection over the float32
+  values per bucket boundary. The bisection reproduces the graph's bucket of
+  every float32 value, ties included.
+
+    transform = numpy_transform.compile_transform(transform_graph_uri)
+    transformed = transform(pandas.read_csv('data.csv'))
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import struct
+
+import numpy as np
+
+from models import features
+
+_MASK = 0xffffffffffffffff
+_K0 = 0xc3a5c85c97cb3127
+_K1 = 0xb492b66fbe98f273
+_K2 = 0x9ae16a3b2f90404f
+
+
+def _fetch64(s, i):
+  return struct.unpack_from('<Q', s, i)[0]
+
+
+def _fetch32(s, i):
+  return struct.unpack_from('<I', s, i)[0]
+
+
+def _rotate(v, shift):
+  return ((v >> shift) | (v << (64 - shift))) & _MASK
+
+
+def _shift_mix(v):
+  return v ^ (v >> 47)
+
+
+def _hash_len16(u, v, mul):
+  a = ((u ^ v) * mul) & _MASK
+  a ^= a >> 47
+  b = ((v ^ a) * mul) & _MASK
+  b ^= b >> 47
+  return (b * mul) & _MASK
+
+
+def _hash_len0_to16(s):
+  n = len(s)
+  if n >= 8:
+    mul = _K2 + n * 2
+    a = (_fetch64(s, 0) + _K2) & _MASK
+    b = _fetch64(s, n - 8)
+    c = (_rotate(b, 37) * mul + a) & _MASK
+    d = ((_rotate(a, 25) + b) * mul) & _MASK
+    return _hash_len16(c, d, mul)
+  if n >= 4:
+    mul = _K2 + n * 2
+    return _hash_len16(n + (_fetch32(s, 0) << 3), _fetch32(s, n - 4), mul)
+  if n > 0:
+    y = (s[0] + (s[n >> 1] << 8)) & 0xffffffff
+    z = (n + (s[n - 1] << 2)) & 0xffffffff
+    return (_shift_mix(((y * _K2) ^ (z * _K0)) & _MASK) * _K2) & _MASK
+  return _K2
+
+
+def _hash_len17_to32(s):
+  n = len(s)
+  mul = _K2 + n * 2
+  a = (_fetch64(s, 0) * _K1) & _MASK
+  b = _fetch64(s, 8)
+  c = (_fetch64(s, n - 8) * mul) & _MASK
+  d = (_fetch64(s, n - 16) * _K2) & _MASK
+  return _hash_len16(
+      (_rotate((a + b) & _MASK, 43) + _rotate(c, 30) + d) & _MASK,
+      (a + _rotate((b + _K2) & _MASK, 18) + c) & _MASK, mul)
+
+
+def _hash_len33_to64(s):
+  n = len(s)
+  mul = _K2 + n * 2
+  a = (_fetch64(s, 0) * _K2) & _MASK
+  b = _fetch64(s, 8)
+  c = (_fetch64(s, n - 8) * mul) & _MASK
+  d = (_fetch64(s, n - 16) * _K2) & _MASK
+  y = (_rotate((a + b) & _MASK, 43) + _rotate(c, 30) + d) & _MASK
+  z = _hash_len16(y, (a + _rotate((b + _K2) & _MASK, 18) + c) & _MASK, mul)
+  e = (_fetch64(s, 16) * mul) & _MASK
+  f = _fetch64(s, 24)
+  g = ((y + _fetch64(s, n - 32)) * mul) & _MASK
+  h = ((z + _fetch64(s, n - 24)) * mul) & _MASK
+  return _hash_len16(
+      (_rotate((e + f) & _MASK, 43) + _rotate(g, 30) + h) & _MASK,
+      (e + _rotate((f + a) & _MASK, 18) + g) & _MASK, mul)
+
+
+def _weak_hash_len32_with_seeds(s, i, a, b):
+  w, x, y, z = (_fetch64(s, i), _fetch64(s, i + 8), _fetch64(s, i + 16),
+                _fetch64(s, i + 24))
+  a = (a + w) & _MASK
+  b = _rotate((b + a + z) & _MASK, 21)
+  c = a
+  a = (a + x + y) & _MASK
+  b = (b + _rotate(a, 44)) & _MASK
+  return (a + z) & _MASK, (b + c) & _MASK
+
+
+def fingerprint64(s):
+  """FarmHash Fingerprint64 of bytes `s`, the OOV hash of tf.lookup tables."""
+  n = len(s)
+  if n <= 16:
+    return _hash_len0_to16(s)
+  if n <= 32:
+    return _hash_len17_to32(s)
+  if n <= 64:
+    return _hash_len33_to64(s)
+
+  x = 81
+  y = (81 * _K1 + 113) & _MASK
+  z = (_shift_mix((y * _K2 + 113) & _MASK) * _K2) & _MASK
+  v, w = (0, 0), (0, 0)
+  x = (x * _K2 + _fetch64(s, 0)) & _MASK
+  end = ((n - 1) // 64) * 64
+  last64 = end + ((n - 1) & 63) - 63
+  i = 0
+  while i != end:
+    x = (_rotate((x + y + v[0] + _fetch64(s, i + 8)) & _MASK, 37) *
+         _K1) & _MASK
+    y = (_rotate((y + v[1] + _fetch64(s, i + 48)) & _MASK, 42) * _K1) & _MASK
+    x ^= w[1]
+    y = (y + v[0] + _fetch64(s, i + 40)) & _MASK
+    z = (_rotate((z + w[0]) & _MASK, 33) * _K1) & _MASK
+    v = _weak_hash_len32_with_seeds(s, i, (v[1] * _K1) & _MASK,
+                                    (x + w[0]) & _MASK)
+    w = _weak_hash_len32_with_seeds(s, i + 32, (z + w[1]) & _MASK,
+                                    (y + _fetch64(s, i + 16)) & _MASK)
+    z, x = x, z
+    i += 64
+  mul = _K1 + ((z & 0xff) << 1)
+  i = last64
+  w = ((w[0] + ((n - 1) & 63)) & _MASK, w[1])
+  v = ((v[0] + w[0]) & _MASK, v[1])
+  w = ((w[0] + v[0]) & _MASK, w[1])
+  x = (_rotate((x + y + v[0] + _fetch64(s, i + 8)) & _MASK, 37) * mul) & _MASK
+  y = (_rotate((y + v[1] + _fetch64(s, i + 48)) & _MASK, 42) * mul) & _MASK
+  x ^= (w[1] * 9) & _MASK
+  y = (y + v[0] * 9 + _fetch64(s, i + 40)) & _MASK
+  z = (_rotate((z + w[0]) & _MASK, 33) * mul) & _MASK
+  v = _weak_hash_len32_with_seeds(s, i, (v[1] * mul) & _MASK,
+                                  (x + w[0]) & _MASK)
+  w = _weak_hash_len32_with_seeds(s, i + 32, (z + w[1]) & _MASK,
+                                  (y + _fetch64(s, i + 16)) & _MASK)
+  z, x = x, z
+  return _hash_len16(
+      (_hash_len16(v[0], w[0], mul) + _shift_mix(y) * _K0 + z) & _MASK,
+      (_hash_len16(v[1], w[1], mul) + x) & _MASK, mul)
+
+
+def _fill_in_missing(values, dtype):
+  """Rank 1 array of `values` with missing values (None, NaN) as '' or 0."""
+  values = np.asarray(values)
+  if dtype == np.object_:
+    return np.array([
+        b'' if value is None or value != value else  # pylint: disable=comparison-with-itself
+        value if isinstance(value, bytes) else str(value).encode('utf-8')
+        for value in values.ravel()
+    ], dtype=np.object_)
+  if values.dtype.kind not in 'biu':
+    values = np.asarray(values, np.float64)  # None as NaN
+    values = np.where(np.isnan(values), 0, values)
+  return values.ravel().astype(dtype)
+
+
+class NumpyTransform(object):
+  """The transform of preprocessing.py with fitted parameters, in NumPy.
+
+  Attributes:
+    z_scores: map from dense float keys to their (mean, standard deviation).
+    vocabularies: map from vocabulary keys to their list of terms (bytes).
+    num_oov_buckets: OOV buckets of the vocabulary lookups.
+    boundaries: map from bucket keys to their sorted bucket boundaries.
+    categorical_keys: keys of the identity categorical features.
+  """
+
+  def __init__(self, z_scores, vocabularies, num_oov_buckets, boundaries,
+               categorical_keys):
+    self.z_scores = z_scores
+    self.vocabularies = vocabularies
+    self.num_oov_buckets = num_oov_buckets
+    self.boundaries = boundaries
+    self.categorical_keys = categorical_keys
+    self._indices = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_indices'] = None
+    return state
+
+  def _lookup(self, key, values):
+    if self._indices is None:
+      self._indices = {
+          name: {term: i for i, term in enumerate(terms)}
+          for name, terms in self.vocabularies.items()
+      }
+    indices = self._indices[key]
+    size = len(self.vocabularies[key])
+    # Look up each distinct term once
+    terms, inverse = np.unique(values, return_inverse=True)
+    ids = np.array([
+        indices[term] if term in indices else
+        size + fingerprint64(term) % self.num_oov_buckets
+        for term in terms.tolist()
+    ], dtype=np.int64)
+    return ids[inverse]
+
+  def __call__(self, columns):
+    """Transformed features of raw feature columns.
+
+    Args:
+      columns: map from raw feature keys to array-likes of one value per
+        example, e.g. a pandas DataFrame. Missing values are None or NaN.
+
+    Returns:
+      Map from transformed feature keys to rank 1 arrays, with the values
+      and dtypes of the transform graph.
+    """
+    outputs = {}
+    for key, (mean, std) in self.z_scores.items():
+      values = _fill_in_missing(columns[key], np.float64)
+      outputs[features.transformed_name(key)] = (
+          (values - mean) / std).astype(np.float32)
+    for key in self.vocabularies:
+      values = _fill_in_missing(columns[key], np.object_)
+      outputs[features.transformed_name(key)] = self._lookup(key, values)
+    for key, boundaries in self.boundaries.items():
+      values = _fill_in_missing(columns[key], np.float32)
+      outputs[features.transformed_name(key)] = np.searchsorted(
+          boundaries, values, side='right').astype(np.int64)
+    for key in self.categorical_keys:
+      outputs[features.transformed_name(key)] = _fill_in_missing(
+          columns[key], np.int64)
+    if features.LABEL_KEY in columns:
+      outputs[features.transformed_name(features.LABEL_KEY)] = np.asarray(
+          columns[features.LABEL_KEY])
+    return outputs
+
+
+def _ordered(values):
+  """Integers ordered as the float32 `values`."""
+  bits = np.asarray(values, np.float32).view(np.int32).astype(np.int64)
+  return np.where(bits < 0, -(bits & 0x7fffffff), bits)
+
+
+def _from_ordered(keys):
+  bits = np.where(keys < 0, (-keys) | 0x80000000, keys)
+  return bits.astype(np.uint32).view(np.float32)
+
+
+class _Probe(object):
+  """Evaluates one transformed feature of the graph on raw probe values."""
+
+  def __init__(self, tf_transform_output):
+    import tensorflow as tf  # pylint: disable=g-import-not-at-top
+
+    self._tf = tf
+    self._layer = tf_transform_output.transform_features_layer()
+    self._feature_spec = tf_transform_output.raw_feature_spec()
+
+  def __call__(self, key, values):
+    tf = self._tf
+    size = len(values)
+    inputs = {}
+    for name, spec in self._feature_spec.items():
+      column = (
+          np.asarray(values) if name == key else
+          np.full(size, '' if spec.dtype == tf.string else 0))
+      column = tf.constant(column, spec.dtype)
+      if isinstance(spec, tf.io.VarLenFeature):
+        indices = tf.stack(
+            [tf.range(size, dtype=tf.int64), tf.zeros(size, tf.int64)], 1)
+        inputs[name] = tf.SparseTensor(indices, column, [size, 1])
+      else:
+        inputs[name] = tf.reshape(column, [size] + list(spec.shape))
+    outputs = self._layer(inputs)
+    return np.asarray(outputs[features.transformed_name(key)]).reshape(size)
+
+
+def _z_score(probe, key):
+  """(mean, standard deviation) of the linear z-score of `key`."""
+  points = np.array([0, 1], np.float64)
+  for _ in range(2):  # then again around the mean, for float32 precision
+    low, high = probe(key, points.astype(np.float32)).astype(np.float64)
+    std = (points[1] - points[0]) / (high - low)
+    mean = points[0] - low * std
+    points = np.array([mean, mean + std], np.float32).astype(np.float64)
+  return mean, std
+
+
+def _boundaries(probe, key):
+  """Bucket boundaries of `key`: the smallest float32 of each bucket."""
+  num_boundaries = int(probe(key, np.array([np.inf], np.float32))[0])
+  targets = np.arange(1, num_boundaries + 1)
+  low = np.full(num_boundaries, _ordered(-np.inf), np.int64)
+  high = np.full(num_boundaries, _ordered(np.inf), np.int64)
+  # bucket(low) < target <= bucket(high)
+  while np.any(high - low > 1):
+    middle = (low + high) // 2
+    above = probe(key, _from_ordered(middle)) >= targets
+    high = np.where(above, middle, high)
+    low = np.where(above, low, middle)
+  return _from_ordered(high)
+
+
+def compile_transform(transform_graph_uri):
+  """The `NumpyTransform` of a fitted transform graph of preprocessing_fn.
+
+  Args:
+    transform_graph_uri: uri of a Transform `transform_graph` artifact.
+
+  Returns:
+    A picklable `NumpyTransform`.
+  """
+  import tensorflow_transform as tft  # pylint: disable=g-import-not-at-top
+
+  tf_transform_output = tft.TFTransformOutput(transform_graph_uri)
+  probe = _Probe(tf_transform_output)
+  return NumpyTransform(
+      z_scores={
+          key: _z_score(probe, key)
+          for key in features.DENSE_FLOAT_FEATURE_KEYS
+      },
+      vocabularies={
+          key: tf_transform_output.vocabulary_by_name(
+              features.vocabulary_name(key))
+          for key in features.VOCAB_FEATURE_KEYS
+      },
+      num_oov_buckets=features.OOV_SIZE,
+      boundaries={
+          key: _boundaries(probe, key) for key in features.BUCKET_FEATURE_KEYS
+      },
+      categorical_keys=list(features.CATEGORICAL_FEATURE_KEYS))
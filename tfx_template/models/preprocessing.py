@@ -20,9 +20,12 @@ This file defines a template for TFX Transform component.
 from __future__ import division
 from __future__ import print_function
 
+import collections
+
 import tensorflow as tf
 import tensorflow_transform as tft
 
+from models import analyzers
 from models import features
 
 
@@ -49,6 +52,47 @@ def _fill_in_missing(x):
   return tf.squeeze(dense_tensor, axis=1)
 
 
+def _fill_in_missing_fused(inputs, keys):
+  """Replace missing values of several features, one densify per dtype.
+
+  Same result as `_fill_in_missing` on each feature, but the SparseTensors of
+  a dtype are concatenated into one [batch, len(group)] SparseTensor that is
+  densified once and unstacked, instead of one `to_dense` and `squeeze` per
+  feature in the transform and serving graphs.
+
+  Args:
+    inputs: map from feature keys to `SparseTensor`s of rank 2 whose dense
+      shape has size at most 1 in the second dimension, or dense [batch, 1]
+      tensors.
+    keys: the feature keys to fill in.
+
+  Returns:
+    Map from each key to a rank 1 tensor where missing values have been
+    filled in with '' or 0.
+  """
+  outputs = {}
+  groups = collections.OrderedDict()
+  for key in keys:
+    if isinstance(inputs[key], tf.sparse.SparseTensor):
+      groups.setdefault(inputs[key].dtype, []).append(key)
+    else:
+      outputs[key] = tf.squeeze(inputs[key], axis=1)
+
+  for dtype, group in groups.items():
+    dense_shape = tf.stack(
+        [inputs[group[0]].dense_shape[0], tf.constant(1, dtype=tf.int64)])
+    batched = tf.sparse.concat(
+        axis=1,
+        sp_inputs=[
+            tf.SparseTensor(inputs[key].indices, inputs[key].values, dense_shape)
+            for key in group
+        ])
+    dense = tf.sparse.to_dense(
+        batched, tf.constant('' if dtype == tf.string else 0, dtype=dtype))
+    outputs.update(zip(group, tf.unstack(dense, num=len(group), axis=1)))
+  return outputs
+
+
 def preprocessing_fn(inputs):
   """tf.transform's callback function for preprocessing inputs.
 
@@ -59,27 +103,42 @@ def preprocessing_fn(inputs):
     Map from string feature key to transformed feature operations.
   """
   outputs = {}
+  filled = _fill_in_missing_fused(
+      inputs, features.DENSE_FLOAT_FEATURE_KEYS + features.VOCAB_FEATURE_KEYS +
+      features.BUCKET_FEATURE_KEYS + features.CATEGORICAL_FEATURE_KEYS)
   for key in features.DENSE_FLOAT_FEATURE_KEYS:
     # Preserve this feature as a dense float, setting nan's to the mean.
     outputs[features.transformed_name(key)] = tft.scale_to_z_score(
-        _fill_in_missing(inputs[key]))
+        filled[key])
 
   for key in features.VOCAB_FEATURE_KEYS:
+    if key in features.APPROXIMATE_ANALYZERS:
+      # Vocabulary of the top terms of a heavy-hitter sketch.
+      vocabulary = analyzers.approximate_vocabulary(
+          filled[key],
+          top_k=features.VOCAB_SIZE,
+          num_counters=features.APPROXIMATE_ANALYZERS[key],
+          vocab_filename=features.vocabulary_name(key))
+      outputs[features.transformed_name(key)] = tft.apply_vocabulary(
+          filled[key], vocabulary, num_oov_buckets=features.OOV_SIZE)
+      continue
     # Build a vocabulary for this feature.
     outputs[features.transformed_name(key)] = tft.compute_and_apply_vocabulary(
-        _fill_in_missing(inputs[key]),
+        filled[key],
         top_k=features.VOCAB_SIZE,
-        num_oov_buckets=features.OOV_SIZE)
+        num_oov_buckets=features.OOV_SIZE,
+        vocab_filename=features.vocabulary_name(key))
 
   for key, num_buckets in zip(features.BUCKET_FEATURE_KEYS,
                               features.BUCKET_FEATURE_BUCKET_COUNT):
     outputs[features.transformed_name(key)] = tft.bucketize(
-        _fill_in_missing(inputs[key]),
-        num_buckets
+        filled[key],
+        num_buckets,
+        epsilon=features.APPROXIMATE_ANALYZERS.get(key)
     )
 
   for key in features.CATEGORICAL_FEATURE_KEYS:
-    outputs[features.transformed_name(key)] = _fill_in_missing(inputs[key])
+    outputs[features.transformed_name(key)] = filled[key]
 
   # TODO(b/157064428): Support label transformation for Keras.
   # Do not apply label transformation as it will result in wrong evaluation.
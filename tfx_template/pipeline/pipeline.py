@@ -4,43 +4,43 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import re
 import datetime
+from absl import logging
 from typing import Any, Dict, List, Optional, Text
 
-import tensorflow_model_analysis as tfma
-from tfx.components import CsvExampleGen
-from tfx.components import Evaluator
-from tfx.components import ExampleValidator
-from tfx.components import Pusher
-from tfx.components import ResolverNode
-from tfx.components import SchemaGen
-from tfx.components import StatisticsGen
-from tfx.components import Trainer
-from tfx.components import Transform
-from tfx.components.trainer import executor as trainer_executor
-from tfx.dsl.components.base import executor_spec
-from tfx.dsl.experimental import latest_blessed_model_resolver
-from tfx.extensions.google_cloud_ai_platform.pusher import (
-    executor as ai_platform_pusher_executor,
-)
-from tfx.extensions.google_cloud_ai_platform.trainer import (
-    executor as ai_platform_trainer_executor,
-)
-from tfx.extensions.google_cloud_big_query.example_gen import (
-    component as big_query_example_gen_component,
-)  # pylint: disable=unused-import
-from tfx.orchestration import pipeline
-from tfx.proto import pusher_pb2
-from tfx.proto import trainer_pb2
-from tfx.types import Channel
-from tfx.types.standard_artifacts import Model
-from tfx.types.standard_artifacts import ModelBlessing
-from tfx.utils.dsl_utils import external_input
-
-from ml_metadata.proto import metadata_store_pb2
+from utils import import_timer
+
+with import_timer.track("tfx.components"):
+    from tfx.components import CsvExampleGen
+    from tfx.components import Evaluator
+    from tfx.components import ExampleValidator
+    from tfx.components import FileBasedExampleGen
+    from tfx.components import Pusher
+    from tfx.components import ResolverNode
+    from tfx.components import SchemaGen
+    from tfx.components import StatisticsGen
+    from tfx.components import Trainer
+    from tfx.components import Transform
+    from tfx.components.trainer import executor as trainer_executor
+    from tfx.dsl.components.base import executor_spec
+    from tfx.dsl.experimental import latest_artifacts_resolver
+    from tfx.dsl.experimental import latest_blessed_model_resolver
+    from tfx.orchestration import pipeline
+    from tfx.proto import pusher_pb2
+    from tfx.proto import trainer_pb2
+    from tfx.types import Channel
+    from tfx.types.standard_artifacts import Model
+    from tfx.types.standard_artifacts import ModelBlessing
+    from tfx.types.standard_artifacts import TransformCache
+    from tfx.utils.dsl_utils import external_input
+
+    from ml_metadata.proto import metadata_store_pb2
 
 from utils.query_utils import load_query_string
+from utils import perf_trace
+from utils import span_utils
 
 
 def create_pipeline(
@@ -62,15 +62,96 @@ def create_pipeline(
     enable_cache: Optional[bool] = False,
     system_config: Optional[Dict[Text, Any]] = None,
     model_config: Optional[Dict[Text, Any]] = None,
+    performance_config: Optional[Dict[Text, Any]] = None,
 ) -> pipeline.Pipeline:
     """Implements the chicago taxi pipeline with TFX."""
 
     components = []
 
     # Brings data into the pipeline or otherwise joins/converts training data.
-    example_gen = CsvExampleGen(input=external_input(data_path))
+    data_format = (model_config or {}).get("data_format") or "csv"
+    sample_rate = (model_config or {}).get("sample_rate")
+    # Span patterns, e.g. span-{SPAN}/*.csv: each run ingests the latest span only
+    input_pattern = (model_config or {}).get("input_pattern")
+    input_config = span_utils.input_config(input_pattern) if input_pattern else None
+    if data_format != "csv" and input_config is None:
+        with import_timer.track("executors.arrow_input"):
+            from executors import arrow_input
+
+        input_config = span_utils.input_config("*" + arrow_input.FILE_EXTENSIONS[data_format])
+    # Incremental statistics are computed per span by SpanStatisticsGen: the
+    # fused ones would be computed and never read
+    fused_statistics = bool(
+        performance_config
+        and performance_config.get("FUSED_STATISTICS")
+        and not performance_config.get("INCREMENTAL_STATISTICS")
+        and not sample_rate
+    )
+    if fused_statistics:  # examples and their statistics written in one pass
+        with import_timer.track("executors.fused_stats"):
+            from executors import fused_stats
+
+        example_gen = fused_stats.FusedExampleGen(
+            input_base=data_path,
+            input_config=input_config,
+            custom_config=fused_stats.fused_config(
+                data_format,
+                num_shards=performance_config.get("INGESTION_SHARDS")
+                or performance_config.get("CPU_LIMIT"),
+                block_mb=performance_config.get("INGESTION_BLOCK_MB"),
+                desired_batch_size=performance_config.get("STATS_DESIRED_BATCH_SIZE"),
+            ),
+        )
+    elif data_format != "csv":  # Parquet / Arrow IPC files, read memory-mapped
+        with import_timer.track("executors.arrow_input"):
+            from executors import arrow_input
+
+        example_gen = FileBasedExampleGen(
+            input=external_input(data_path),
+            input_config=input_config,
+            custom_config=arrow_input.arrow_input_config(
+                data_format,
+                num_shards=(performance_config or {}).get("INGESTION_SHARDS")
+                or (performance_config or {}).get("CPU_LIMIT"),
+            ),
+            custom_executor_spec=executor_spec.ExecutorClassSpec(arrow_input.Executor),
+        )
+    elif sample_rate:  # dev mode: deterministic hash sample of the CSV rows
+        with import_timer.track("executors.sampled_csv"):
+            from executors import sampled_csv
+
+        example_gen = FileBasedExampleGen(
+            input=external_input(data_path),
+            input_config=input_config,
+            custom_config=sampled_csv.sampling_config(
+                sample_rate, model_config.get("sample_key")
+            ),
+            custom_executor_spec=executor_spec.ExecutorClassSpec(sampled_csv.Executor),
+        )
+    elif performance_config and performance_config.get("CSV_INGESTION") == "columnar":
+        with import_timer.track("executors.columnar_csv"):
+            from executors import columnar_csv
+
+        example_gen = FileBasedExampleGen(
+            input=external_input(data_path),
+            input_config=input_config,
+            custom_config=columnar_csv.ingestion_config(
+                num_shards=performance_config.get("INGESTION_SHARDS")
+                or performance_config.get("CPU_LIMIT"),
+                block_mb=performance_config.get("INGESTION_BLOCK_MB"),
+            ),
+            custom_executor_spec=executor_spec.ExecutorClassSpec(columnar_csv.Executor),
+        )
+    else:
+        example_gen = CsvExampleGen(
+            input=external_input(data_path), input_config=input_config
+        )
     # TODO(step 7): (Optional) Uncomment here to use BigQuery as a data source.
     # # ExampleGen: Load the graph data from bigquery
+    # with import_timer.track("google_cloud_big_query"):
+    #     from tfx.extensions.google_cloud_big_query.example_gen import (
+    #         component as big_query_example_gen_component,
+    #     )
     # query_str = load_query_string(
     #     query,
     #     field_dict={
@@ -80,12 +161,59 @@ def create_pipeline(
     # )
     # example_gen = big_query_example_gen_component.BigQueryExampleGen(
     #     query=query)
+    # # Or reuse the Examples exported by a previous run of the same query on
+    # # the same table snapshot instead of querying again:
+    # with import_timer.track("executors.cached_query"):
+    #     from executors import cached_query
+    # example_gen = cached_query.CachedQueryExampleGen(
+    #     query=query_str,
+    #     cache_dir=os.path.join(pipeline_root, "query_cache"),
+    #     snapshot_token=model_config["query_snapshot_token"],
+    #     project=system_config["GOOGLE_CLOUD_PROJECT"],
+    # )
     components.append(example_gen)
 
+    # Rolling training window: Transform and Trainer read the latest spans.
+    training_examples = example_gen.outputs["examples"]
+    training_spans = (model_config or {}).get("training_spans")
+    if training_spans:
+        span_resolver = ResolverNode(
+            instance_name="latest_spans_resolver",
+            resolver_class=span_utils.LatestSpansResolver,
+            resolver_configs={"num_spans": training_spans},
+            examples=example_gen.outputs["examples"],
+        )
+        components.append(span_resolver)
+        training_examples = span_resolver.outputs["examples"]
+
     # Computes statistics over data for visualization and example validation.
-    statistics_gen = StatisticsGen(examples=example_gen.outputs["examples"])
+    if performance_config and performance_config.get("INCREMENTAL_STATISTICS"):
+        # Statistics of the training window, merged from per-span cached ones
+        with import_timer.track("executors.span_stats"):
+            from executors import span_stats
+
+        statistics_gen = span_stats.SpanStatisticsGen(
+            examples=training_examples,
+            cache_dir=os.path.join(pipeline_root, "stats_cache"),
+            desired_batch_size=performance_config.get("STATS_DESIRED_BATCH_SIZE"),
+        )
+    elif fused_statistics:  # already computed by ExampleGen, in the same pass
+        statistics_gen = example_gen
+    else:
+        stats_options = None
+        if performance_config and performance_config.get("STATS_DESIRED_BATCH_SIZE"):
+            with import_timer.track("tfdv"):
+                import tensorflow_data_validation as tfdv
+
+            stats_options = tfdv.StatsOptions(
+                desired_batch_size=performance_config["STATS_DESIRED_BATCH_SIZE"]
+            )
+        statistics_gen = StatisticsGen(
+            examples=example_gen.outputs["examples"], stats_options=stats_options
+        )
     # TODO(step 5): Uncomment here to add StatisticsGen to the pipeline.
-    # components.append(statistics_gen)
+    # if statistics_gen is not example_gen:  # fused: ExampleGen is already added
+    #     components.append(statistics_gen)
 
     # Generates schema based on statistics files.
     schema_gen = SchemaGen(
@@ -103,28 +231,71 @@ def create_pipeline(
     # components.append(example_validator)
 
     # Performs transformations and feature engineering in training and serving.
-    transform = Transform(
-        examples=example_gen.outputs["examples"],
-        schema=schema_gen.outputs["schema"],
-        preprocessing_fn=preprocessing_fn,
+    transform_args = {
+        "examples": training_examples,
+        "schema": schema_gen.outputs["schema"],
+        "preprocessing_fn": preprocessing_fn,
+    }
+    transform_cache_resolver = None
+    if performance_config and performance_config.get("TRANSFORM_ANALYZER_CACHE"):
+        # Analyzer accumulators are cached per input span: with a training_spans
+        # window, a run only analyzes the spans the previous cache lacks.
+        with import_timer.track("models.features"):
+            from models import features
+
+        uncached = sorted(set(features.APPROXIMATE_ANALYZERS) & set(features.VOCAB_FEATURE_KEYS))
+        if uncached:
+            # ptransform_analyzer outputs are not in tf.Transform's analyzer cache
+            logging.warning(
+                "Approximate vocabularies of %s are recomputed over the whole "
+                "window on every run, TRANSFORM_ANALYZER_CACHE does not cover them",
+                uncached,
+            )
+        transform_cache_resolver = ResolverNode(
+            instance_name="latest_transform_cache_resolver",
+            resolver_class=latest_artifacts_resolver.LatestArtifactsResolver,
+            cache=Channel(type=TransformCache),
+        )
+        transform_args["analyzer_cache"] = transform_cache_resolver.outputs["cache"]
+    # Without materialization the Trainer applies the transform graph to the raw
+    # examples in its input pipeline, instead of reading a transformed copy.
+    transform_in_trainer = bool(
+        performance_config and performance_config.get("TRANSFORM_IN_TRAINER")
     )
+    if transform_in_trainer:
+        transform_args["materialize"] = False
+    transform = Transform(**transform_args)
     # TODO(step 6): Uncomment here to add Transform to the pipeline.
+    # if transform_cache_resolver is not None:
+    #     components.append(transform_cache_resolver)
     # components.append(transform)
 
     # Uses user-provided Python function that implements a model using TF-Learn.
     trainer_args = {
         "run_fn": run_fn,
-        "transformed_examples": transform.outputs["transformed_examples"],
         "schema": schema_gen.outputs["schema"],
         "transform_graph": transform.outputs["transform_graph"],
         "train_args": train_args,
         "eval_args": eval_args,
-        "custom_config": {"model_config": model_config, "system_config": system_config},
+        "custom_config": {
+            "model_config": model_config,
+            "system_config": system_config,
+            "performance_config": performance_config,  # parallelism policy
+        },
         "custom_executor_spec": executor_spec.ExecutorClassSpec(
             trainer_executor.GenericExecutor
         ),
     }
+    if transform_in_trainer:
+        trainer_args["examples"] = training_examples
+    else:
+        trainer_args["transformed_examples"] = transform.outputs["transformed_examples"]
     if ai_platform_training_args is not None:
+        with import_timer.track("google_cloud_ai_platform.trainer"):
+            from tfx.extensions.google_cloud_ai_platform.trainer import (
+                executor as ai_platform_trainer_executor,
+            )
+
         trainer_args["custom_executor_spec"] = executor_spec.ExecutorClassSpec(
             ai_platform_trainer_executor.GenericExecutor
         )
@@ -161,6 +332,9 @@ def create_pipeline(
 
     # Uses TFMA to compute a evaluation statistics over features of a model and
     # perform quality validation of a candidate model (compared to a baseline).
+    with import_timer.track("tfma"):
+        import tensorflow_model_analysis as tfma
+
     eval_config = tfma.EvalConfig(
         model_specs=[tfma.ModelSpec(label_key="big_tipper")],
         slicing_specs=[tfma.SlicingSpec()],
@@ -205,6 +379,11 @@ def create_pipeline(
         ),
     }
     if ai_platform_serving_args is not None:
+        with import_timer.track("google_cloud_ai_platform.pusher"):
+            from tfx.extensions.google_cloud_ai_platform.pusher import (
+                executor as ai_platform_pusher_executor,
+            )
+
         pusher_args.update(
             {
                 "custom_executor_spec": executor_spec.ExecutorClassSpec(
@@ -219,6 +398,9 @@ def create_pipeline(
     # TODO(step 6): Uncomment here to add Pusher to the pipeline.
     # components.append(pusher)
 
+    if system_config is not None and system_config.get("ENABLE_PERF_TRACE"):
+        perf_trace.instrument(components)
+
     return pipeline.Pipeline(
         pipeline_name=pipeline_name,
         pipeline_root=pipeline_root,
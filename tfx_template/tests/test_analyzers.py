@@ -0,0 +1,91 @@
+# Lint as: python3
+"""Tests for models.analyzers."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import random
+
+import tensorflow as tf
+import tensorflow_transform as tft
+import tensorflow_transform.beam as tft_beam
+from tensorflow_transform.tf_metadata import dataset_metadata
+from tensorflow_transform.tf_metadata import schema_utils
+
+from models import analyzers
+
+
+class HeavyHittersTest(tf.test.TestCase):
+
+  def _sketch(self, sketch, batches):
+    accumulators = []
+    for batch in batches:
+      accumulators.append(
+          sketch.add_input(sketch.create_accumulator(), batch))
+    return sketch.extract_output(sketch.merge_accumulators(accumulators))
+
+  def testExactWithEnoughCounters(self):
+    values = [b'a'] * 5 + [b'b'] * 3 + [b'c'] * 3 + [b'd']
+    random.Random(0).shuffle(values)
+    output = self._sketch(analyzers.HeavyHitters(4),
+                          [values[:5], values[5:]])
+    self.assertEqual([(b'a', 5), (b'c', 3), (b'b', 3), (b'd', 1)], output)
+
+  def testUndercountIsBounded(self):
+    rng = random.Random(0)
+    values = [b'term%d' % min(int(rng.expovariate(0.2)), 200)
+              for _ in range(5000)]
+    num_counters = 20
+    output = dict(self._sketch(analyzers.HeavyHitters(num_counters),
+                               [values[i:i + 500]
+                                for i in range(0, len(values), 500)]))
+    self.assertLessEqual(len(output), num_counters)
+    bound = len(values) / (num_counters + 1)
+    for term, count in collections.Counter(values).items():
+      self.assertLessEqual(output.get(term, 0), count)
+      self.assertLessEqual(count - output.get(term, 0), bound)
+      if count > bound:
+        self.assertIn(term, output)
+
+  def testWriteVocabulary(self):
+    path = os.path.join(self.get_temp_dir(), 'vocab', 'company')
+    heavy_hitters = [(b'x', 9), (b'bad\nterm', 5), (b'y', 4), (b'z', 1)]
+    self.assertEqual(path, analyzers.write_vocabulary(heavy_hitters, 2, path))
+    with tf.io.gfile.GFile(path, 'rb') as fid:
+      self.assertEqual(b'x\ny\n', fid.read())
+
+
+class ApproximateVocabularyTest(tf.test.TestCase):
+
+  def testAnalyzeAndApplyWithTransform(self):
+    values = [b'a'] * 5 + [b'b'] * 3 + [b'c'] * 2 + [b'd']
+    random.Random(0).shuffle(values)
+    metadata = dataset_metadata.DatasetMetadata(
+        schema_utils.schema_from_feature_spec(
+            {'x': tf.io.FixedLenFeature([], tf.string)}))
+
+    def preprocessing_fn(inputs):
+      vocabulary = analyzers.approximate_vocabulary(
+          inputs['x'], top_k=3, num_counters=4, vocab_filename='x')
+      return {'x_xf': tft.apply_vocabulary(inputs['x'], vocabulary)}
+
+    with tft_beam.Context(temp_dir=self.get_temp_dir()):
+      (transformed, _), transform_fn = (
+          ([{'x': value} for value in values], metadata)
+          | tft_beam.AnalyzeAndTransformDataset(preprocessing_fn))
+      output_dir = os.path.join(self.get_temp_dir(), 'transform')
+      _ = transform_fn | tft_beam.WriteTransformFn(output_dir)
+
+    expected = {b'a': 0, b'b': 1, b'c': 2, b'd': -1}
+    self.assertEqual([expected[value] for value in values],
+                     [row['x_xf'] for row in transformed])
+    tf_transform_output = tft.TFTransformOutput(output_dir)
+    self.assertEqual([b'a', b'b', b'c'],
+                     tf_transform_output.vocabulary_by_name('x'))
+
+
+if __name__ == '__main__':
+  tf.test.main()
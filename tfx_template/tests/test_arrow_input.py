@@ -0,0 +1,98 @@
+# Lint as: python3
+"""Tests for the Parquet / Arrow IPC ExampleGen executor."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+from unittest import mock
+
+import pyarrow.parquet as pq
+import tensorflow as tf
+
+from executors import arrow_input
+from models import features
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+
+class ArrowInputTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ArrowInputTest, self).setUp()
+    with open(_DATA_FILE) as fid:
+      self._rows = list(csv.DictReader(fid))
+
+  def _read(self, output_dir):
+    pattern = os.path.join(output_dir, '*.gz')
+    examples = []
+    for record in tf.data.TFRecordDataset(
+        tf.io.gfile.glob(pattern), compression_type='GZIP'):
+      examples.append(tf.train.Example.FromString(record.numpy()))
+    return examples
+
+  def testProjectedColumnsIncludeLabel(self):
+    columns = arrow_input.projected_columns()
+    self.assertIn(features.LABEL_KEY, columns)
+    self.assertLen(columns, len(set(columns)))
+
+  def testConvertCsvKeepsRowsInBatches(self):
+    for data_format in arrow_input.FORMATS:
+      output_dir = os.path.join(self.get_temp_dir(), data_format)
+      [path] = arrow_input.convert_csv(
+          [_DATA_FILE], output_dir, data_format, batch_rows=5000)
+      self.assertEndsWith(path, arrow_input.FILE_EXTENSIONS[data_format])
+      units = arrow_input.plan_units(path, data_format)
+      self.assertGreater(len(units), 1)
+      rows = sum(arrow_input.read_unit(unit, data_format, ['fare']).num_rows
+                 for unit in units)
+      self.assertEqual(rows, len(self._rows))
+
+  def testConvertSplitReadsOnlyProjectedColumns(self):
+    for data_format in arrow_input.FORMATS:
+      [path] = arrow_input.convert_csv(
+          [_DATA_FILE], os.path.join(self.get_temp_dir(), data_format),
+          data_format, batch_rows=5000)
+      output_dirs = {
+          'train': os.path.join(self.get_temp_dir(), data_format, 'train'),
+          'eval': os.path.join(self.get_temp_dir(), data_format, 'eval'),
+      }
+      counts = arrow_input.convert_split(
+          [path], output_dirs, data_format, buckets=[2, 3], num_shards=2)
+      self.assertEqual(sum(counts.values()), len(self._rows))
+
+      examples = self._read(output_dirs['train']) + self._read(output_dirs['eval'])
+      self.assertLen(examples, len(self._rows))
+      feature = examples[0].features.feature
+      self.assertCountEqual(feature.keys(), arrow_input.projected_columns())
+      self.assertTrue(feature['trip_start_hour'].HasField('int64_list'))
+      self.assertTrue(feature['trip_miles'].HasField('float_list'))
+      empty = sum(not e.features.feature['pickup_latitude'].float_list.value
+                  for e in examples)
+      self.assertEqual(empty, sum(not r['pickup_latitude'] for r in self._rows))
+
+  @mock.patch.object(arrow_input, 'INFERENCE_BLOCK_BYTES', 100)
+  def testConvertCsvInfersTypesOverEveryBlock(self):
+    path = os.path.join(self.get_temp_dir(), 'mixed.csv')
+    with open(path, 'w') as fid:
+      fid.write('trip_miles,extra_count,extra_code\n')
+      fid.write(''.join('%d,%d,%d\n' % (i, i, i) for i in range(100)))
+      fid.write('1.5,2.5,A7\n')
+    [output] = arrow_input.convert_csv(
+        [path], os.path.join(self.get_temp_dir(), 'mixed'), batch_rows=10)
+    table = pq.read_table(output)
+    self.assertEqual(101, table.num_rows)
+    self.assertEqual('double', str(table.schema.field('extra_count').type))
+    self.assertEqual('string', str(table.schema.field('extra_code').type))
+    self.assertEqual('A7', table.column('extra_code')[-1].as_py())
+
+  def testUnknownFormatRaises(self):
+    with self.assertRaises(ValueError):
+      arrow_input.convert_split([_DATA_FILE], {}, 'csv')
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,84 @@
+# Lint as: python3
+"""Tests for the DirectRunner settings of local runs."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+from unittest import mock
+
+import tensorflow as tf
+from tfx.dsl.components.base import base_executor
+from tfx.dsl.components.base import executor_spec
+
+from utils import beam_utils
+
+
+class _EnvironmentExecutor(base_executor.BaseExecutor):
+
+  def Do(self, input_dict, output_dict, exec_properties):
+    return os.environ.get('OMP_NUM_THREADS')
+
+
+class Trainer(object):
+
+  def __init__(self):
+    self.executor_spec = executor_spec.ExecutorClassSpec(_EnvironmentExecutor)
+
+
+class StatisticsGen(Trainer):
+  pass
+
+
+class BeamUtilsTest(tf.test.TestCase):
+
+  def testInMemoryHasNoWorkers(self):
+    args = beam_utils.direct_runner_args({'BEAM_DIRECT_RUNNING_MODE': 'in_memory'})
+    self.assertEqual(args, {'runner': 'DirectRunner', 'direct_running_mode': 'in_memory'})
+
+  def testOneWorkerPerCpu(self):
+    args = beam_utils.direct_runner_args(
+        {'BEAM_DIRECT_RUNNING_MODE': 'multi_processing'}, cpus=8)
+    self.assertEqual(args['direct_running_mode'], 'multi_processing')
+    self.assertEqual(args['direct_num_workers'], 8)
+
+  def testMemoryBudgetCapsWorkers(self):
+    config = {
+        'BEAM_DIRECT_RUNNING_MODE': 'multi_threading',
+        'BEAM_DIRECT_NUM_WORKERS': 16,
+        'BEAM_WORKER_MEMORY_GB': 2.0,
+        'BEAM_MEMORY_BUDGET_GB': 7.0,
+    }
+    self.assertEqual(beam_utils.num_workers(config), 3)
+    config['BEAM_MEMORY_BUDGET_GB'] = 1.0
+    self.assertEqual(beam_utils.num_workers(config), 1)
+
+  def testUnknownMode(self):
+    with self.assertRaisesRegex(ValueError, 'BEAM_DIRECT_RUNNING_MODE'):
+      beam_utils.direct_runner_args({'BEAM_DIRECT_RUNNING_MODE': 'threads'})
+
+  @mock.patch.dict(os.environ, {'OMP_NUM_THREADS': '16'})
+  def testWorkerEnvironmentOnlyWithinBeamComponents(self):
+    trainer, statistics_gen = Trainer(), StatisticsGen()
+    beam_utils.confine_worker_environment(
+        [trainer, statistics_gen], {'OMP_NUM_THREADS': '2'})
+    # Left to the runner process
+    self.assertEqual(os.environ['OMP_NUM_THREADS'], '16')
+    self.assertIs(trainer.executor_spec.executor_class, _EnvironmentExecutor)
+    self.assertEqual(
+        json.loads(os.environ[beam_utils.WORKER_ENVIRONMENT]),
+        {'OMP_NUM_THREADS': '2'})
+    # Importable by path, as in the node processes of the local runners
+    path = statistics_gen.executor_spec.executor_class_path
+    module, name = path.rsplit('.', 1)
+    self.assertEqual(module, 'utils.beam_utils')
+    executor_class = beam_utils.__getattr__(name)
+    self.assertIs(executor_class, statistics_gen.executor_spec.executor_class)
+    self.assertEqual(executor_class().Do({}, {}, {}), '2')
+    self.assertEqual(os.environ['OMP_NUM_THREADS'], '16')
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,120 @@
+# Lint as: python3
+"""Tests for the query materialization cache, with SQLite as query engine."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+import sqlite3
+from unittest import mock
+
+import tensorflow as tf
+
+from executors import cached_query
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+_QUERY = 'SELECT * FROM taxi_trips WHERE trip_start_hour < {{ hour }}'
+
+
+def _value(cell):
+  for kind in (int, float):
+    try:
+      return kind(cell)
+    except ValueError:
+      pass
+  return cell or None
+
+
+class CachedQueryTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(CachedQueryTest, self).setUp()
+    self._database = os.path.join(self.get_temp_dir(), 'taxi.sqlite')
+    with open(_DATA_FILE) as fid:
+      rows = list(csv.DictReader(fid))
+    columns = list(rows[0])
+    with sqlite3.connect(self._database) as connection:
+      connection.execute('DROP TABLE IF EXISTS taxi_trips')
+      connection.execute('CREATE TABLE taxi_trips (%s)' % ', '.join(columns))
+      connection.executemany(
+          'INSERT INTO taxi_trips VALUES (%s)' % ', '.join('?' * len(columns)),
+          [[_value(row[c]) for c in columns] for row in rows])
+    self._expected = sum(int(row['trip_start_hour']) < 12 for row in rows)
+    self._queries = []
+    engine = cached_query.sqlite_engine(self._database)
+
+    def counting_engine(query):
+      self._queries.append(query)
+      return engine(query)
+
+    self._engine = counting_engine
+
+  def _materialize(self, query, token, name):
+    output_dirs = {
+        split: os.path.join(self.get_temp_dir(), name, split)
+        for split in ['train', 'eval']
+    }
+    counts = cached_query.materialize(
+        query, token, os.path.join(self.get_temp_dir(), 'cache'),
+        self._engine, output_dirs, buckets=[2, 3], num_shards=1)
+    return counts, output_dirs
+
+  def testSameQueryAndSnapshotIsQueriedOnce(self):
+    query = _QUERY.replace('{{ hour }}', '12')
+    counts, _ = self._materialize(query, '2020-12-01', 'first')
+    self.assertEqual(sum(counts.values()), self._expected)
+    cached, output_dirs = self._materialize(query, '2020-12-01', 'second')
+    self.assertEqual(cached, counts)
+    self.assertLen(self._queries, 1)
+    self.assertNotEmpty(tf.io.gfile.listdir(output_dirs['train']))
+
+  def testWhitespaceInLiteralsChangesTheKey(self):
+    keys = [
+        cached_query.cache_key(
+            "SELECT * FROM t WHERE company = '%s'" % company, '2020-12-01',
+            ['train', 'eval'], [2, 3])
+        for company in ['Taxi  Affiliation', 'Taxi Affiliation']
+    ]
+    self.assertNotEqual(keys[0], keys[1])
+
+  def testNewSnapshotOrQueryIsAMiss(self):
+    query = _QUERY.replace('{{ hour }}', '12')
+    self._materialize(query, '2020-12-01', 'first')
+    self._materialize(query, '2020-12-02', 'second')
+    self._materialize(_QUERY.replace('{{ hour }}', '13'), '2020-12-02', 'third')
+    self.assertLen(self._queries, 3)
+
+  def testWithoutSnapshotTokenAlwaysQueries(self):
+    query = _QUERY.replace('{{ hour }}', '12')
+    self._materialize(query, '', 'first')
+    self._materialize(query, '', 'second')
+    self.assertLen(self._queries, 2)
+    self.assertFalse(tf.io.gfile.exists(
+        os.path.join(self.get_temp_dir(), 'cache')))
+
+  @mock.patch.object(cached_query, 'BATCH_ROWS', 7)
+  def testStreamedBatchesPromoteUndeclaredColumns(self):
+    with sqlite3.connect(self._database) as connection:
+      connection.execute('CREATE TABLE readings (trip_miles, extra)')
+      connection.executemany(
+          'INSERT INTO readings VALUES (?, ?)',
+          [(i, i) for i in range(20)] + [(20, 20.5)] + [(21, None)])
+    output_dir = os.path.join(self.get_temp_dir(), 'readings')
+    counts = cached_query.export_query(
+        'SELECT * FROM readings', self._engine, {'train': output_dir},
+        num_shards=2)
+    self.assertEqual(counts, {'train': 22})
+    values = []
+    for record in tf.data.TFRecordDataset(
+        tf.io.gfile.glob(os.path.join(output_dir, '*')),
+        compression_type='GZIP'):
+      example = tf.train.Example.FromString(record.numpy())
+      values.extend(example.features.feature['extra'].float_list.value)
+    self.assertCountEqual(values, list(range(20)) + [20.5])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,82 @@
+# Lint as: python3
+"""Tests for the columnar CSV ExampleGen executor."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+
+import tensorflow as tf
+
+from executors import columnar_csv
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+
+class ColumnarCsvTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ColumnarCsvTest, self).setUp()
+    with open(_DATA_FILE) as fid:
+      self._rows = list(csv.DictReader(fid))
+
+  def _read(self, output_dir):
+    pattern = os.path.join(output_dir, '*.gz')
+    examples = []
+    for record in tf.data.TFRecordDataset(
+        tf.io.gfile.glob(pattern), compression_type='GZIP'):
+      examples.append(tf.train.Example.FromString(record.numpy()))
+    return examples
+
+  def testBlocksCoverEveryLineOnce(self):
+    with open(_DATA_FILE, 'rb') as fid:
+      expected = fid.read().splitlines()[1:]
+    for block_bytes in [1, 333, 1 << 20]:
+      blocks = columnar_csv.plan_blocks(_DATA_FILE, block_bytes)
+      data = b''.join(columnar_csv.read_block_bytes(b) for b in blocks)
+      self.assertEqual(data.splitlines(), expected)
+
+  def testConvertSplitIntoHashBuckets(self):
+    output_dirs = {
+        'train': os.path.join(self.get_temp_dir(), 'train'),
+        'eval': os.path.join(self.get_temp_dir(), 'eval'),
+    }
+    counts = columnar_csv.convert_split(
+        [_DATA_FILE], output_dirs, buckets=[2, 3], num_shards=3, block_mb=0.1)
+    self.assertEqual(sum(counts.values()), len(self._rows))
+    self.assertNear(counts['eval'] / len(self._rows), 1 / 3, 0.05)
+    self.assertLen(tf.io.gfile.glob(os.path.join(output_dirs['train'], '*')), 3)
+
+    examples = self._read(output_dirs['train']) + self._read(output_dirs['eval'])
+    self.assertLen(examples, len(self._rows))
+    feature = examples[0].features.feature
+    self.assertCountEqual(feature.keys(), self._rows[0].keys())
+    # Types come from features.py, empty cells are empty features
+    self.assertTrue(feature['trip_start_hour'].HasField('int64_list'))
+    self.assertTrue(feature['trip_miles'].HasField('float_list'))
+    self.assertTrue(feature['company'].HasField('bytes_list'))
+    empty = sum(not e.features.feature['pickup_latitude'].float_list.value
+                for e in examples)
+    self.assertEqual(empty, sum(not r['pickup_latitude'] for r in self._rows))
+
+  def testUnknownColumnsPromotedOverAllBlocks(self):
+    path = os.path.join(self.get_temp_dir(), 'mixed.csv')
+    with open(path, 'w') as fid:
+      fid.write('trip_miles,extra_count,extra_code,extra_empty\n')
+      fid.write(''.join('%d,%d,%d,\n' % (i, i, i) for i in range(100)))
+      fid.write('1.5,2.5,A7,\n')
+    blocks, read = columnar_csv.plan_split([path], block_mb=1e-4)
+    self.assertGreater(len(blocks), 2)
+    column_types = read.keywords['column_types']
+    self.assertEqual(column_types['extra_count'], 'float')
+    self.assertEqual(column_types['extra_code'], 'bytes')
+    self.assertEqual(column_types['extra_empty'], 'bytes')
+    tables = [read(block) for block in blocks]
+    self.assertEqual(101, sum(t.num_rows for t in tables if t is not None))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,80 @@
+# Lint as: python3
+"""Tests for the compiled pipeline package cache."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from unittest import mock
+
+import tensorflow as tf
+
+from utils import compile_cache
+
+
+class CompileCacheTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(CompileCacheTest, self).setUp()
+    self.project_dir = os.path.join(self.get_temp_dir(), 'project')
+    os.makedirs(os.path.join(self.project_dir, 'models'))
+    self.model_file = os.path.join(self.project_dir, 'models', 'model.py')
+    with open(self.model_file, 'w') as fid:
+      fid.write('HIDDEN_UNITS = [16, 8]\n')
+    patcher = mock.patch.object(
+        compile_cache, 'COMPILE_CACHE_DIR',
+        os.path.join(self.get_temp_dir(), 'cache'))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def _key(self, metadata=None):
+    return compile_cache.compile_key(
+        metadata or {'pipeline_name': 'taxi'}, 'kubeflow', self.project_dir)
+
+  def testKeyTracksConfigAndSources(self):
+    key = self._key()
+    self.assertEqual(key, self._key())
+    self.assertNotEqual(key, self._key({'pipeline_name': 'other'}))
+    with open(self.model_file, 'a') as fid:
+      fid.write('LEARNING_RATE = 0.01\n')
+    self.assertNotEqual(key, self._key())
+    with mock.patch.dict(os.environ, {'KUBEFLOW_TFX_IMAGE': 'gcr.io/p/new'}):
+      image_key = self._key()
+    self.assertNotEqual(image_key, self._key())
+    with mock.patch.dict(os.environ, {compile_cache.PIPELINE_ARGS_ENV: '/tmp/x'}):
+      self.assertEqual(key, self._key())
+
+  def testRestoreAfterSave(self):
+    key = self._key()
+    output_file = os.path.join(self.get_temp_dir(), 'taxi.tar.gz')
+    self.assertFalse(compile_cache.restore(key, output_file))
+    with open(output_file, 'wb') as fid:
+      fid.write(b'compiled')
+    compile_cache.save(key, output_file, seconds=12.5)
+    os.remove(output_file)
+    self.assertTrue(compile_cache.restore(key, output_file))
+    with open(output_file, 'rb') as fid:
+      self.assertEqual(b'compiled', fid.read())
+
+  def testRestoreWritesPipelineArgs(self):
+    key = self._key()
+    output_file = os.path.join(self.get_temp_dir(), 'pipeline.json')
+    args_file = os.path.join(self.get_temp_dir(), 'pipeline_args.json')
+    with open(output_file, 'wb') as fid:
+      fid.write(b'compiled')
+    compile_cache.save(key, output_file, seconds=3.0)
+    with mock.patch.dict(os.environ, {compile_cache.PIPELINE_ARGS_ENV: args_file}):
+      # Entry saved without the pipeline args: compile again
+      self.assertFalse(compile_cache.restore(key, output_file))
+      with open(args_file, 'w') as fid:
+        fid.write('{"pipeline_name": "taxi"}')
+      compile_cache.save(key, output_file, seconds=3.0)
+      os.remove(args_file)
+      self.assertTrue(compile_cache.restore(key, output_file))
+    with open(args_file) as fid:
+      self.assertEqual('{"pipeline_name": "taxi"}', fid.read())
+
+
+if __name__ == '__main__':
+  tf.test.main()
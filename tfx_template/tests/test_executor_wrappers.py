@@ -0,0 +1,76 @@
+# Lint as: python3
+"""Tests for the executor subclasses importable by name."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+from unittest import mock
+
+import tensorflow as tf
+
+from utils import beam_utils
+from utils import executor_wrappers
+from utils import perf_trace
+
+
+class _Executor(object):
+
+  def Do(self, input_dict, output_dict, exec_properties):
+    return os.environ.get('OMP_NUM_THREADS')
+
+
+class ExecutorWrappersTest(tf.test.TestCase):
+
+  def _reimport(self, executor_class):
+    """Recreate a wrapped class from its path, as a new process does."""
+    for module in (beam_utils, perf_trace):
+      for name in list(vars(module)):
+        if name.startswith(('WorkerEnv__', 'Traced__')):
+          delattr(module, name)
+    module, name = '{}.{}'.format(
+        executor_class.__module__, executor_class.__name__).rsplit('.', 1)
+    self.assertIn(module, ('utils.beam_utils', 'utils.perf_trace'))
+    module = beam_utils if module == 'utils.beam_utils' else perf_trace
+    return getattr(module, name)
+
+  @mock.patch.dict(os.environ, {
+      'OMP_NUM_THREADS': '16',
+      beam_utils.WORKER_ENVIRONMENT: json.dumps({'OMP_NUM_THREADS': '2'})})
+  def _assertWraps(self, executor_class, mixins):
+    for mixin in mixins:
+      self.assertTrue(issubclass(executor_class, mixin))
+    self.assertTrue(issubclass(executor_class, _Executor))
+    with mock.patch.object(perf_trace, '_write_record') as write_record:
+      self.assertEqual(executor_class().Do({}, {}, {}), '2')
+    self.assertEqual(write_record.call_count, 1)
+    self.assertEqual(os.environ['OMP_NUM_THREADS'], '16')
+
+  def testTracedWorkerEnvironment(self):
+    executor_class = perf_trace.traced(beam_utils.with_worker_environment(_Executor))
+    self.assertEqual(executor_class.__module__, 'utils.perf_trace')
+    executor_class = self._reimport(executor_class)
+    self._assertWraps(executor_class, (
+        perf_trace._TracedExecutor, beam_utils._WorkerEnvironmentExecutor))  # pylint: disable=protected-access
+
+  def testWorkerEnvironmentOfTraced(self):
+    executor_class = beam_utils.with_worker_environment(perf_trace.traced(_Executor))
+    self.assertEqual(executor_class.__module__, 'utils.beam_utils')
+    executor_class = self._reimport(executor_class)
+    self._assertWraps(executor_class, (
+        perf_trace._TracedExecutor, beam_utils._WorkerEnvironmentExecutor))  # pylint: disable=protected-access
+
+  def testWrapIsRegisteredOnce(self):
+    executor_class = perf_trace.traced(_Executor)
+    self.assertIs(executor_class, perf_trace.traced(_Executor))
+    self.assertEqual(
+        executor_class.__name__,
+        executor_wrappers.wrapped_name(_Executor, 'Traced__'))
+    with self.assertRaises(AttributeError):
+      getattr(perf_trace, 'Traced__no__such__module___Executor')
+
+
+if __name__ == '__main__':
+  tf.test.main()
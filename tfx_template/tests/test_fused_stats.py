@@ -0,0 +1,93 @@
+# Lint as: python3
+"""Tests for the ExampleGen executor computing statistics in the same pass."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+
+import pyarrow as pa
+import tensorflow as tf
+import tensorflow_data_validation as tfdv
+
+from executors import columnar_csv
+from executors import fused_stats
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+
+class FusedStatsTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(FusedStatsTest, self).setUp()
+    with open(_DATA_FILE) as fid:
+      self._rows = list(csv.DictReader(fid))
+
+  def _feature(self, statistics, name):
+    [dataset] = statistics.datasets
+    for feature in dataset.features:
+      if feature.path.step == [name] or feature.name == name:
+        return feature
+    self.fail('No statistics for %s' % name)
+
+  def testStatisticsMatchTheWrittenSplits(self):
+    output_dirs = {
+        'train': os.path.join(self.get_temp_dir(), 'train'),
+        'eval': os.path.join(self.get_temp_dir(), 'eval'),
+    }
+    blocks, read = columnar_csv.plan_split([_DATA_FILE], block_mb=0.1)
+    counts, statistics = columnar_csv.combine_shards(
+        blocks, read, output_dirs, fused_stats.StatisticsCombineFn(),
+        buckets=[2, 3], num_shards=2)
+    self.assertEqual(sum(counts.values()), len(self._rows))
+    for split, count in counts.items():
+      self.assertEqual(statistics[split].datasets[0].num_examples, count)
+
+    # Same statistics as TFDV computes over the examples written
+    for split, output_dir in output_dirs.items():
+      expected = tfdv.generate_statistics_from_tfrecord(
+          os.path.join(output_dir, '*'))
+      for name in ['trip_miles', 'pickup_latitude', 'company']:
+        got = self._feature(statistics[split], name)
+        want = self._feature(expected, name)
+        self.assertEqual(got.type, want.type)
+        if want.HasField('num_stats'):
+          self.assertNear(got.num_stats.mean, want.num_stats.mean, 1e-4)
+          self.assertEqual(got.num_stats.common_stats.num_missing,
+                           want.num_stats.common_stats.num_missing)
+        else:
+          self.assertEqual(got.string_stats.unique, want.string_stats.unique)
+
+  def testWriteStatisticsInStatisticsGenLayout(self):
+    blocks, read = columnar_csv.plan_split([_DATA_FILE])
+    _, statistics = columnar_csv.combine_shards(
+        blocks, read, {'train': os.path.join(self.get_temp_dir(), 'examples')},
+        fused_stats.StatisticsCombineFn(), num_shards=1)
+    artifact = fused_stats.standard_artifacts.ExampleStatistics()
+    artifact.uri = os.path.join(self.get_temp_dir(), 'statistics')
+    fused_stats.write_statistics(statistics, artifact)
+    loaded = tfdv.load_statistics(
+        os.path.join(artifact.uri, 'train', fused_stats.STATS_FILE_NAME))
+    self.assertEqual(loaded.datasets[0].num_examples, len(self._rows))
+    self.assertEqual(artifact.split_names, '["train"]')
+
+  def testRecordBatchesSlicedToDesiredBatchSize(self):
+    record_batch = pa.RecordBatch.from_arrays(
+        [pa.array([[float(i)] for i in range(10)])], ['x'])
+    combine_fn = fused_stats.StatisticsCombineFn(
+        tfdv.StatsOptions(desired_batch_size=4))
+    self.assertEqual(
+        [batch.num_rows for batch in combine_fn._batches(record_batch)],
+        [4, 4, 2])
+    statistics = combine_fn.extract_output(combine_fn.add_input(
+        combine_fn.create_accumulator(), record_batch))
+    self.assertEqual(statistics.datasets[0].num_examples, 10)
+    self.assertNear(
+        self._feature(statistics, 'x').num_stats.mean, 4.5, 1e-6)
+
+
+if __name__ == '__main__':
+  tf.test.main()
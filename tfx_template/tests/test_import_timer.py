@@ -0,0 +1,42 @@
+# Lint as: python3
+"""Tests for the per-component import-time accounting."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import tensorflow as tf
+
+from utils import import_timer
+
+
+class ImportTimerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ImportTimerTest, self).setUp()
+    import_timer.reset()
+
+  def testNestedComponentsAreExclusive(self):
+    with import_timer.track('parent'):
+      time.sleep(0.02)
+      with import_timer.track('child'):
+        time.sleep(0.05)
+    report = import_timer.report()
+    self.assertIn('parent', report)
+    self.assertIn('child', report)
+    self.assertLess(import_timer._RECORDS['parent'][0], 0.05)  # pylint: disable=protected-access
+    self.assertGreaterEqual(import_timer.total_seconds(), 0.07)
+
+  def testCheckBudget(self):
+    with import_timer.track('slow'):
+      time.sleep(0.01)
+    import_timer.check_budget(None)
+    import_timer.check_budget(10.0)
+    with self.assertRaisesRegex(RuntimeError, 'startup budget'):
+      import_timer.check_budget(0.0)
+
+
+if __name__ == '__main__':
+  tf.test.main()
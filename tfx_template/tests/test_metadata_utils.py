@@ -0,0 +1,84 @@
+# Lint as: python3
+"""Tests for metadata.yaml parsing utilities."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from unittest import mock
+
+import tensorflow as tf
+
+from utils import metadata_utils
+
+
+def _field(value, field_type='string'):
+  return {'description': '', 'type': field_type, 'value': value}
+
+
+class MetadataUtilsTest(tf.test.TestCase):
+
+  def testParseTemplatedFieldsOutOfOrder(self):
+    metadata = {
+        'pipeline_name': 'taxi',
+        'system_configurations': {
+            'ROOT': _field('{{ BUCKET }}/{{ pipeline_name }}'),
+            'BUCKET': _field('gs://{{ PROJECT }}'),
+            'PROJECT': _field('my-project'),
+            'ARGS': _field({'temp': '{{ ROOT }}/tmp', 'size': 50}, 'object'),
+        },
+        'model_configurations': {
+            'paths': _field(['{{ ROOT }}/a', 1], 'array'),
+            'steps': _field(10, 'int'),
+        },
+    }
+    metadata = metadata_utils.parse_templated_fields(metadata)
+    system_config = metadata_utils.get_config(metadata, 'system_configurations')
+    model_config = metadata_utils.get_config(metadata, 'model_configurations')
+    self.assertEqual('gs://my-project/taxi', system_config['ROOT'])
+    self.assertEqual({'temp': 'gs://my-project/taxi/tmp', 'size': 50},
+                     system_config['ARGS'])
+    self.assertEqual(['gs://my-project/taxi/a', 1], model_config['paths'])
+    self.assertEqual(10, model_config['steps'])
+
+  def testParseTemplatedFieldsCycle(self):
+    metadata = {
+        'system_configurations': {
+            'A': _field('{{ B }}'),
+            'B': _field('{{ A }}'),
+        },
+    }
+    with self.assertRaisesRegex(ValueError, 'A -> B -> A'):
+      metadata_utils.parse_templated_fields(metadata)
+
+  def testGetMetadataCache(self):
+    tmp_dir = self.get_temp_dir()
+    metadata_file = os.path.join(tmp_dir, 'metadata.yaml')
+    with open(metadata_file, 'w') as fid:
+      fid.write('pipeline_name: taxi\n'
+                'system_configurations:\n'
+                '  ROOT:\n'
+                '    type: string\n'
+                '    value: "gs://{{ pipeline_name }}"\n')
+
+    with mock.patch.object(metadata_utils, 'METADATA_CACHE_DIR',
+                           os.path.join(tmp_dir, 'cache')):
+      expected = metadata_utils.get_metadata(metadata_file)
+      with mock.patch.object(metadata_utils, 'parse_templated_fields',
+                             side_effect=AssertionError('cache miss')):
+        self.assertEqual(expected, metadata_utils.get_metadata(metadata_file))
+
+      # A frozen snapshot is used even without the metadata.yaml file
+      frozen_file = metadata_utils.freeze_metadata(metadata_file)
+      os.remove(metadata_file)
+      self.assertEqual(os.path.join(tmp_dir, 'metadata.frozen.json'),
+                       frozen_file)
+      self.assertEqual(expected, metadata_utils.get_metadata(metadata_file))
+      self.assertEqual(
+          'gs://taxi',
+          metadata_utils.get_config(expected)['ROOT'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
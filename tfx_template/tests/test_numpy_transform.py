@@ -0,0 +1,150 @@
+# Lint as: python3
+"""Tests for the NumPy replay of the transform graph."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+import pickle
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_transform as tft
+import tensorflow_transform.beam as tft_beam
+from tensorflow_transform.tf_metadata import dataset_metadata
+from tensorflow_transform.tf_metadata import schema_utils
+
+from models import features
+from models import numpy_transform
+from models import preprocessing
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+# Every op of preprocessing_fn, with few enough vocabulary terms for OOVs
+_FEATURES = {
+    'DENSE_FLOAT_FEATURE_KEYS': ['trip_miles', 'fare'],
+    'BUCKET_FEATURE_KEYS': ['pickup_latitude', 'dropoff_longitude'],
+    'BUCKET_FEATURE_BUCKET_COUNT': [10, 4],
+    'CATEGORICAL_FEATURE_KEYS': ['trip_start_hour'],
+    'CATEGORICAL_FEATURE_MAX_VALUES': [24],
+    'VOCAB_FEATURE_KEYS': ['payment_type', 'company'],
+    'VOCAB_SIZE': 5,
+}
+
+
+def _raw_feature_spec():
+  spec = {}
+  for key in (_FEATURES['DENSE_FLOAT_FEATURE_KEYS'] +
+              _FEATURES['BUCKET_FEATURE_KEYS']):
+    spec[key] = tf.io.VarLenFeature(tf.float32)
+  for key in _FEATURES['CATEGORICAL_FEATURE_KEYS'] + [features.LABEL_KEY]:
+    spec[key] = tf.io.VarLenFeature(tf.int64)
+  for key in _FEATURES['VOCAB_FEATURE_KEYS']:
+    spec[key] = tf.io.VarLenFeature(tf.string)
+  return spec
+
+
+def _columns(rows, spec):
+  """Raw columns of CSV rows, None for missing values."""
+  columns = {}
+  for key, feature in spec.items():
+    parse = {tf.float32: float, tf.int64: int, tf.string: str}[feature.dtype]
+    columns[key] = np.array(
+        [parse(row[key]) if row[key] else None for row in rows],
+        dtype=np.object_)
+  return columns
+
+
+def _sparse_inputs(columns, spec):
+  inputs = {}
+  for key, values in columns.items():
+    present = [i for i, value in enumerate(values) if value is not None]
+    inputs[key] = tf.SparseTensor(
+        [[i, 0] for i in present] or tf.zeros([0, 2], tf.int64),
+        tf.constant([values[i] for i in present], spec[key].dtype),
+        [len(values), 1])
+  return inputs
+
+
+class NumpyTransformTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(NumpyTransformTest, self).setUp()
+    patcher = mock.patch.multiple(features, **_FEATURES)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    with open(_DATA_FILE) as fid:
+      rows = list(csv.DictReader(fid))
+    self._spec = _raw_feature_spec()
+    self._columns = _columns(rows, self._spec)
+    # Fitted on the first half, replayed on all rows (unseen terms included)
+    fit_rows = [{key: row[key] for key in self._spec}
+                for row in rows[:len(rows) // 2]]
+    fit_columns = _columns(fit_rows, self._spec)
+    instances = [{
+        key: [] if fit_columns[key][i] is None else [fit_columns[key][i]]
+        for key in self._spec
+    } for i in range(len(fit_rows))]
+    metadata = dataset_metadata.DatasetMetadata(
+        schema_utils.schema_from_feature_spec(self._spec))
+    self._transform_graph = os.path.join(self.get_temp_dir(), 'transform')
+    with tft_beam.Context(temp_dir=os.path.join(self.get_temp_dir(), 'tmp')):
+      transform_fn = ((instances, metadata)
+                      | tft_beam.AnalyzeDataset(preprocessing.preprocessing_fn))
+      _ = transform_fn | tft_beam.WriteTransformFn(self._transform_graph)
+
+  def testMatchesTransformGraph(self):
+    tf_transform_output = tft.TFTransformOutput(self._transform_graph)
+    expected = tf_transform_output.transform_features_layer()(
+        _sparse_inputs(self._columns, self._spec))
+
+    transform = pickle.loads(pickle.dumps(
+        numpy_transform.compile_transform(self._transform_graph)))
+    got = transform(self._columns)
+
+    for key in features.transformed_names(
+        _FEATURES['DENSE_FLOAT_FEATURE_KEYS']):
+      self.assertAllClose(expected[key], got[key], rtol=1e-5, atol=1e-5)
+    for key in features.transformed_names(
+        _FEATURES['VOCAB_FEATURE_KEYS'] + _FEATURES['BUCKET_FEATURE_KEYS'] +
+        _FEATURES['CATEGORICAL_FEATURE_KEYS']):
+      self.assertAllEqual(expected[key], got[key])
+    # Some company names are out of the vocabulary, hashed into OOV buckets
+    self.assertGreater(np.max(got['company_xf']), _FEATURES['VOCAB_SIZE'])
+
+  def testNumericLookingStringFeature(self):
+    # e.g. a string column of numeric codes, parsed as numbers by the reader
+    transform = numpy_transform.compile_transform(self._transform_graph)
+    codes = [3, 17, None, 4096]
+    as_numbers = dict(self._columns)
+    as_numbers['company'] = np.array(
+        codes + [None] * (len(self._columns['company']) - len(codes)),
+        dtype=np.object_)
+    as_strings = dict(as_numbers)
+    as_strings['company'] = np.array(
+        [None if code is None else str(code) for code in as_numbers['company']],
+        dtype=np.object_)
+    expected = tft.TFTransformOutput(
+        self._transform_graph).transform_features_layer()(
+            _sparse_inputs(as_strings, self._spec))
+    self.assertAllEqual(expected['company_xf'],
+                        transform(as_numbers)['company_xf'])
+    self.assertAllEqual(transform(as_strings)['company_xf'],
+                        transform(as_numbers)['company_xf'])
+
+  def testFingerprint64MatchesTensorFlow(self):
+    terms = [b'x' * n for n in range(130)] + [
+        u'Chicago Elite Cab Corp. (Chicago Carriag'.encode('utf-8')]
+    num_buckets = 2**62
+    expected = tf.strings.to_hash_bucket_fast(terms, num_buckets)
+    self.assertAllEqual(
+        expected,
+        [numpy_transform.fingerprint64(term) % num_buckets for term in terms])
+
+
+if __name__ == '__main__':
+  tf.test.main()
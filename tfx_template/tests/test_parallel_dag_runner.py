@@ -0,0 +1,136 @@
+# Lint as: python3
+"""Tests for the parallel local DAG scheduler."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+from unittest import mock
+
+import tensorflow as tf
+from tfx.components import CsvExampleGen
+from tfx.components import ResolverNode
+from tfx.components import StatisticsGen
+from tfx.dsl.experimental import latest_artifacts_resolver
+from tfx.orchestration import metadata
+from tfx.orchestration import pipeline
+
+from utils import parallel_dag_runner
+
+_DATA = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+# ExampleGen -> (Transform, StatisticsGen) -> Trainer
+_DAG = {
+    'ExampleGen': [],
+    'Transform': ['ExampleGen'],
+    'StatisticsGen': ['ExampleGen'],
+    'Trainer': ['Transform', 'StatisticsGen'],
+}
+
+
+def _component(node_id, output_dir, fail=(), allocate_mb=0):
+  """Stand-in for a component: records its cpus, may fail or allocate."""
+  if node_id in fail:
+    raise RuntimeError(node_id)
+  data = b'x' * (allocate_mb * 1024 * 1024)  # resident, unlike bytearray(n)
+  time.sleep(0.3)
+  del data
+  with open(os.path.join(output_dir, node_id), 'w') as fid:
+    json.dump(sorted(os.sched_getaffinity(0)), fid)
+
+
+class ParallelDagSchedulerTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ParallelDagSchedulerTest, self).setUp()
+    self._output_dir = self.get_temp_dir()
+
+  def _requireCpus(self, count):
+    if len(parallel_dag_runner._available_cpus()) < count:  # pylint: disable=protected-access
+      self.skipTest(f'Needs at least {count} CPUs')
+
+  def _cpus(self, node_id):
+    with open(os.path.join(self._output_dir, node_id)) as fid:
+      return json.load(fid)
+
+  def testIndependentBranchesRunConcurrently(self):
+    self._requireCpus(2)
+    scheduler = parallel_dag_runner.ParallelDagScheduler(_DAG)
+    scheduler.run(_component, (self._output_dir,))
+    timings = scheduler.timings
+    self.assertLess(timings['Transform'][0], timings['StatisticsGen'][1])
+    self.assertLess(timings['StatisticsGen'][0], timings['Transform'][1])
+    self.assertGreaterEqual(
+        timings['Trainer'][0],
+        max(timings['Transform'][1], timings['StatisticsGen'][1]))
+    self.assertGreaterEqual(timings['Transform'][0], timings['ExampleGen'][1])
+
+  def testComponentsArePinnedToDisjointCpus(self):
+    self._requireCpus(2)
+    cpu_ids = parallel_dag_runner._available_cpus()[:2]  # pylint: disable=protected-access
+    scheduler = parallel_dag_runner.ParallelDagScheduler(
+        _DAG, component_resources={'Trainer': {'cpus': 2}}, cpu_ids=cpu_ids)
+    scheduler.run(_component, (self._output_dir,))
+    self.assertEqual(self._cpus('Trainer'), cpu_ids)
+    self.assertLen(self._cpus('Transform'), 1)
+    self.assertNotEqual(self._cpus('Transform'), self._cpus('StatisticsGen'))
+
+  def testFailureSkipsDownstreamComponents(self):
+    scheduler = parallel_dag_runner.ParallelDagScheduler(_DAG)
+    with self.assertRaisesRegex(RuntimeError, 'Transform.*Trainer'):
+      scheduler.run(_component, (self._output_dir, ('Transform',)))
+    self.assertNotIn('Trainer', scheduler.timings)
+
+  @mock.patch.object(parallel_dag_runner, 'MEMORY_POLL_SECONDS', 0.05)
+  def testMemoryLimitOnResidentMemory(self):
+    scheduler = parallel_dag_runner.ParallelDagScheduler(
+        {'ExampleGen': []}, default_resources={'memory_gb': 1.5})
+    with self.assertRaisesRegex(RuntimeError, 'ExampleGen'):
+      scheduler.run(_component, (self._output_dir, (), 2048))
+    # Under the limit
+    scheduler.run(_component, (self._output_dir, (), 64))
+
+  def testInvalidDag(self):
+    with self.assertRaisesRegex(ValueError, 'unknown'):
+      parallel_dag_runner.ParallelDagScheduler({'Trainer': ['Transform']})
+    scheduler = parallel_dag_runner.ParallelDagScheduler(
+        {'Transform': ['Trainer'], 'Trainer': ['Transform']})
+    with self.assertRaisesRegex(ValueError, 'Cyclic'):
+      scheduler.run(_component, (self._output_dir,))
+
+
+class ParallelLocalDagRunnerTest(tf.test.TestCase):
+
+  def testRunPipelineWithResolverNode(self):
+    root = self.get_temp_dir()
+    input_base = os.path.join(root, 'data')
+    os.makedirs(input_base)
+    shutil.copy(os.path.join(_DATA, 'data.csv'), input_base)
+    example_gen = CsvExampleGen(input_base=input_base)
+    resolver = ResolverNode(
+        instance_name='latest_examples_resolver',
+        resolver_class=latest_artifacts_resolver.LatestArtifactsResolver,
+        examples=example_gen.outputs['examples'])
+    statistics_gen = StatisticsGen(examples=resolver.outputs['examples'])
+    metadata_path = os.path.join(root, 'metadata.db')
+    dsl_pipeline = pipeline.Pipeline(
+        pipeline_name='parallel',
+        pipeline_root=os.path.join(root, 'pipeline_root'),
+        components=[example_gen, resolver, statistics_gen],
+        metadata_connection_config=metadata.sqlite_metadata_connection_config(
+            metadata_path))
+
+    parallel_dag_runner.ParallelLocalDagRunner(max_workers=2).run(dsl_pipeline)
+
+    with metadata.Metadata(metadata.sqlite_metadata_connection_config(
+        metadata_path)) as m:
+      self.assertLen(m.store.get_executions(), 3)
+      self.assertLen(m.store.get_artifacts_by_type('ExampleStatistics'), 1)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,64 @@
+# Lint as: python3
+"""Tests for the parallelism policy."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+from unittest import mock
+
+import tensorflow as tf
+
+from utils import parallelism
+
+
+class ParallelismTest(tf.test.TestCase):
+
+  def _write(self, name, content):
+    path = os.path.join(self.get_temp_dir(), name)
+    with open(path, 'w') as fid:
+      fid.write(content)
+    return path
+
+  def _limit(self, v2=None, quota=None, period=None):
+    missing = os.path.join(self.get_temp_dir(), 'missing')
+    with mock.patch.multiple(
+        parallelism,
+        CGROUP_V2_CPU_MAX=self._write('cpu.max', v2) if v2 else missing,
+        CGROUP_V1_QUOTA=self._write('quota', quota) if quota else missing,
+        CGROUP_V1_PERIOD=self._write('period', period) if period else missing):
+      return parallelism.cgroup_cpu_limit(), parallelism.available_cpus()
+
+  def testCgroupV2Quota(self):
+    limit, cpus = self._limit(v2='150000 100000\n')
+    self.assertEqual(limit, 1.5)
+    self.assertLessEqual(cpus, 2)
+    self.assertIsNone(self._limit(v2='max 100000\n')[0])
+
+  def testCgroupV1Quota(self):
+    self.assertEqual(self._limit(quota='400000\n', period='100000\n')[0], 4.0)
+    self.assertIsNone(self._limit(quota='-1\n', period='100000\n')[0])
+    self.assertIsNone(self._limit()[0])
+
+  def testResolve(self):
+    policy = parallelism.resolve({'CPU_LIMIT': 8, 'TF_DATA_THREADS': 3})
+    self.assertEqual(policy, {
+        'cpus': 8,
+        'intra_op_threads': 8,
+        'inter_op_threads': 2,
+        'tf_data_threads': 3,
+    })
+    self.assertEqual(parallelism.resolve()['cpus'], parallelism.available_cpus())
+
+  def testWorkerEnvironmentSplitsCpus(self):
+    environment = parallelism.worker_environment({'cpus': 8}, 4)
+    self.assertEqual(environment['TF_NUM_INTRAOP_THREADS'], '2')
+    self.assertEqual(environment['OMP_NUM_THREADS'], '2')
+    self.assertEqual(
+        parallelism.worker_environment({'cpus': 2}, 4)['TF_NUM_INTRAOP_THREADS'],
+        '1')
+
+
+if __name__ == '__main__':
+  tf.test.main()
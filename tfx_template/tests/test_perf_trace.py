@@ -0,0 +1,92 @@
+# Lint as: python3
+"""Tests for the per-component performance tracing."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import types
+from unittest import mock
+
+import tensorflow as tf
+
+from utils import perf_trace
+
+
+class _Executor(object):
+  """Minimal executor writing its output."""
+
+  def Do(self, input_dict, output_dict, exec_properties):
+    if exec_properties.get('fail'):
+      raise ValueError('failed')
+    for artifact in output_dict['examples']:
+      os.makedirs(artifact.uri)
+      with open(os.path.join(artifact.uri, 'data'), 'wb') as fid:
+        fid.write(b'0' * 1024 * 1024)
+
+
+class PerfTraceTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(PerfTraceTest, self).setUp()
+    self._pipeline_root = os.path.join(self.get_temp_dir(), 'root')
+
+  def _run(self, component, execution, **exec_properties):
+    uri = os.path.join(self._pipeline_root, component, 'examples', execution)
+    executor = perf_trace.traced(_Executor)()
+    executor.Do({}, {'examples': [types.SimpleNamespace(uri=uri)]}, exec_properties)
+
+  def testTracedClassIsImportableByName(self):
+    traced = perf_trace.traced(_Executor)
+    self.assertEqual(traced.__module__, perf_trace.__name__)
+    self.assertIs(getattr(perf_trace, traced.__name__), traced)
+    self.assertTrue(issubclass(traced, _Executor))
+
+  def testRecordsAndReport(self):
+    self._run('CsvExampleGen', '1')
+    self._run('Transform', '2')
+    with self.assertRaises(ValueError):
+      self._run('Trainer', '3', fail=True)
+
+    records = perf_trace.load_records(self._pipeline_root)
+    self.assertEqual([r['component'] for r in records],
+                     ['CsvExampleGen', 'Transform', 'Trainer'])
+    self.assertEqual(records[0]['pipeline_root'], self._pipeline_root)
+    self.assertEqual(records[2]['status'], 'failed')
+    self.assertGreaterEqual(records[0]['write_bytes'], 1024 * 1024)
+    self.assertGreater(records[0]['peak_rss_bytes'], 0)
+
+    table = perf_trace.write_report(self._pipeline_root)
+    self.assertIn('Transform', table)
+    trace_dir = perf_trace.trace_dir(self._pipeline_root)
+    with open(os.path.join(trace_dir, 'trace.json')) as fid:
+      events = json.load(fid)['traceEvents']
+    spans = [e for e in events if e['ph'] == 'X']
+    self.assertLen(spans, 3)
+    self.assertEqual(len({e['tid'] for e in spans}), 3)
+    self.assertTrue(os.path.exists(os.path.join(trace_dir, 'summary.txt')))
+
+  def testChildrenPeakOnlyWhenItRoseDuringTheExecution(self):
+    children_peak = 1 << 50  # e.g. a Beam worker of an earlier component
+    with mock.patch.object(
+        perf_trace, '_children_peak_rss', return_value=children_peak):
+      self.assertLess(perf_trace._peak_rss(children_peak), children_peak)  # pylint: disable=protected-access
+      self.assertEqual(perf_trace._peak_rss(0), children_peak)  # pylint: disable=protected-access
+
+  def testInstrument(self):
+    spec = types.SimpleNamespace(executor_class=_Executor, executor_class_path='x')
+    component = types.SimpleNamespace(executor_spec=spec)
+    resolver = types.SimpleNamespace()
+    perf_trace.instrument([component, resolver])
+    perf_trace.instrument([component])  # idempotent
+    traced = component.executor_spec.executor_class
+    self.assertIs(traced, perf_trace.traced(_Executor))
+    self.assertEqual(component.executor_spec.executor_class_path,
+                     f'utils.perf_trace.{traced.__name__}')
+    self.assertIs(spec.executor_class, _Executor)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,95 @@
+# Lint as: python3
+"""Tests for the pipeline definition, as completed by the template steps."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import types
+
+import tensorflow as tf
+from tfx.dsl.compiler import compiler
+from tfx.proto import trainer_pb2
+
+from pipeline import pipeline
+
+_STEP = re.compile(r'^\s*# TODO\(step (\d+)\): Uncomment here')
+
+
+def _pipeline_module(steps):
+  """pipeline.py with the components of the given template steps added."""
+  lines, uncomment = [], False
+  with open(pipeline.__file__) as fid:
+    for line in fid:
+      match = _STEP.match(line)
+      if match:
+        uncomment = int(match.group(1)) in steps
+      elif uncomment and line.lstrip().startswith('# '):
+        line = line.replace('# ', '', 1)
+      else:
+        uncomment = False
+      lines.append(line)
+  module = types.ModuleType('completed_pipeline')
+  module.__file__ = pipeline.__file__
+  exec(compile(''.join(lines), pipeline.__file__, 'exec'), module.__dict__)  # pylint: disable=exec-used
+  return module
+
+
+def _create_pipeline(module, root, performance_config=None):
+  return module.create_pipeline(
+      pipeline_name='taxi',
+      pipeline_root=os.path.join(root, 'pipeline_root'),
+      data_path=os.path.join(root, 'data'),
+      preprocessing_fn='models.preprocessing.preprocessing_fn',
+      run_fn='models.keras.model.run_fn',
+      train_args=trainer_pb2.TrainArgs(num_steps=10),
+      eval_args=trainer_pb2.EvalArgs(num_steps=5),
+      eval_accuracy_threshold=0.6,
+      serving_model_dir=os.path.join(root, 'serving_model'),
+      model_config={'input_pattern': 'span-{SPAN}/*.csv', 'training_spans': 3},
+      performance_config=performance_config or {'TRANSFORM_ANALYZER_CACHE': True},
+  )
+
+
+class PipelineTest(tf.test.TestCase):
+
+  def _node_ids(self, dsl_pipeline):
+    return [component.id for component in dsl_pipeline.components]
+
+  def testTransformCacheResolverOnlyWithTransform(self):
+    dsl_pipeline = _create_pipeline(pipeline, self.get_temp_dir())
+    self.assertNotIn('ResolverNode.latest_transform_cache_resolver',
+                     self._node_ids(dsl_pipeline))
+
+  def testCompileTransformWithCacheOverSpanWindow(self):
+    dsl_pipeline = _create_pipeline(
+        _pipeline_module(steps=(5, 6)), self.get_temp_dir())
+    node_ids = self._node_ids(dsl_pipeline)
+    self.assertEqual(
+        1, node_ids.count('ResolverNode.latest_transform_cache_resolver'))
+    self.assertEqual(1, node_ids.count('CsvExampleGen'))
+
+    compiled = compiler.Compiler().compile(dsl_pipeline)
+    nodes = {node.pipeline_node.node_info.id: node.pipeline_node
+             for node in compiled.nodes}
+    inputs = nodes['Transform'].inputs.inputs
+    self.assertEqual(
+        'ResolverNode.latest_spans_resolver',
+        inputs['examples'].channels[0].producer_node_query.id)
+    self.assertEqual(
+        'ResolverNode.latest_transform_cache_resolver',
+        inputs['analyzer_cache'].channels[0].producer_node_query.id)
+
+  def testIncrementalStatisticsWithoutFusedOnes(self):
+    dsl_pipeline = _create_pipeline(
+        pipeline, self.get_temp_dir(),
+        {'FUSED_STATISTICS': True, 'INCREMENTAL_STATISTICS': True})
+    node_ids = self._node_ids(dsl_pipeline)
+    self.assertIn('CsvExampleGen', node_ids)
+    self.assertNotIn('FusedExampleGen', node_ids)
+
+
+if __name__ == '__main__':
+  tf.test.main()
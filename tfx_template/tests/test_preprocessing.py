@@ -27,6 +27,21 @@ class PreprocessingTest(tf.test.TestCase):
   def testPreprocessingFn(self):
     self.assertTrue(callable(preprocessing.preprocessing_fn))
 
+  def testFusedFillInMissingMatchesPerFeatureFill(self):
+    inputs = {
+        'a': tf.SparseTensor([[0, 0], [2, 0]], [1.5, 2.5], [3, 1]),
+        'b': tf.SparseTensor([[1, 0]], [7.0], [3, 1]),
+        'c': tf.SparseTensor([[0, 0], [1, 0]], ['x', 'y'], [3, 1]),
+        'd': tf.SparseTensor(
+            tf.zeros([0, 2], tf.int64), tf.zeros([0], tf.int64), [3, 0]),
+        'e': tf.constant([[1], [2], [3]], dtype=tf.int64),
+    }
+    filled = preprocessing._fill_in_missing_fused(inputs, list(inputs))  # pylint: disable=protected-access
+    self.assertCountEqual(filled.keys(), inputs.keys())
+    for key, value in inputs.items():
+      self.assertAllEqual(
+          filled[key], preprocessing._fill_in_missing(value))  # pylint: disable=protected-access
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,87 @@
+# Lint as: python3
+"""Tests for the hash-sampled CSV ExampleGen executor."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+
+import apache_beam as beam
+from apache_beam.testing import util
+import tensorflow as tf
+from google.protobuf import json_format
+
+from executors import custom_config
+from executors import sampled_csv
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+
+class SampledCsvTest(tf.test.TestCase):
+
+  def testHashFractionIsDeterministicAndUniform(self):
+    self.assertEqual(sampled_csv.hash_fraction('a,b'),
+                     sampled_csv.hash_fraction(b'a,b'))
+    fractions = [sampled_csv.hash_fraction(str(i)) for i in range(20000)]
+    self.assertTrue(all(0 <= f < 1 for f in fractions))
+    self.assertNear(sum(f < 0.1 for f in fractions) / 20000, 0.1, 0.01)
+
+  def testSamplingConfigRoundTrip(self):
+    config = sampled_csv.sampling_config(0.25, 'company')
+    exec_properties = {'custom_config': json_format.MessageToJson(config)}
+    self.assertEqual(
+        custom_config.unpack(exec_properties, {}),
+        {'sample_rate': 0.25, 'sample_key': 'company'})
+    self.assertEqual(
+        custom_config.unpack({}, {'sample_rate': 1.0}),
+        {'sample_rate': 1.0})
+
+  def testLineKey(self):
+    self.assertEqual(sampled_csv.line_key('a,b,c', 1), 'b')
+    self.assertEqual(sampled_csv.line_key('a,,c', 1), '')
+    self.assertEqual(sampled_csv.line_key('a', 2), '')
+    self.assertEqual(
+        sampled_csv.line_key('"Taxi, Inc.",7,"x ""y"""', 1), '7')
+    self.assertEqual(
+        sampled_csv.line_key('"Taxi, Inc.",7,"x ""y"""', 2), 'x "y"')
+
+  def testSampledByKeyBeforeParsing(self):
+    with open(os.path.join(_DATA_DIR, 'data.csv')) as fid:
+      rows = list(csv.DictReader(fid))
+    expected = sum(
+        sampled_csv.hash_fraction(row['company']) < 0.2 for row in rows)
+    exec_properties = {
+        'input_base': _DATA_DIR,
+        'custom_config': json_format.MessageToJson(
+            sampled_csv.sampling_config(0.2, 'company')),
+    }
+    with beam.Pipeline() as pipeline:
+      examples = (
+          pipeline
+          | 'ToTFExample' >> sampled_csv._SampledCsvToExample(  # pylint: disable=protected-access
+              exec_properties=exec_properties, split_pattern='data.csv'))
+      util.assert_that(
+          examples | beam.combiners.Count.Globally(), util.equal_to([expected]))
+
+  def testSampledRowsAreReproducible(self):
+    with open(os.path.join(_DATA_DIR, 'data.csv')) as fid:
+      lines = fid.read().splitlines()[1:]
+    expected = sum(sampled_csv.hash_fraction(line) < 0.1 for line in lines)
+    exec_properties = {
+        'input_base': _DATA_DIR,
+        'custom_config': json_format.MessageToJson(
+            sampled_csv.sampling_config(0.1)),
+    }
+    with beam.Pipeline() as pipeline:
+      examples = (
+          pipeline
+          | 'ToTFExample' >> sampled_csv._SampledCsvToExample(  # pylint: disable=protected-access
+              exec_properties=exec_properties, split_pattern='data.csv'))
+      util.assert_that(
+          examples | beam.combiners.Count.Globally(), util.equal_to([expected]))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,75 @@
+# Lint as: python3
+"""Tests for statistics merged from per-span cached accumulators."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import tensorflow as tf
+import tensorflow_data_validation as tfdv
+from tfx.types import artifact_utils
+from tfx.types import standard_artifacts
+
+from executors import columnar_csv
+from executors import span_stats
+from utils import span_utils
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+
+class SpanStatsTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(SpanStatsTest, self).setUp()
+    root = self.get_temp_dir()
+    self._cache = span_stats.AccumulatorCache(os.path.join(root, 'cache'))
+    self._spans = []
+    paths = span_utils.partition_csv(_DATA_FILE, os.path.join(root, 'csv'), 2)
+    for span, path in enumerate(paths, 1):
+      examples = standard_artifacts.Examples()
+      examples.uri = os.path.join(root, 'examples', str(span))
+      examples.span = span
+      examples.split_names = artifact_utils.encode_split_names(['train', 'eval'])
+      columnar_csv.convert_split(
+          [path],
+          {s: os.path.join(examples.uri, s) for s in ['train', 'eval']},
+          buckets=[2, 3], num_shards=1)
+      self._spans.append(examples)
+
+  def testWindowStatisticsMatchFullComputation(self):
+    statistics = span_stats.window_statistics(self._spans, self._cache)
+    for split in ['train', 'eval']:
+      expected = tfdv.generate_statistics_from_tfrecord(os.path.join(
+          self.get_temp_dir(), 'examples', '*', split, '*'))
+      got, want = statistics[split].datasets[0], expected.datasets[0]
+      self.assertEqual(got.num_examples, want.num_examples)
+      self.assertCountEqual([f.path.step[0] for f in got.features],
+                            [f.path.step[0] for f in want.features])
+
+  def testCachedSpansAreNotReadAgain(self):
+    first = span_stats.window_statistics(self._spans, self._cache)
+    tf.io.gfile.rmtree(self._spans[0].uri)
+    second = span_stats.window_statistics(self._spans, self._cache)
+    self.assertEqual(first, second)
+
+    # A new version of the span is a cache miss
+    self._spans[0].version = 1
+    with self.assertRaises(RuntimeError):
+      span_stats.window_statistics(self._spans, self._cache)
+
+  def testReingestedSpanIsNotReadFromCache(self):
+    span_stats.window_statistics(self._spans, self._cache)
+    # Same input and span, output of another ExampleGen execution
+    reingested = standard_artifacts.Examples()
+    reingested.uri = os.path.join(self.get_temp_dir(), 'examples', 'reingested')
+    reingested.span = self._spans[0].span
+    reingested.split_names = self._spans[0].split_names
+    with self.assertRaises(RuntimeError):
+      span_stats.window_statistics([reingested], self._cache)
+
+
+if __name__ == '__main__':
+  tf.test.main()
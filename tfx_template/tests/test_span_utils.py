@@ -0,0 +1,65 @@
+# Lint as: python3
+"""Tests for span-based ingestion utilities."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+
+import tensorflow as tf
+from tfx.types import standard_artifacts
+
+from utils import span_utils
+
+_DATA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
+
+
+def _examples(artifact_id, span, version=0):
+  artifact = standard_artifacts.Examples()
+  artifact.id = artifact_id
+  artifact.span = span
+  artifact.version = version
+  return artifact
+
+
+class SpanUtilsTest(tf.test.TestCase):
+
+  def testPartitionCsvIntoChronologicalSpans(self):
+    output_dir = self.get_temp_dir()
+    paths = span_utils.partition_csv(_DATA_FILE, output_dir, 4, upto=2)
+    self.assertEqual(paths, [
+        os.path.join(output_dir, 'span-1', 'data.csv'),
+        os.path.join(output_dir, 'span-2', 'data.csv'),
+    ])
+    paths = span_utils.partition_csv(_DATA_FILE, output_dir, 4)
+    spans = []
+    for path in paths:
+      with open(path) as fid:
+        spans.append([int(r['trip_start_timestamp']) for r in csv.DictReader(fid)])
+    with open(_DATA_FILE) as fid:
+      self.assertEqual(sum(map(len, spans)), len(list(csv.DictReader(fid))))
+    for older, newer in zip(spans, spans[1:]):
+      self.assertLessEqual(max(older), min(newer))
+
+  def testLatestSpansKeepsNewestVersionOfEachSpan(self):
+    artifacts = [
+        _examples(1, span=1), _examples(2, span=2), _examples(3, span=3),
+        _examples(4, span=2, version=1), _examples(5, span=3),
+    ]
+    resolved = span_utils.latest_spans(artifacts, 2)
+    self.assertEqual([a.id for a in resolved], [4, 5])
+    self.assertLen(span_utils.latest_spans(artifacts, 10), 3)
+
+  def testResolverWaitsForExamples(self):
+    resolver = span_utils.LatestSpansResolver(num_spans=2)
+    self.assertIsNone(resolver.resolve_artifacts(None, {'examples': []}))
+    resolved = resolver.resolve_artifacts(
+        None, {'examples': [_examples(1, span=1), _examples(2, span=5)]})
+    self.assertEqual([a.span for a in resolved['examples']], [1, 5])
+
+
+if __name__ == '__main__':
+  tf.test.main()
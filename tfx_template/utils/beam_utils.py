@@ -0,0 +1,113 @@
+"""Beam DirectRunner settings derived from `performance_configurations`.
+
+Without explicit arguments the DirectRunner executes StatisticsGen,
+Transform and Evaluator in a single thread. `direct_runner_args` turns the
+performance section of metadata.yaml into the `beam_pipeline_args` dict
+taken by `create_pipeline`, sizing the worker pool from the CPUs of the
+parallelism policy (see parallelism.py) and the memory budget.
+
+The multi-processing workers inherit the environment of the executor, which
+`confine_worker_environment` sets to the workers' thread environment only
+while a Beam component executes. Exporting it for the whole run would also
+pin the runner process, in which LocalDagRunner trains the model.
+"""
+
+import os
+import json
+import contextlib
+from typing import Any, Dict, List, Optional, Text
+
+from utils import executor_wrappers
+from utils import parallelism
+
+RUNNING_MODES = ("in_memory", "multi_threading", "multi_processing")
+# Thread environment of the Beam workers (JSON), inherited by the node
+# processes of ParallelLocalDagRunner
+WORKER_ENVIRONMENT = "BEAM_WORKER_ENVIRONMENT"
+# Components running TensorFlow in the executor process rather than in Beam
+IN_PROCESS_COMPONENTS = ("Trainer", "Tuner")
+_PREFIX = "WorkerEnv__"
+
+
+def num_workers(performance_config: Dict[Text, Any], cpus: Optional[int] = None) -> int:
+    """Worker count: configured or one per CPU, within the memory budget."""
+    workers = (
+        performance_config.get("BEAM_DIRECT_NUM_WORKERS")
+        or cpus
+        or parallelism.resolve(performance_config)["cpus"]
+    )
+    budget_gb = performance_config.get("BEAM_MEMORY_BUDGET_GB")
+    worker_gb = performance_config.get("BEAM_WORKER_MEMORY_GB")
+    if budget_gb and worker_gb:
+        workers = min(workers, int(budget_gb // worker_gb))
+    return max(1, int(workers))
+
+
+def direct_runner_args(
+    performance_config: Dict[Text, Any], cpus: Optional[int] = None
+) -> Dict[Text, Any]:
+    """`beam_pipeline_args` running the DirectRunner on several workers."""
+    running_mode = performance_config.get("BEAM_DIRECT_RUNNING_MODE") or "in_memory"
+    if running_mode not in RUNNING_MODES:
+        raise(
+            ValueError(
+                f"Unrecognized BEAM_DIRECT_RUNNING_MODE: {running_mode}, "
+                f"expected one of {RUNNING_MODES}"
+            )
+        )
+    args = {"runner": "DirectRunner", "direct_running_mode": running_mode}
+    if running_mode != "in_memory":
+        args["direct_num_workers"] = num_workers(performance_config, cpus)
+    return args
+
+
+@contextlib.contextmanager
+def worker_environment():
+    """Export the `WORKER_ENVIRONMENT` variables within the block only."""
+    environment = json.loads(os.environ.get(WORKER_ENVIRONMENT) or "{}")
+    saved = {key: os.environ.get(key) for key in environment}
+    os.environ.update(environment)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class _WorkerEnvironmentExecutor(object):
+    """Executor mixin spawning the Beam workers in their thread environment."""
+
+    def Do(self, input_dict, output_dict, exec_properties):
+        with worker_environment():
+            return super().Do(input_dict, output_dict, exec_properties)
+
+
+def with_worker_environment(executor_class):
+    """The subclass of `executor_class` setting the worker environment."""
+    return executor_wrappers.wrap(executor_class, _WorkerEnvironmentExecutor, _PREFIX)
+
+
+# Recreate wrapped executor classes on import, e.g. in a node process
+__getattr__ = executor_wrappers.module_getattr(__name__, _PREFIX, with_worker_environment)
+
+
+def confine_worker_environment(components: List, environment: Dict[Text, Text]):
+    """Apply `environment` to the executors of `components` only, in place.
+
+    The components of `IN_PROCESS_COMPONENTS`, and those running a container
+    image or without an executor class (e.g. ResolverNode), are left alone.
+    """
+    os.environ[WORKER_ENVIRONMENT] = json.dumps(environment)
+    for component in components:
+        spec = getattr(component, "executor_spec", None)
+        executor_class = getattr(spec, "executor_class", None)
+        if (
+            executor_class is None
+            or issubclass(executor_class, _WorkerEnvironmentExecutor)
+            or type(component).__name__ in IN_PROCESS_COMPONENTS
+        ):
+            continue
+        executor_wrappers.set_executor_class(component, with_worker_environment(executor_class))
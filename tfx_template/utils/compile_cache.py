@@ -0,0 +1,130 @@
+"""Cache of compiled pipeline packages keyed on the pipeline inputs.
+
+`tfx pipeline create/update` re-executes kubeflow_runner.py, which compiles
+the whole pipeline again even when nothing changed. The compiled Argo /
+KFP v2 spec only depends on the resolved metadata, the pipeline sources and
+the image / project handed over by the tfx CLI through the environment, so
+it is stored under a hash of those and copied back on a hit.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import pathlib
+from absl import logging
+from typing import Dict, Optional, Text
+
+# Get project directory
+PROJECT_DIR = str(pathlib.Path(__file__).parent.parent)
+COMPILE_CACHE_DIR = os.environ.get(
+    "RECIPE_COMPILE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "recipe", "compile"),
+)
+# When set, every hit / miss is appended to this JSONL file for CI reports
+COMPILE_REPORT_FILE = os.environ.get("RECIPE_COMPILE_REPORT")
+
+# Pipeline sources, relative to the project directory
+SOURCE_DIRS = ("executors", "models", "pipeline", "utils")
+SOURCE_FILES = ("kubeflow_runner.py",)
+# Variables of the tfx CLI read by kubeflow_runner.py (labels.*_ENV). Not a
+# prefix match: the CLI also sets per-invocation temporary paths.
+ENV_VARS = ("KUBEFLOW_TFX_IMAGE", "TFX_IMAGE", "GCP_PROJECT_ID", "API_KEY", "run")
+# The tfx CLI reads the pipeline args that pipeline.Pipeline() writes here
+PIPELINE_ARGS_ENV = "TFX_JSON_EXPORT_PIPELINE_ARGS_PATH"
+PIPELINE_ARGS_FILE = "pipeline_args.json"
+
+
+def _tfx_version() -> Text:
+    try:
+        from tfx import version
+
+        return version.__version__
+    except ImportError:
+        return ""
+
+
+def compile_key(metadata: Dict, runner_type: Text, project_dir: Text = PROJECT_DIR) -> Text:
+    """Hash of everything the compiled pipeline package depends on."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(metadata, sort_keys=True, default=str).encode())
+    digest.update(f"\0{runner_type}\0{_tfx_version()}\0".encode())
+    for name in ENV_VARS:
+        if name in os.environ:
+            digest.update(f"{name}={os.environ[name]}\0".encode())
+
+    paths = [os.path.join(project_dir, f) for f in SOURCE_FILES]
+    for source_dir in SOURCE_DIRS:
+        for root, dirs, files in os.walk(os.path.join(project_dir, source_dir)):
+            dirs[:] = [d for d in dirs if d != "__pycache__"]
+            paths.extend(os.path.join(root, f) for f in files if not f.endswith(".pyc"))
+    for path in sorted(paths):
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.relpath(path, project_dir).encode() + b"\0")
+        with open(path, "rb") as fid:
+            digest.update(hashlib.sha256(fid.read()).digest())
+    return digest.hexdigest()
+
+
+def _entry_dir(key: Text) -> Text:
+    return os.path.join(COMPILE_CACHE_DIR, key)
+
+
+def _report(result: Text, key: Text, output_file: Text, seconds: Optional[float]):
+    """Log a hit or a miss, with the compile time it took or saved."""
+    record = {"result": result, "key": key[:12], "output": output_file, "seconds": seconds}
+    logging.info(
+        "Compile cache %s for %s (%s %.1fs)",
+        result,
+        output_file,
+        "saved" if result == "hit" else "compiled in",
+        seconds or 0.0,
+    )
+    if COMPILE_REPORT_FILE:
+        with open(COMPILE_REPORT_FILE, "a") as fid:
+            fid.write(json.dumps(record) + "\n")
+
+
+def restore(key: Text, output_file: Text) -> bool:
+    """Copy a previously compiled package to `output_file` if there is one.
+
+    When the tfx CLI asks for the pipeline args, they are written from the
+    entry too, as pipeline.Pipeline() is not built on a hit.
+    """
+    cached_file = os.path.join(_entry_dir(key), os.path.basename(output_file))
+    pipeline_args_path = os.environ.get(PIPELINE_ARGS_ENV)
+    try:
+        with open(os.path.join(_entry_dir(key), "entry.json"), "r") as fid:
+            entry = json.load(fid)
+        if pipeline_args_path:
+            shutil.copyfile(
+                os.path.join(_entry_dir(key), PIPELINE_ARGS_FILE), pipeline_args_path
+            )
+        shutil.copyfile(cached_file, output_file)
+    except (OSError, ValueError):
+        return False
+    _report("hit", key, output_file, entry.get("seconds"))
+    return True
+
+
+def save(key: Text, output_file: Text, seconds: float):
+    """Store a freshly compiled package; caching failures are not fatal."""
+    _report("miss", key, output_file, seconds)
+    entry_dir = _entry_dir(key)
+    tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        shutil.copyfile(output_file, os.path.join(tmp_dir, os.path.basename(output_file)))
+        pipeline_args_path = os.environ.get(PIPELINE_ARGS_ENV)
+        if pipeline_args_path and os.path.isfile(pipeline_args_path):
+            shutil.copyfile(pipeline_args_path, os.path.join(tmp_dir, PIPELINE_ARGS_FILE))
+        with open(os.path.join(tmp_dir, "entry.json"), "w") as fid:
+            json.dump({"seconds": seconds, "created": time.time()}, fid)
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+    except OSError as e:
+        logging.warning("Cannot cache compiled pipeline %s: %s", output_file, e)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
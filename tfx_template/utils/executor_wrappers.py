@@ -0,0 +1,69 @@
+"""Executor subclasses adding a mixin, importable by name.
+
+A component runs its executor from `executor_class_path`, imported again by
+the node processes of the local runners and by the container entrypoint on
+Kubeflow. `wrap` therefore registers the subclass in the module of its
+mixin, under a name encoding the path of the wrapped executor, and
+`module_getattr` gives that module a `__getattr__` recreating it from the
+name alone. Wrappers nest: a wrapped class can be wrapped again, in any
+order (e.g. perf_trace on top of beam_utils).
+"""
+
+import sys
+import copy
+import importlib
+from typing import Callable, Text
+
+# Module dots and the module / class boundary in wrapped class names
+_DOT, _SEP = "__", "___"
+
+
+def wrapped_name(executor_class, prefix: Text) -> Text:
+    module = executor_class.__module__.replace(".", _DOT)
+    return f"{prefix}{module}{_SEP}{executor_class.__name__}"
+
+
+def wrap(executor_class, mixin, prefix: Text, **attributes):
+    """The subclass of `executor_class` and `mixin`, registered in the module of `mixin`."""
+    namespace = vars(sys.modules[mixin.__module__])
+    name = wrapped_name(executor_class, prefix)
+    if name not in namespace:
+        namespace[name] = type(
+            name, (mixin, executor_class), dict(attributes, __module__=mixin.__module__)
+        )
+    return namespace[name]
+
+
+def _executor_class(encoded: Text):
+    """The class of `<module>___<class>`, with dots of the module encoded.
+
+    The class name may hold separators itself when it is a wrapped class, and
+    a module starting with an underscore does too: try each boundary in turn.
+    """
+    start = encoded.find(_SEP)
+    while start != -1:
+        module, class_name = encoded[:start], encoded[start + len(_SEP):]
+        try:
+            return getattr(importlib.import_module(module.replace(_DOT, ".")), class_name)
+        except (ImportError, AttributeError):
+            start = encoded.find(_SEP, start + 1)
+    raise(AttributeError(f"No executor class for {encoded!r}"))
+
+
+def module_getattr(module_name: Text, prefix: Text, wrapper: Callable) -> Callable:
+    """Module `__getattr__` recreating the classes `wrapper` named with `prefix`."""
+
+    def __getattr__(name: Text):
+        if not name.startswith(prefix) or _SEP not in name:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        return wrapper(_executor_class(name[len(prefix):]))
+
+    return __getattr__
+
+
+def set_executor_class(component, executor_class):
+    """Run `component` with `executor_class`, leaving its original spec untouched."""
+    spec = copy.copy(component.executor_spec)
+    spec.executor_class = executor_class
+    spec.executor_class_path = f"{executor_class.__module__}.{executor_class.__name__}"
+    component.executor_spec = spec
@@ -0,0 +1,70 @@
+"""Per-component import-time accounting for pipeline startup.
+
+Wrap the imports of a component in `track` to attribute their wall time to
+that component, similar to `python -X importtime` but grouped the way the
+pipeline is assembled. Nested blocks are reported exclusively, so the time
+spent importing a child component is not counted again in its parent.
+"""
+
+import sys
+import time
+import contextlib
+from typing import Optional, Text
+
+# component -> [exclusive seconds, newly loaded modules]
+_RECORDS = {}
+# [child seconds, child modules] of every block currently being tracked
+_STACK = []
+
+
+@contextlib.contextmanager
+def track(component: Text):
+    """Attribute the imports executed in this block to `component`."""
+    start, modules = time.perf_counter(), len(sys.modules)
+    _STACK.append([0.0, 0])
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        loaded = len(sys.modules) - modules
+        child_elapsed, child_loaded = _STACK.pop()
+        if _STACK:
+            _STACK[-1][0] += elapsed
+            _STACK[-1][1] += loaded
+        record = _RECORDS.setdefault(component, [0.0, 0])
+        record[0] += elapsed - child_elapsed
+        record[1] += loaded - child_loaded
+
+
+def total_seconds() -> float:
+    """Import time over all tracked components."""
+    return sum(seconds for seconds, _ in _RECORDS.values())
+
+
+def report() -> Text:
+    """Table of the tracked components, slowest first."""
+    lines = [f"{'component':<32} {'seconds':>8} {'modules':>8}"]
+    for component, (seconds, modules) in sorted(
+        _RECORDS.items(), key=lambda item: -item[1][0]
+    ):
+        lines.append(f"{component:<32} {seconds:>8.3f} {modules:>8d}")
+    lines.append(f"{'total':<32} {total_seconds():>8.3f} {sum(m for _, m in _RECORDS.values()):>8d}")
+    return "\n".join(lines)
+
+
+def check_budget(budget: Optional[float] = None):
+    """Raise if the tracked import time exceeds `budget` seconds."""
+    if budget is None:
+        return
+    if total_seconds() > budget:
+        raise(
+            RuntimeError(
+                f"Import time {total_seconds():.3f}s exceeds the startup budget "
+                f"of {budget:.3f}s:\n{report()}"
+            )
+        )
+
+
+def reset():
+    """Forget all tracked components."""
+    _RECORDS.clear()
@@ -0,0 +1,299 @@
+"""Run a pipeline locally, launching independent components in parallel.
+
+LocalDagRunner launches the components one after the other, so independent
+branches (e.g. ExampleValidator and Transform, or the model resolver and the
+Trainer) wait on each other. ParallelLocalDagRunner launches every component
+whose upstream components have finished in its own process, pinned to its own
+CPUs and capped in memory, as long as CPUs and worker slots are free.
+
+The memory cap applies to the resident memory (RSS) of the component process
+and of the processes it started (e.g. Beam workers), polled from /proc: a
+component going over it is killed.
+"""
+
+import os
+import time
+import signal
+import resource
+import collections
+import multiprocessing
+import multiprocessing.connection
+from absl import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Text, Tuple
+
+from utils import parallelism
+
+# Resources of a component without an explicit entry: (cpus, memory_gb)
+DEFAULT_RESOURCES = {"cpus": 1, "memory_gb": None}
+# Seconds between two checks of the memory of the running components
+MEMORY_POLL_SECONDS = 1.0
+
+
+def _available_cpus() -> List[int]:
+    """CPU ids to schedule on, as many as the container CPU quota allows."""
+    if hasattr(os, "sched_getaffinity"):
+        cpu_ids = sorted(os.sched_getaffinity(0))
+    else:
+        cpu_ids = list(range(os.cpu_count() or 1))
+    return cpu_ids[: parallelism.available_cpus()]
+
+
+def _run_node(target, args, node_id, cpu_ids):
+    """Child process entry point: pin the CPUs, then run the component."""
+    if cpu_ids and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_ids)
+    target(node_id, *args)
+
+
+def _process_tree(pid: int) -> List[int]:
+    """A process and all its descendants, from /proc (Linux only)."""
+    children = collections.defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as fid:
+                ppid = int(fid.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):  # exited meanwhile
+            continue
+        children[ppid].append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        tree.append(stack.pop())
+        stack.extend(children.get(tree[-1], ()))
+    return tree
+
+
+def _rss_bytes(pids: List[int]) -> int:
+    """Resident memory of the processes `pids`."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm", "r") as fid:
+                total += int(fid.read().split()[1]) * resource.getpagesize()
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class ParallelDagScheduler(object):
+    """Run the nodes of a DAG in child processes as soon as they are ready.
+
+    Each node gets `cpus` dedicated cores (set as its CPU affinity) and is
+    killed when its resident memory, child processes included, exceeds
+    `memory_gb`. A node is started only when all its
+    upstream nodes succeeded, fewer than `max_workers` nodes are running and
+    enough cores are free. After a failure no new node is started; the
+    running ones are waited for and the rest is reported as skipped.
+    """
+
+    def __init__(
+        self,
+        upstream: Dict[Text, Iterable[Text]],
+        max_workers: Optional[int] = None,
+        component_resources: Optional[Dict[Text, Dict]] = None,
+        default_resources: Optional[Dict] = None,
+        cpu_ids: Optional[Sequence[int]] = None,
+    ):
+        self._upstream = {node_id: set(nodes) for node_id, nodes in upstream.items()}
+        for node_id, nodes in self._upstream.items():
+            unknown = nodes - set(self._upstream)
+            if unknown:
+                raise(ValueError(f"{node_id} depends on unknown nodes {sorted(unknown)}"))
+        self._cpu_ids = list(cpu_ids) if cpu_ids is not None else _available_cpus()
+        self._max_workers = max_workers or len(self._cpu_ids)
+        self._component_resources = component_resources or {}
+        self._default_resources = dict(DEFAULT_RESOURCES, **(default_resources or {}))
+        # node_id -> (start, end) in seconds since the scheduler started
+        self.timings = {}
+
+    def resources(self, node_id: Text) -> Tuple[int, Optional[float]]:
+        """(cpus, memory_gb) of a node; never more cpus than available."""
+        spec = dict(self._default_resources, **self._component_resources.get(node_id, {}))
+        cpus = max(1, min(int(spec["cpus"]), len(self._cpu_ids)))
+        return cpus, spec.get("memory_gb")
+
+    def run(self, target: Callable, args: Tuple = ()):
+        """Call `target(node_id, *args)` for every node, each in a new process.
+
+        `target` must be picklable (a module level function), as processes
+        are spawned rather than forked.
+        """
+        context = multiprocessing.get_context("spawn")
+        pending = list(self._upstream)  # insertion order is the priority
+        free_cpus = list(self._cpu_ids)
+        done, failed, running, killed = set(), [], {}, set()
+        start = time.perf_counter()
+
+        while pending or running:
+            for node_id in list(pending) if not failed else []:
+                if len(running) >= self._max_workers:
+                    break
+                cpus, memory_gb = self.resources(node_id)
+                if not self._upstream[node_id] <= done or cpus > len(free_cpus):
+                    continue
+                cpu_ids, free_cpus = free_cpus[:cpus], free_cpus[cpus:]
+                memory_bytes = int(memory_gb * 1024 ** 3) if memory_gb else None
+                process = context.Process(
+                    target=_run_node,
+                    args=(target, args, node_id, cpu_ids),
+                    name=node_id,
+                )
+                process.start()
+                logging.info("Launched %s on cpus %s", node_id, cpu_ids)
+                self.timings[node_id] = (time.perf_counter() - start, None)
+                running[process.sentinel] = (node_id, process, cpu_ids, memory_bytes)
+                pending.remove(node_id)
+
+            if not running:
+                if failed:
+                    break
+                raise(ValueError(f"Cyclic dependencies between {pending}"))
+
+            limited = any(memory_bytes for _, _, _, memory_bytes in running.values())
+            ready = multiprocessing.connection.wait(
+                list(running), timeout=MEMORY_POLL_SECONDS if limited else None
+            )
+            for node_id, process, _, memory_bytes in running.values():
+                if not memory_bytes or node_id in killed:
+                    continue
+                tree = _process_tree(process.pid)
+                rss = _rss_bytes(tree)
+                if rss > memory_bytes:
+                    logging.error(
+                        "%s uses %.2f GB of memory, over its limit of %.2f GB: killing it",
+                        node_id,
+                        rss / 1024 ** 3,
+                        memory_bytes / 1024 ** 3,
+                    )
+                    killed.add(node_id)
+                    for pid in tree:
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+
+            for sentinel in ready:
+                node_id, process, cpu_ids, _ = running.pop(sentinel)
+                process.join()
+                free_cpus.extend(cpu_ids)
+                self.timings[node_id] = (self.timings[node_id][0], time.perf_counter() - start)
+                if process.exitcode == 0 and node_id not in killed:
+                    done.add(node_id)
+                else:
+                    logging.error("%s failed with exit code %s", node_id, process.exitcode)
+                    failed.append(node_id)
+
+        if failed:
+            raise(RuntimeError(f"Components {failed} failed; skipped {pending}"))
+
+
+def _executable_spec(node_id, spec):
+    """Unpacks the executor / driver spec of a node from the compiled pipeline."""
+    from tfx.proto.orchestration import executable_spec_pb2
+
+    for spec_class in (
+        executable_spec_pb2.PythonClassExecutableSpec,
+        executable_spec_pb2.ContainerExecutableSpec,
+    ):
+        if spec.Is(spec_class.DESCRIPTOR):
+            result = spec_class()
+            spec.Unpack(result)
+            return result
+    raise(ValueError(f"Unsupported executable spec {spec.type_url} for {node_id}"))
+
+
+def _launch_node(node_id, pipeline_bytes):
+    """Launch one node of a compiled pipeline, as the portable launcher does.
+
+    Components run their executor; system nodes (e.g. ResolverNode) have no
+    executor spec and are handled by the launcher itself.
+    """
+    from ml_metadata.proto import metadata_store_pb2
+    from tfx.orchestration import metadata
+    from tfx.orchestration.portable import launcher
+    from tfx.proto.orchestration import pipeline_pb2
+
+    pipeline = pipeline_pb2.Pipeline.FromString(pipeline_bytes)
+    deployment_config = pipeline_pb2.IntermediateDeploymentConfig()
+    if not pipeline.deployment_config.Unpack(deployment_config):
+        raise(ValueError(f"Unsupported deployment config {pipeline.deployment_config.type_url}"))
+    connection_config = metadata_store_pb2.ConnectionConfig()
+    deployment_config.metadata_connection_config.Unpack(connection_config)
+    node = next(
+        n.pipeline_node for n in pipeline.nodes if n.pipeline_node.node_info.id == node_id
+    )
+    executor_spec = deployment_config.executor_specs.get(node_id)
+    driver_spec = deployment_config.custom_driver_specs.get(node_id)
+    component_launcher = launcher.Launcher(
+        pipeline_node=node,
+        mlmd_connection=metadata.Metadata(connection_config),
+        pipeline_info=pipeline.pipeline_info,
+        pipeline_runtime_spec=pipeline.runtime_spec,
+        executor_spec=_executable_spec(node_id, executor_spec) if executor_spec else None,
+        custom_driver_spec=_executable_spec(node_id, driver_spec) if driver_spec else None,
+    )
+    logging.info("Component %s is running.", node_id)
+    component_launcher.launch()
+    logging.info("Component %s is finished.", node_id)
+
+
+class ParallelLocalDagRunner(object):
+    """Local runner scheduling ready components on a pool of processes.
+
+    A drop-in for LocalDagRunner: `ParallelLocalDagRunner(...).run(pipeline)`.
+    `component_resources` maps component ids (e.g. "Trainer") to
+    {"cpus": int, "memory_gb": float}; components without an entry use
+    `default_resources`.
+
+    Note that the metadata store is shared by the component processes; with
+    SQLite this relies on its file locking, which is fine for local runs.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        component_resources: Optional[Dict[Text, Dict]] = None,
+        default_resources: Optional[Dict] = None,
+    ):
+        self._max_workers = max_workers
+        self._component_resources = component_resources
+        self._default_resources = default_resources
+
+    def run(self, pipeline):
+        import datetime
+        from tfx.dsl.compiler import compiler
+        from tfx.dsl.compiler import constants
+        from tfx.orchestration.portable import runtime_parameter_utils
+
+        # For CLI, while creating or updating pipeline, pipeline_args are
+        # extracted and hence we avoid executing the pipeline.
+        if "TFX_JSON_EXPORT_PIPELINE_ARGS_PATH" in os.environ:
+            return
+
+        # Compile to the intermediate representation, as the portable runners do
+        pipeline = compiler.Compiler().compile(pipeline)
+        runtime_parameter_utils.substitute_runtime_parameter(
+            pipeline,
+            {constants.PIPELINE_RUN_ID_PARAMETER_NAME: datetime.datetime.now().isoformat()},
+        )
+
+        scheduler = ParallelDagScheduler(
+            {
+                node.pipeline_node.node_info.id: node.pipeline_node.upstream_nodes
+                for node in pipeline.nodes
+            },
+            max_workers=self._max_workers,
+            component_resources=self._component_resources,
+            default_resources=self._default_resources,
+        )
+        try:
+            scheduler.run(_launch_node, (pipeline.SerializeToString(),))
+        finally:
+            for node_id, (start, end) in scheduler.timings.items():
+                logging.info(
+                    "%s: started at %.1fs, %s",
+                    node_id,
+                    start,
+                    "unfinished" if end is None else f"took {end - start:.1f}s",
+                )
@@ -0,0 +1,112 @@
+"""One parallelism policy for Beam, tf.data and the TensorFlow runtime.
+
+Left alone, TensorFlow sizes its inter- and intra-op pools, tf.data its
+threads and Beam its workers from the number of cores of the host, not of
+the container, and all of them at once. `resolve` turns the
+`performance_configurations` of metadata.yaml (passed to the Trainer through
+`custom_config["performance_config"]`) into thread counts for the CPUs this
+process may actually use: its CPU affinity, capped by the cgroup CPU quota
+of the pod.
+"""
+
+import os
+import math
+from absl import logging
+from typing import Any, Dict, Optional, Text
+
+# cgroup v2 and v1 locations of the CPU quota
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota of the container in cores, None when unlimited."""
+    try:
+        with open(CGROUP_V2_CPU_MAX, "r") as fid:
+            quota, period = fid.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(CGROUP_V1_QUOTA, "r") as fid:
+            quota = int(fid.read())
+        with open(CGROUP_V1_PERIOD, "r") as fid:
+            period = int(fid.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, within the container CPU quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+def resolve(performance_config: Optional[Dict[Text, Any]] = None) -> Dict[Text, int]:
+    """Thread counts for this process; empty settings follow the CPUs."""
+    config = performance_config or {}
+    cpus = int(config.get("CPU_LIMIT") or available_cpus())
+    return {
+        "cpus": cpus,
+        "intra_op_threads": int(config.get("TF_INTRA_OP_THREADS") or cpus),
+        "inter_op_threads": int(config.get("TF_INTER_OP_THREADS") or min(2, cpus)),
+        "tf_data_threads": int(config.get("TF_DATA_THREADS") or cpus),
+    }
+
+
+def configure_tensorflow(policy: Dict[Text, int]):
+    """Size the TensorFlow runtime pools; must run before TF executes ops."""
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(policy["intra_op_threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(policy["inter_op_threads"])
+    except RuntimeError as e:  # the runtime was already initialized
+        logging.warning("Cannot apply the parallelism policy %s: %s", policy, e)
+        return
+    logging.info("Parallelism policy: %s", policy)
+
+
+def session_config(policy: Dict[Text, int]):
+    """tf.compat.v1.ConfigProto for estimators (RunConfig.session_config)."""
+    import tensorflow as tf
+
+    return tf.compat.v1.ConfigProto(
+        intra_op_parallelism_threads=policy["intra_op_threads"],
+        inter_op_parallelism_threads=policy["inter_op_threads"],
+    )
+
+
+def dataset_options(policy: Dict[Text, int]):
+    """tf.data options running the input pipeline on its own bounded pool."""
+    import tensorflow as tf
+
+    options = tf.data.Options()
+    options.experimental_threading.private_threadpool_size = policy["tf_data_threads"]
+    options.experimental_threading.max_intra_op_parallelism = 1
+    return options
+
+
+def worker_environment(policy: Dict[Text, int], num_workers: int) -> Dict[Text, Text]:
+    """Thread environment of `num_workers` processes sharing the CPUs.
+
+    Beam multi-processing workers inherit the environment, so exporting
+    these keeps each worker's TensorFlow / OpenMP pools to its share (see
+    `beam_utils.confine_worker_environment`).
+    """
+    threads = str(max(1, policy["cpus"] // max(1, num_workers)))
+    return {
+        "TF_NUM_INTRAOP_THREADS": threads,
+        "TF_NUM_INTEROP_THREADS": "1",
+        "OMP_NUM_THREADS": threads,
+    }
@@ -0,0 +1,276 @@
+"""Opt-in per-component performance tracing of pipeline runs.
+
+`instrument(components)` swaps the executor of every component for a traced
+subclass recording wall time, CPU time, peak RSS and bytes read / written of
+each execution. The traced class lives in this module under a name derived
+from the original executor path (see `__getattr__`), so it is importable by
+the local runners and by the container entrypoint on Kubeflow alike.
+
+Every execution writes one record to `<PIPELINE_ROOT>/perf_trace/records`,
+the pipeline root being recovered from its output artifact URIs
+(`<PIPELINE_ROOT>/<component>/<output>/<execution id>`). `write_report`
+merges the records into a Chrome / Perfetto trace (trace.json) and a summary
+table (summary.txt); on Kubeflow run it after the pipeline finished:
+
+    python -m utils.perf_trace <PIPELINE_ROOT>
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import resource
+from absl import logging
+from typing import Dict, List, Optional, Text
+
+from utils import executor_wrappers
+
+TRACE_DIR_NAME = "perf_trace"
+_PREFIX = "Traced__"
+
+
+def trace_dir(pipeline_root: Text) -> Text:
+    return os.path.join(pipeline_root, TRACE_DIR_NAME)
+
+
+def _proc_io() -> Dict[Text, int]:
+    """Bytes read / written by this process, from /proc (Linux only)."""
+    try:
+        with open("/proc/self/io", "r") as fid:
+            fields = dict(line.split(":") for line in fid)
+        return {"read": int(fields["rchar"]), "write": int(fields["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return {"read": 0, "write": 0}
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the peak RSS of this process so that it covers one execution."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fid:
+            fid.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _children_peak_rss() -> int:
+    """Largest peak RSS in bytes of the waited-for children, since process start."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+
+
+def _peak_rss(children_peak_start: int) -> int:
+    """Peak RSS in bytes of this process and of the children of this execution.
+
+    The children's peak is a maximum over the lifetime of this process, so it
+    counts only when it rose during the execution (`children_peak_start` being
+    its value at the start): a child of an earlier component may have set it.
+    """
+    peak = 0
+    try:
+        with open("/proc/self/status", "r") as fid:
+            for line in fid:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if not peak:
+        unit = 1 if sys.platform == "darwin" else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children_peak = _children_peak_rss()
+    return max(peak, children_peak) if children_peak > children_peak_start else peak
+
+
+def _cpu_seconds() -> float:
+    """User + system time of this process and its waited-for children."""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _first_uri(output_dict) -> Optional[Text]:
+    for artifacts in output_dict.values():
+        for artifact in artifacts:
+            if artifact.uri:
+                return artifact.uri
+    return None
+
+
+def _write_record(record: Dict, output_uri: Optional[Text]):
+    """Store the record of one execution; tracing never fails a run."""
+    if output_uri is None:
+        logging.warning("No output artifact to locate the trace of %s", record["component"])
+        return
+    try:
+        import tensorflow as tf
+
+        record_dir = os.path.join(trace_dir(record["pipeline_root"]), "records")
+        tf.io.gfile.makedirs(record_dir)
+        record_file = os.path.join(
+            record_dir, f"{record['component']}.{record['execution']}.{record['pid']}.json"
+        )
+        with tf.io.gfile.GFile(record_file, "w") as fid:
+            fid.write(json.dumps(record))
+    except Exception as e:  # pylint: disable=broad-except
+        logging.warning("Cannot write the trace of %s: %s", record["component"], e)
+
+
+class _TracedExecutor(object):
+    """Mixin timing `Do` of the executor it is combined with."""
+
+    def Do(self, input_dict, output_dict, exec_properties):
+        output_uri = _first_uri(output_dict)
+        parts = output_uri.rstrip("/").split("/") if output_uri else []
+        record = {
+            "component": parts[-3] if len(parts) >= 4 else type(self).__name__,
+            "execution": parts[-1] if parts else "0",
+            "pipeline_root": "/".join(parts[:-3]),
+            "executor": self._traced_executor_path,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "peak_rss_reset": _reset_peak_rss(),
+        }
+        io_start, cpu_start, children_peak = _proc_io(), _cpu_seconds(), _children_peak_rss()
+        record["start"], wall_start = time.time(), time.perf_counter()
+        try:
+            result = super(_TracedExecutor, self).Do(input_dict, output_dict, exec_properties)
+            record["status"] = "succeeded"
+            return result
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            io_end = _proc_io()
+            record.update(
+                {
+                    "wall_seconds": time.perf_counter() - wall_start,
+                    "cpu_seconds": _cpu_seconds() - cpu_start,
+                    "peak_rss_bytes": _peak_rss(children_peak),
+                    "read_bytes": io_end["read"] - io_start["read"],
+                    "write_bytes": io_end["write"] - io_start["write"],
+                }
+            )
+            _write_record(record, output_uri)
+
+
+def traced(executor_class):
+    """The traced subclass of `executor_class`, registered in this module."""
+    return executor_wrappers.wrap(
+        executor_class,
+        _TracedExecutor,
+        _PREFIX,
+        _traced_executor_path=f"{executor_class.__module__}.{executor_class.__name__}",
+    )
+
+
+# Recreate traced executor classes on import, e.g. inside a container
+__getattr__ = executor_wrappers.module_getattr(__name__, _PREFIX, traced)
+
+
+def instrument(components: List):
+    """Trace the executors of `components`, in place.
+
+    Components running a container image or without an executor class (e.g.
+    ResolverNode) are left alone.
+    """
+    for component in components:
+        spec = getattr(component, "executor_spec", None)
+        executor_class = getattr(spec, "executor_class", None)
+        if executor_class is None or issubclass(executor_class, _TracedExecutor):
+            continue
+        executor_wrappers.set_executor_class(component, traced(executor_class))
+
+
+def load_records(pipeline_root: Text) -> List[Dict]:
+    """All execution records of the pipeline, in start order."""
+    import tensorflow as tf
+
+    records = []
+    pattern = os.path.join(trace_dir(pipeline_root), "records", "*.json")
+    for record_file in tf.io.gfile.glob(pattern):
+        with tf.io.gfile.GFile(record_file, "r") as fid:
+            records.append(json.loads(fid.read()))
+    return sorted(records, key=lambda record: record["start"])
+
+
+def chrome_trace(records: List[Dict]) -> Dict:
+    """Chrome trace event format: one track per component."""
+    events, tracks = [], {}
+    for record in records:
+        tid = tracks.setdefault(record["component"], len(tracks) + 1)
+        events.append(
+            {
+                "name": record["component"],
+                "cat": record["status"],
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["wall_seconds"] * 1e6,
+                "pid": 1,
+                "tid": tid,
+                "args": {
+                    k: record[k]
+                    for k in (
+                        "execution", "executor", "host", "cpu_seconds",
+                        "peak_rss_bytes", "read_bytes", "write_bytes",
+                    )
+                },
+            }
+        )
+    for component, tid in tracks.items():
+        events.append(
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": component}}
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def summary(records: List[Dict]) -> Text:
+    """Table of the executions, slowest first."""
+    mb = 1024 ** 2
+    lines = [
+        f"{'component':<24} {'execution':>9} {'status':>9} {'wall s':>8} {'cpu s':>8} "
+        f"{'cpu %':>6} {'peak MB':>8} {'read MB':>8} {'write MB':>8}"
+    ]
+    for r in sorted(records, key=lambda record: -record["wall_seconds"]):
+        utilization = 100 * r["cpu_seconds"] / r["wall_seconds"] if r["wall_seconds"] else 0.0
+        lines.append(
+            f"{r['component']:<24} {r['execution']:>9} {r['status']:>9} "
+            f"{r['wall_seconds']:>8.1f} {r['cpu_seconds']:>8.1f} {utilization:>6.0f} "
+            f"{r['peak_rss_bytes'] / mb:>8.0f} {r['read_bytes'] / mb:>8.1f} "
+            f"{r['write_bytes'] / mb:>8.1f}"
+        )
+    lines.append(
+        f"{'total':<24} {len(records):>9} {'':>9} "
+        f"{sum(r['wall_seconds'] for r in records):>8.1f} "
+        f"{sum(r['cpu_seconds'] for r in records):>8.1f}"
+    )
+    return "\n".join(lines)
+
+
+def write_report(pipeline_root: Text) -> Optional[Text]:
+    """Write trace.json and summary.txt of the recorded executions."""
+    import tensorflow as tf
+
+    records = load_records(pipeline_root)
+    if not records:
+        logging.warning("No performance records under %s", trace_dir(pipeline_root))
+        return None
+    with tf.io.gfile.GFile(os.path.join(trace_dir(pipeline_root), "trace.json"), "w") as fid:
+        fid.write(json.dumps(chrome_trace(records)))
+    table = summary(records)
+    with tf.io.gfile.GFile(os.path.join(trace_dir(pipeline_root), "summary.txt"), "w") as fid:
+        fid.write(table + "\n")
+    logging.info("Performance summary (%s):\n%s", trace_dir(pipeline_root), table)
+    return table
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge the performance records of a run.")
+    parser.add_argument("pipeline_root", help="PIPELINE_ROOT of the traced pipeline")
+    logging.set_verbosity(logging.INFO)
+    write_report(parser.parse_args().pipeline_root)